@@ -0,0 +1,140 @@
+"""
+Atlas Upstream Circuit Breakers
+One breaker per model upstream (Brev NIM, NVIDIA hosted API) plus a
+background prober that checks each upstream the way test_brev_server.py
+does by hand.
+
+- CLOSED: traffic flows; consecutive failures or slow calls are counted
+- OPEN: upstream is skipped (callers fail over right away) until a probe
+  succeeds or reset_timeout passes; a breaker opened by slow calls is only
+  closed by a probe completion that is itself under latency_threshold
+- HALF_OPEN: after reset_timeout, live traffic is let through again; the
+  first success closes the breaker, the first failure re-opens it
+
+So a Brev outage costs one timeout, not one per request.
+"""
+
+import os
+import threading
+import time
+
+
+FAILURE_THRESHOLD = int(os.environ.get('BREAKER_FAILURE_THRESHOLD', 3))
+LATENCY_THRESHOLD = float(os.environ.get('BREAKER_LATENCY_THRESHOLD', 20))  # seconds
+RESET_TIMEOUT = float(os.environ.get('BREAKER_RESET_TIMEOUT', 30))  # seconds
+PROBE_INTERVAL = float(os.environ.get('HEALTH_PROBE_INTERVAL', 15))  # seconds, 0 = off
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker for one upstream"""
+
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD,
+                 latency_threshold=LATENCY_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.latency_threshold = latency_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0
+        self.times_opened = 0
+        self.rejected = 0
+        self.last_error = None
+        self.last_probe = None
+        self.slow = False         # last failure was a slow answer, not an error
+
+    def allow_request(self):
+        """True if traffic may go to this upstream now"""
+        with self.lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                print(f"[BREAKER] {self.name}: half-open, letting traffic through")
+            if self.state == OPEN:
+                self.rejected += 1
+                return False
+            return True
+
+    def record_success(self, latency=0):
+        """Successful call; a slow success still counts against the upstream"""
+        if latency > self.latency_threshold:
+            self.record_failure(f"slow response ({latency:.1f}s)", slow=True)
+            return
+        with self.lock:
+            if self.state != CLOSED:
+                print(f"[BREAKER] {self.name}: closed (upstream healthy)")
+            self.state = CLOSED
+            self.consecutive_failures = 0
+
+    def record_failure(self, error, slow=False):
+        with self.lock:
+            self.consecutive_failures += 1
+            self.last_error = str(error)
+            self.slow = slow
+            tripped = self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold
+            if tripped and self.state != OPEN:
+                self.state = OPEN
+                self.times_opened += 1
+                print(f"[BREAKER] {self.name}: OPEN after {self.consecutive_failures} failures ({error})")
+            if self.state == OPEN:
+                self.opened_at = time.monotonic()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'times_opened': self.times_opened,
+                'rejected': self.rejected,
+                'last_error': self.last_error,
+                'last_probe': self.last_probe
+            }
+
+
+class HealthProber:
+    """
+    Background thread that probes every upstream each interval
+    probes: {name: (breaker, probe_fn)} where probe_fn(completion) -> True when healthy
+    completion=True while the breaker is open for slowness: the probe then
+    has to run a (short) completion, whose latency is held to the breaker's
+    latency_threshold like live traffic, instead of only reaching the server
+    """
+
+    def __init__(self, probes, interval=PROBE_INTERVAL):
+        self.probes = probes
+        self.interval = interval
+        self.thread = None
+
+    def start(self):
+        if self.interval <= 0 or self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self._run, name='atlas-health-probes', daemon=True)
+        self.thread.start()
+        print(f"[BREAKER] Health probes every {self.interval:.0f}s for {', '.join(self.probes)}")
+
+    def probe_once(self):
+        for name, (breaker, probe_fn) in self.probes.items():
+            with breaker.lock:
+                completion = breaker.state != CLOSED and breaker.slow
+            started = time.monotonic()
+            try:
+                healthy = probe_fn(completion)
+                error = None if healthy else 'probe reported unhealthy'
+            except Exception as e:
+                healthy = False
+                error = e
+            with breaker.lock:
+                breaker.last_probe = 'healthy' if healthy else 'unhealthy'
+            if healthy:
+                breaker.record_success(time.monotonic() - started)
+            else:
+                breaker.record_failure(error, slow=completion)
+
+    def _run(self):
+        while True:
+            self.probe_once()
+            time.sleep(self.interval)
@@ -0,0 +1,201 @@
+"""
+Atlas Context Budgeting
+Token-aware history truncation for agent prompts, replacing fixed character
+cuts and fixed message windows:
+
+- count_tokens counts with the target model's tokenizer (HuggingFace
+  `tokenizers`) and falls back to a conservative estimate when it isn't
+  installed, can't be loaded, or is still loading: tokenizers load in a
+  background thread (preload at startup), never on a request
+- fit_newest fills a token budget from the newest message backwards, so
+  prefill cost is bounded whatever the history length and the most recent
+  turns are the last thing dropped
+- history and prompt tokens actually sent are counted per agent for /metrics
+"""
+
+import os
+import re
+import threading
+from functools import lru_cache
+
+try:
+    from tokenizers import Tokenizer
+except ImportError:
+    Tokenizer = None
+
+
+# HuggingFace repo or local tokenizer.json per model; unset models use the estimate.
+# Llama 3.1: an ungated copy of Meta's tokenizer (meta-llama/* needs HF_TOKEN).
+# Nemotron-4 only publishes a NeMo SentencePiece model: point TOKENIZER_NEMOTRON
+# at a converted tokenizer.json to count it exactly.
+TOKENIZER_SOURCES = {
+    'meta/llama-3.1-8b-instruct': os.environ.get('TOKENIZER_LLAMA', 'unsloth/Meta-Llama-3.1-8B-Instruct'),
+    'nvidia/nemotron-4-340b-instruct': os.environ.get('TOKENIZER_NEMOTRON', ''),
+}
+HF_TOKEN = os.environ.get('HF_TOKEN') or None
+
+CONTEXT_DEFAULT_BUDGET = int(os.environ.get('CONTEXT_DEFAULT_BUDGET', 1500))  # tokens
+
+# Chat template overhead per message (role header / separators)
+MESSAGE_OVERHEAD = 4
+
+
+# ============================================================================
+# TOKEN COUNTING
+# ============================================================================
+
+_tokenizers = {}      # model -> Tokenizer, or None (estimate) once its load has finished / failed
+_loading = set()
+_tokenizers_lock = threading.Lock()
+
+_PIECES = re.compile(r"\w+|[^\w\s]")
+
+
+def _load(models):
+    for model in models:
+        source = TOKENIZER_SOURCES[model]
+        loaded = None
+        try:
+            if os.path.exists(source):
+                loaded = Tokenizer.from_file(source)
+            else:
+                loaded = Tokenizer.from_pretrained(source, 'main', HF_TOKEN)  # (identifier, revision, token)
+            print(f"[CONTEXT] Loaded tokenizer for {model}")
+        except Exception as e:
+            print(f"[CONTEXT] No tokenizer for {model} ({e}), estimating token counts")
+        with _tokenizers_lock:
+            _tokenizers[model] = loaded
+            _loading.discard(model)
+        if loaded is not None:
+            # Counts cached while the estimate stood in
+            count_tokens.cache_clear()
+
+
+def preload(models):
+    """Start loading the models' tokenizers in a background thread (call at startup)"""
+    with _tokenizers_lock:
+        pending = []
+        for model in dict.fromkeys(models):
+            if model in _tokenizers or model in _loading:
+                continue
+            if Tokenizer is None or not TOKENIZER_SOURCES.get(model):
+                _tokenizers[model] = None
+                continue
+            _loading.add(model)
+            pending.append(model)
+    if pending:
+        threading.Thread(target=_load, args=(pending,), name='atlas-tokenizers', daemon=True).start()
+
+
+def tokenizer(model):
+    """The model's tokenizer, or None to use the estimate; never waits for a load"""
+    with _tokenizers_lock:
+        if model in _tokenizers:
+            return _tokenizers[model]
+    preload((model,))
+    return None
+
+
+def estimate_tokens(text):
+    """
+    Upper-leaning token estimate for BPE vocabularies: one token per short
+    word or punctuation mark, more for long words and non-ASCII (emoji)
+    """
+    count = 0
+    for piece in _PIECES.findall(text):
+        if piece.isascii():
+            count += 1 + len(piece) // 6
+        else:
+            count += 1 + len(piece.encode('utf-8')) // 2
+    return count
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text, model):
+    if not text:
+        return 0
+    tok = tokenizer(model)
+    if tok is None:
+        return estimate_tokens(text)
+    return len(tok.encode(text, add_special_tokens=False).ids)
+
+
+def count_messages(messages, model):
+    """Prompt tokens of a chat completion's messages"""
+    return sum(count_tokens(m.get('content') or '', model) + MESSAGE_OVERHEAD for m in messages)
+
+
+# ============================================================================
+# BUDGETING
+# ============================================================================
+
+def fit_newest(lines, budget, model):
+    """
+    Longest run of the newest lines that fits in budget tokens
+    Returns (kept lines oldest -> newest, tokens used). A newest line that
+    alone exceeds the budget is cut down rather than dropped.
+    """
+    kept = []
+    used = 0
+    for line in reversed(lines):
+        cost = count_tokens(line, model) + 1  # + the joining newline
+        if used + cost > budget:
+            if not kept and budget > 0:
+                cut = line[:max(1, len(line) * budget // cost)]
+                kept.append(cut)
+                used = count_tokens(cut, model) + 1
+            break
+        kept.append(line)
+        used += cost
+    kept.reverse()
+    return kept, used
+
+
+# ============================================================================
+# STATS
+# ============================================================================
+
+_stats_lock = threading.Lock()
+_stats = {}  # agent -> counters
+
+
+def _counters(agent):
+    return _stats.setdefault(agent, {
+        'budgeted': 0, 'history_tokens': 0, 'messages_kept': 0, 'messages_dropped': 0,
+        'calls': 0, 'prompt_tokens': 0, 'max_prompt_tokens': 0
+    })
+
+
+def record_history(agent, tokens, kept, dropped):
+    with _stats_lock:
+        counters = _counters(agent)
+        counters['budgeted'] += 1
+        counters['history_tokens'] += tokens
+        counters['messages_kept'] += kept
+        counters['messages_dropped'] += dropped
+
+
+def record_prompt(agent, tokens):
+    """Prompt tokens of a request actually sent upstream"""
+    with _stats_lock:
+        counters = _counters(agent)
+        counters['calls'] += 1
+        counters['prompt_tokens'] += tokens
+        counters['max_prompt_tokens'] = max(counters['max_prompt_tokens'], tokens)
+
+
+def stats():
+    with _stats_lock:
+        snapshot = {agent: dict(counters) for agent, counters in _stats.items()}
+    for counters in snapshot.values():
+        counters['avg_history_tokens'] = (
+            round(counters['history_tokens'] / counters['budgeted']) if counters['budgeted'] else None
+        )
+        counters['avg_prompt_tokens'] = round(counters['prompt_tokens'] / counters['calls']) if counters['calls'] else None
+    with _tokenizers_lock:
+        tokenizers = {model: 'exact' if tok is not None else 'estimate' for model, tok in _tokenizers.items()}
+        tokenizers.update(dict.fromkeys(_loading, 'loading'))
+    return {
+        'tokenizers': tokenizers,
+        'agents': snapshot
+    }
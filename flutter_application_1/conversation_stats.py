@@ -0,0 +1,191 @@
+"""
+Atlas Conversation Stats
+The countable part of conversation insights, computed from the transcript
+columns instead of asked of the model:
+
+- messages, length distribution, emoji and question rates per side
+- reply latency percentiles per side (a reply = the first message after
+  the other side's)
+- sessions: runs of messages without a gap over SESSION_GAP_MINUTES, who
+  starts them, how long they last
+- active hour-of-day and weekday histograms (server local time)
+
+Each conversation is computed once per version: stored conversations by
+(conversation_id, cursor), inline ones by a hash of their content. The
+insights agent sends the model these numbers instead of the raw log.
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+SESSION_GAP_MINUTES = int(os.environ.get('SESSION_GAP_MINUTES', 120))
+CONVERSATION_STATS_CACHE_SIZE = int(os.environ.get('CONVERSATION_STATS_CACHE_SIZE', 10000))
+MAX_REPLY_HOURS = 168     # longer gaps start a new conversation rather than answer
+
+EMOJI = re.compile("[\U0001F300-\U0001FAFF\u2600-\u27BF\U0001F1E6-\U0001F1FF]")
+WEEKDAY_NAMES = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+SIDES = (('user', 1), ('contact', 0))
+
+
+def _percentiles(values):
+    if not len(values):
+        return None
+    p50, p90 = np.percentile(values, [50, 90])
+    return {'p50': round(float(p50), 2), 'p90': round(float(p90), 2), 'mean': round(float(values.mean()), 2)}
+
+
+def compute(transcript):
+    """Stats of one transcript (see module docstring for what is in it)"""
+    n = len(transcript)
+    texts = transcript.texts
+    is_user = np.frombuffer(transcript.is_user, dtype=np.uint8).astype(bool)
+    times = np.frombuffer(transcript.times, dtype=np.float64)
+    lengths = np.fromiter((len(t) for t in texts), dtype=np.int64, count=n)
+    emojis = np.fromiter((len(EMOJI.findall(t)) for t in texts), dtype=np.int64, count=n)
+    questions = np.fromiter(('?' in t for t in texts), dtype=bool, count=n)
+
+    sides = {}
+    for side, flag in SIDES:
+        mine = is_user == bool(flag)
+        count = int(mine.sum())
+        side_lengths = lengths[mine]
+        sides[side] = {
+            'messages': count,
+            'share': round(count / n, 3) if n else 0.0,
+            'length': {
+                'mean': round(float(side_lengths.mean()), 1),
+                'p50': float(np.median(side_lengths)),
+                'p90': float(np.percentile(side_lengths, 90)),
+            } if count else None,
+            'emoji_rate': round(float((emojis[mine] > 0).mean()), 3) if count else 0.0,
+            'emojis_per_message': round(float(emojis[mine].mean()), 2) if count else 0.0,
+            'question_rate': round(float(questions[mine].mean()), 3) if count else 0.0,
+        }
+
+    result = {'messages': n, 'sides': sides, 'timed_messages': 0, 'reply_hours': None,
+              'sessions': None, 'active_hours': None, 'active_weekdays': None}
+
+    dated = ~np.isnan(times)
+    if dated.sum() < 2:
+        return result
+    t, user = times[dated], is_user[dated]
+    order = np.argsort(t, kind='stable')
+    t, user = t[order], user[order]
+    result['timed_messages'] = int(len(t))
+
+    gaps = np.diff(t)
+    switched = user[1:] != user[:-1]
+    reply_hours = gaps / 3600
+    replies = switched & (reply_hours >= 0) & (reply_hours < MAX_REPLY_HOURS)
+    result['reply_hours'] = {
+        side: _percentiles(reply_hours[replies & (user[1:] == bool(flag))]) for side, flag in SIDES
+    }
+
+    # Sessions: a new one starts after a gap over SESSION_GAP_MINUTES
+    starts = np.concatenate(([0], np.flatnonzero(gaps > SESSION_GAP_MINUTES * 60) + 1))
+    ends = np.concatenate((starts[1:], [len(t)]))
+    sizes = ends - starts
+    durations = (t[ends - 1] - t[starts]) / 60
+    started_by_user = user[starts]
+    result['sessions'] = {
+        'count': int(len(starts)),
+        'messages_mean': round(float(sizes.mean()), 1),
+        'duration_minutes_p50': round(float(np.median(durations)), 1),
+        'started_by_user_share': round(float(started_by_user.mean()), 3),
+        'gap_minutes': SESSION_GAP_MINUTES,
+    }
+
+    local = t + time.localtime().tm_gmtoff
+    hours = np.bincount(((local // 3600) % 24).astype(np.int64), minlength=24)
+    weekdays = np.bincount((((local // 86400) + 3) % 7).astype(np.int64), minlength=7)  # epoch day 0 = Thursday
+    result['active_hours'] = {
+        'histogram': hours.tolist(),
+        'peak': [int(h) for h in np.argsort(-hours, kind='stable')[:3] if hours[h]],
+    }
+    result['active_weekdays'] = {
+        'histogram': dict(zip(WEEKDAY_NAMES, weekdays.tolist())),
+        'peak': WEEKDAY_NAMES[int(weekdays.argmax())],
+    }
+    return result
+
+
+def describe(stats, contact_name):
+    """Compact text of the stats for a prompt"""
+    lines = [f"Messages: {stats['messages']}"]
+    for side, label in (('user', 'User'), ('contact', contact_name)):
+        s = stats['sides'][side]
+        if not s['messages']:
+            lines.append(f"{label}: no messages")
+            continue
+        lines.append(
+            f"{label}: {s['messages']} messages ({s['share']:.0%}), length median {s['length']['p50']:.0f} "
+            f"chars (p90 {s['length']['p90']:.0f}), emoji in {s['emoji_rate']:.0%}, questions in {s['question_rate']:.0%}"
+        )
+    if stats['reply_hours']:
+        for side, label in (('user', 'User'), ('contact', contact_name)):
+            r = stats['reply_hours'][side]
+            if r:
+                lines.append(f"{label} replies after: median {r['p50']:.1f}h, p90 {r['p90']:.1f}h")
+    if stats['sessions']:
+        s = stats['sessions']
+        lines.append(
+            f"Sessions (gap > {s['gap_minutes']} min): {s['count']}, {s['messages_mean']:.1f} messages each, "
+            f"median {s['duration_minutes_p50']:.0f} min, {s['started_by_user_share']:.0%} started by User"
+        )
+        lines.append(f"Most active hours: {', '.join(f'{h}:00' for h in stats['active_hours']['peak'])}; "
+                     f"busiest day: {stats['active_weekdays']['peak']}")
+    return '\n'.join(lines)
+
+
+class ConversationStats:
+    """compute() behind an LRU keyed by conversation version"""
+
+    def __init__(self, max_size=CONVERSATION_STATS_CACHE_SIZE):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()
+        self.counters = {'hits': 0, 'misses': 0}
+
+    @staticmethod
+    def key(transcript, conversation_id=None, version=None):
+        if conversation_id is not None and version is not None:
+            return ('conversation', str(conversation_id), version)
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(transcript.is_user)
+        digest.update(transcript.times.tobytes())
+        for text in transcript.texts:
+            digest.update(text.encode('utf-8'))
+            digest.update(b'\0')
+        return ('content', digest.digest())
+
+    def get(self, transcript, conversation_id=None, version=None):
+        key = self.key(transcript, conversation_id, version)
+        with self.lock:
+            stats = self.cache.get(key)
+            if stats is not None:
+                self.cache.move_to_end(key)
+                self.counters['hits'] += 1
+                return stats
+            self.counters['misses'] += 1
+        stats = compute(transcript)
+        with self.lock:
+            self.cache[key] = stats
+            while len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+        return stats
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+            counters['cached'] = len(self.cache)
+        return counters
+
+
+engine = ConversationStats()
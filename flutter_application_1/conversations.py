@@ -0,0 +1,250 @@
+"""
+Atlas Conversation Store
+Server-side, append-only message log per conversation, so clients upload
+only the messages added since their last sync instead of the whole history
+on every agent call:
+
+- append(): new messages after the client's cursor; message ids make
+  retries idempotent, and a cursor behind the server skips what is
+  already stored; without a cursor, id-less messages that repeat the end
+  of the stored log (by timestamp, sender and text) are taken as resent
+- agents get {conversation_id} and read the stored conversation
+- cursor (= message count) doubles as the conversation's version
+
+Kept in memory (LRU by conversation); set CONVERSATION_STORE_PATH to a
+SQLite file to keep logs across restarts and evictions. Without it, a
+client whose cursor is ahead of the server (restart) gets CursorAhead and
+re-uploads from the server's cursor.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from transcript import USER_SENDERS
+
+
+CONVERSATION_MAX_IN_MEMORY = int(os.environ.get('CONVERSATION_MAX_IN_MEMORY', 1000))
+
+# Set to a file path (e.g. /tmp/atlas_conversations.db) to persist across restarts
+CONVERSATION_STORE_PATH = os.environ.get('CONVERSATION_STORE_PATH', '')
+
+
+class CursorAhead(Exception):
+    """The client claims more messages than the server has; resend from .cursor"""
+
+    def __init__(self, cursor):
+        super().__init__(f"server has {cursor} messages")
+        self.cursor = cursor
+
+
+def seq_id(seq):
+    """Id of a message the client sent without one; never compared with client ids"""
+    return f"seq:{seq}"
+
+
+def client_id(message):
+    """The client's id of a stored message, None if it came without one"""
+    return None if message['id'] == seq_id(message['seq']) else message['id']
+
+
+def normalize_message(msg, seq):
+    """Stored shape of an uploaded message (client id kept, else seq_id(seq))"""
+    is_user = msg.get('isUser')
+    if is_user is None:
+        is_user = msg.get('sender') in USER_SENDERS
+    message = {
+        'id': str(msg['id']) if msg.get('id') is not None else seq_id(seq),
+        'seq': seq,
+        'text': msg.get('text', ''),
+        'isUser': bool(is_user),
+        'timestamp': msg.get('timestamp'),
+    }
+    if msg.get('sender'):
+        message['sender'] = msg['sender']
+    return message
+
+
+def message_digest(message):
+    """Identity of a message for resend detection: its client id, else (timestamp, sender, text)"""
+    if client_id(message) is not None:
+        return message['id']
+    sender = message.get('sender') or ('user' if message['isUser'] else 'contact')
+    key = json.dumps([message.get('timestamp'), sender, message['text']], ensure_ascii=False, default=str)
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+
+
+def resent_count(stored, uploaded):
+    """Length of the longest run at the end of stored that uploaded starts with"""
+    stored = [message_digest(m) for m in stored[-len(uploaded):]] if uploaded else []
+    uploaded = [message_digest(m) for m in uploaded[:len(stored)]]
+    for k in range(len(stored), 0, -1):
+        if stored[-k:] == uploaded[:k]:
+            return k
+    return 0
+
+
+class Conversation:
+    """One conversation's log; messages are only ever appended"""
+
+    def __init__(self, conversation_id, contact_name='', messages=()):
+        self.id = conversation_id
+        self.contact_name = contact_name
+        self.messages = list(messages)
+        self.ids = {client_id(m) for m in self.messages} - {None}
+        self.lock = threading.Lock()
+
+    @property
+    def cursor(self):
+        return len(self.messages)
+
+    def since(self, cursor=0):
+        return self.messages[cursor:self.cursor]
+
+
+# ============================================================================
+# PERSISTENT BACKEND
+# ============================================================================
+
+class SqliteBackend:
+    """Write-through log behind the memory LRU"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            "conversation_id TEXT PRIMARY KEY, contact_name TEXT NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversation_messages ("
+            "conversation_id TEXT NOT NULL, seq INTEGER NOT NULL, message TEXT NOT NULL, "
+            "PRIMARY KEY (conversation_id, seq))"
+        )
+        self.conn.commit()
+
+    def load(self, conversation_id):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT contact_name FROM conversations WHERE conversation_id = ?", (conversation_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            rows = self.conn.execute(
+                "SELECT message FROM conversation_messages WHERE conversation_id = ? ORDER BY seq",
+                (conversation_id,)
+            ).fetchall()
+        return Conversation(conversation_id, row[0], [json.loads(r[0]) for r in rows])
+
+    def append(self, conversation, messages):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO conversations (conversation_id, contact_name) VALUES (?, ?)",
+                (conversation.id, conversation.contact_name)
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO conversation_messages (conversation_id, seq, message) VALUES (?, ?, ?)",
+                [(conversation.id, m['seq'], json.dumps(m, ensure_ascii=False)) for m in messages]
+            )
+            self.conn.commit()
+
+
+# ============================================================================
+# STORE
+# ============================================================================
+
+class ConversationStore:
+    """Thread-safe conversation logs, LRU in memory with optional SQLite"""
+
+    def __init__(self, max_in_memory=CONVERSATION_MAX_IN_MEMORY, backend=None):
+        self.max_in_memory = max_in_memory
+        self.backend = backend
+        self.lock = threading.Lock()
+        self.conversations = OrderedDict()
+        self.counters = {'appends': 0, 'messages_appended': 0, 'duplicates': 0, 'cursor_ahead': 0}
+
+    def get(self, conversation_id):
+        """The stored conversation, or None"""
+        with self.lock:
+            conversation = self.conversations.get(conversation_id)
+            if conversation is not None:
+                self.conversations.move_to_end(conversation_id)
+                return conversation
+        conversation = self.backend.load(conversation_id) if self.backend else None
+        if conversation is not None:
+            conversation = self._keep(conversation)
+        return conversation
+
+    def _keep(self, conversation):
+        with self.lock:
+            # Another thread may have loaded / created it meanwhile
+            conversation = self.conversations.setdefault(conversation.id, conversation)
+            self.conversations.move_to_end(conversation.id)
+            while len(self.conversations) > self.max_in_memory:
+                self.conversations.popitem(last=False)
+            return conversation
+
+    def append(self, conversation_id, messages, cursor=None, contact_name=''):
+        """
+        Append the messages a client has added since cursor (its last known
+        server cursor; None = trust message ids only)
+        Returns {cursor, appended, duplicates}; raises CursorAhead
+        """
+        conversation = self.get(conversation_id) or self._keep(Conversation(conversation_id, contact_name))
+        with conversation.lock:
+            if cursor is not None and cursor > conversation.cursor:
+                with self.lock:
+                    self.counters['cursor_ahead'] += 1
+                raise CursorAhead(conversation.cursor)
+
+            uploaded = [normalize_message(msg, conversation.cursor + i) for i, msg in enumerate(messages)]
+            if cursor is not None:
+                # An earlier upload from this cursor was stored but its answer lost
+                already_stored = conversation.cursor - cursor
+            else:
+                # No cursor: only a repeat of the log's end counts as resent
+                already_stored = resent_count(conversation.messages, uploaded)
+            new = []
+            for message in uploaded[already_stored:]:
+                identity = client_id(message)
+                if identity in conversation.ids:
+                    continue
+                message['seq'] = conversation.cursor + len(new)
+                if identity is None:
+                    message['id'] = seq_id(message['seq'])
+                else:
+                    conversation.ids.add(identity)
+                new.append(message)
+
+            if contact_name:
+                conversation.contact_name = contact_name
+            if self.backend and new:
+                self.backend.append(conversation, new)
+            conversation.messages.extend(new)
+            result = {
+                'cursor': conversation.cursor,
+                'appended': len(new),
+                'duplicates': len(messages) - len(new)
+            }
+
+        with self.lock:
+            self.counters['appends'] += 1
+            self.counters['messages_appended'] += result['appended']
+            self.counters['duplicates'] += result['duplicates']
+        return result
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+            counters['in_memory'] = len(self.conversations)
+        counters['persistent'] = self.backend is not None
+        return counters
+
+
+conversation_store = ConversationStore(
+    backend=SqliteBackend(CONVERSATION_STORE_PATH) if CONVERSATION_STORE_PATH else None
+)
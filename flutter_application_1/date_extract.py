@@ -0,0 +1,316 @@
+"""
+Atlas Date Extraction
+Local pre-filter for the key dates agent: finds date and time expressions
+in a conversation and resolves them to calendar dates, so
+
+- conversations without any date mention skip the model entirely
+- the model only classifies the sentences that mention a date, with the
+  dates already resolved, instead of doing calendar arithmetic itself
+- if the model is unavailable, the resolved candidates still make a usable
+  answer
+
+Expressions: absolute dates (March 15th, 15 March 2026, 3/15, 2026-03-15),
+weekdays (Friday, next Friday, last Friday), relative days (today,
+tomorrow, in 3 weeks, 2 days ago, next month, this weekend), months (in
+June) and event words (birthday, anniversary, wedding...). Relative
+expressions are resolved against the message's own date when it has a
+timestamp, otherwise against today.
+"""
+
+import calendar
+import re
+import threading
+from datetime import date, datetime, timedelta
+
+
+MONTHS = {name.lower(): i for i, name in enumerate(calendar.month_name) if name}
+MONTHS.update({name.lower(): i for i, name in enumerate(calendar.month_abbr) if name})
+MONTHS['sept'] = 9
+# Full names only: 'sun', 'sat', 'wed' are ordinary words
+WEEKDAYS = {name.lower(): i for i, name in enumerate(calendar.day_name)}
+WEEKDAYS.update({'tues': 1, 'thurs': 3})
+
+NUMBER_WORDS = {
+    'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6,
+    'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10, 'eleven': 11, 'twelve': 12,
+    'a couple of': 2, 'a couple': 2, 'couple of': 2, 'a few': 3, 'few': 3,
+}
+
+# Event words -> key date type (first match wins)
+EVENT_TYPES = [
+    (re.compile(r"\b(birthday|bday|b-day|turns? \d+)\b", re.I), 'birthday'),
+    (re.compile(r"\banniversary\b", re.I), 'anniversary'),
+    (re.compile(r"\b(graduat\w*|commencement)\b", re.I), 'graduation'),
+    (re.compile(r"\b(wedding|getting married|engaged)\b", re.I), 'wedding'),
+    (re.compile(r"\b(trip|vacation|holiday|flight|flying|travel\w*)\b", re.I), 'trip'),
+    (re.compile(r"\b(meeting|interview|appointment|call|coffee|lunch|dinner)\b", re.I), 'meeting'),
+    (re.compile(r"\b(party|concert|game|show|festival|exam|deadline)\b", re.I), 'event'),
+]
+SIGNIFICANCE = {'birthday': 'high', 'anniversary': 'high', 'wedding': 'high', 'graduation': 'medium', 'trip': 'medium'}
+
+_MONTH = r"(?P<month>" + '|'.join(sorted(MONTHS, key=len, reverse=True)) + r")\.?"
+_WEEKDAY = r"(?P<weekday>" + '|'.join(sorted(WEEKDAYS, key=len, reverse=True)) + r")"
+_DAY = r"(?P<day>[0-3]?\d)(?:st|nd|rd|th)?"
+_YEAR = r"(?:,?\s+(?P<year>\d{4}))?"
+_COUNT = r"(?P<count>\d+|" + '|'.join(sorted(NUMBER_WORDS, key=len, reverse=True)) + r")"
+_UNIT = r"(?P<unit>day|week|month|year)s?"
+
+# (kind, pattern); tried in order, overlapping later matches are ignored
+PATTERNS = [(kind, re.compile(pattern, re.I)) for kind, pattern in [
+    ('iso', r"\b(?P<year>\d{4})-(?P<month>\d{1,2})-(?P<day>\d{1,2})\b"),
+    ('month_day', r"\b" + _MONTH + r"\s+" + _DAY + r"\b" + _YEAR),
+    ('day_month', r"\b" + _DAY + r"\s+(?:of\s+)?" + _MONTH + r"\b" + _YEAR),
+    ('numeric', r"(?<![\d/])(?P<month>1[0-2]|0?[1-9])/(?P<day>3[01]|[12]\d|0?[1-9])(?:/(?P<year>\d{4}|\d{2}))?(?![\d/])"),
+    ('in_count', r"\bin\s+" + _COUNT + r"\s+" + _UNIT + r"\b"),
+    ('count_ago', r"\b" + _COUNT + r"\s+" + _UNIT + r"\s+ago\b"),
+    ('day_word', r"\b(?P<word>day after tomorrow|today|tonight|tomorrow|tmrw|yesterday)\b"),
+    ('weekday', r"\b(?:(?P<which>next|this|last|on|coming)\s+)?" + _WEEKDAY + r"\b"),
+    ('weekend', r"\b(?P<which>this|next|last)\s+weekend\b"),
+    ('next_unit', r"\b(?P<which>next|last)\s+(?P<unit>week|month|year)\b"),
+    ('month', r"\b(?:in|next|this|by|until|early|late|mid|end of)\s+" + _MONTH + r"\b"),
+]]
+
+# Expressions that pin a date by themselves; relative ones ("tomorrow",
+# "Friday") only count in a sentence that also names an event
+ABSOLUTE_KINDS = {'iso', 'month_day', 'day_month', 'numeric', 'month'}
+MILESTONES = {'birthday', 'anniversary', 'graduation', 'wedding'}
+
+_SENTENCES = re.compile(r"[^.!?\n]+[.!?]*")
+
+
+# ============================================================================
+# RESOLUTION
+# ============================================================================
+
+def _count(value):
+    value = value.lower()
+    return int(value) if value.isdigit() else NUMBER_WORDS.get(value, 1)
+
+
+def _add_months(day, months):
+    month = day.month - 1 + months
+    year, month = day.year + month // 12, month % 12 + 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def _shift(ref, count, unit):
+    unit = unit.lower()
+    if unit == 'day':
+        return ref + timedelta(days=count)
+    if unit == 'week':
+        return ref + timedelta(weeks=count)
+    return _add_months(ref, count * (12 if unit == 'year' else 1))
+
+
+def _upcoming(month, day, ref):
+    """Next occurrence of month/day on or after ref (Feb 29 -> Feb 28 in common years)"""
+    for year in (ref.year, ref.year + 1):
+        candidate = date(year, month, min(day, calendar.monthrange(year, month)[1]))
+        if candidate >= ref:
+            return candidate
+    return candidate
+
+
+def _full_year(year, ref):
+    """Four-digit year of a '/99'-style year: within 80 years before to 20 after ref"""
+    year += ref.year // 100 * 100
+    if year > ref.year + 20:
+        return year - 100
+    if year <= ref.year - 80:
+        return year + 100
+    return year
+
+
+def _month_number(value):
+    return int(value) if value.isdigit() else MONTHS[value.lower().rstrip('.')]
+
+
+def resolve(kind, match, ref):
+    """(date, precision 'day' | 'week' | 'month') of a match, or None if it isn't a valid date"""
+    g = match.groupdict()
+    if (g.get('month') or '').startswith('may'):
+        return None  # "may" is only the month when capitalized
+    try:
+        if kind in ('iso', 'month_day', 'day_month', 'numeric'):
+            month, day = _month_number(g['month']), int(g['day'])
+            if g.get('year'):
+                year = int(g['year'])
+                if len(g['year']) == 2:
+                    year = _full_year(year, ref)
+                return date(year, month, day), 'day'
+            date(ref.year, month, 1)  # validates the month
+            if day > calendar.monthrange(2000, month)[1]:
+                return None
+            return _upcoming(month, day, ref), 'day'
+        if kind == 'in_count':
+            return _shift(ref, _count(g['count']), g['unit']), 'day' if g['unit'].lower() == 'day' else g['unit'].lower()
+        if kind == 'count_ago':
+            return _shift(ref, -_count(g['count']), g['unit']), 'day' if g['unit'].lower() == 'day' else g['unit'].lower()
+        if kind == 'day_word':
+            word = g['word'].lower()
+            offset = {'today': 0, 'tonight': 0, 'tomorrow': 1, 'tmrw': 1, 'yesterday': -1,
+                      'day after tomorrow': 2}[word]
+            return ref + timedelta(days=offset), 'day'
+        if kind == 'weekday':
+            target = WEEKDAYS[g['weekday'].lower()]
+            which = (g.get('which') or '').lower()
+            ahead = (target - ref.weekday()) % 7
+            if which == 'last':
+                return ref - timedelta(days=(ref.weekday() - target) % 7 or 7), 'day'
+            if which == 'next':
+                # The given day of next week
+                return ref + timedelta(days=7 - ref.weekday() + target), 'day'
+            return ref + timedelta(days=ahead), 'day'
+        if kind == 'weekend':
+            saturday = ref + timedelta(days=(5 - ref.weekday()) % 7)
+            shift = {'this': 0, 'next': 7, 'last': -7}[g['which'].lower()]
+            return saturday + timedelta(days=shift), 'week'
+        if kind == 'next_unit':
+            sign = 1 if g['which'].lower() == 'next' else -1
+            unit = g['unit'].lower()
+            if unit == 'week':
+                return ref - timedelta(days=ref.weekday()) + timedelta(weeks=sign), 'week'
+            moved = _shift(ref.replace(day=1), sign, unit)
+            return (moved if unit == 'month' else moved.replace(month=1)), 'month'
+        if kind == 'month':
+            return _upcoming(_month_number(g['month']), 1, ref.replace(day=1)), 'month'
+    except (ValueError, KeyError):
+        return None
+    return None
+
+
+def label(day):
+    """"March 15, 2026" """
+    return f"{day:%B} {day.day}, {day.year}"
+
+
+def describe(day, today):
+    """(label, "in 4 months" / "2 weeks ago" / "today")"""
+    delta = (day - today).days
+    if delta == 0:
+        return label(day), 'today'
+    span = abs(delta)
+    amount, unit = ((span, 'day') if span < 14 else (span // 7, 'week') if span < 60
+                    else (span // 30, 'month') if span < 365 else (span // 365, 'year'))
+    text = f"{amount} {unit}{'s' if amount != 1 else ''}"
+    return label(day), (f"in {text}" if delta > 0 else f"{text} ago")
+
+
+# ============================================================================
+# EXTRACTION
+# ============================================================================
+
+def event_type(text):
+    for pattern, kind in EVENT_TYPES:
+        if pattern.search(text):
+            return kind
+    return None
+
+
+def find_dates(text, ref):
+    """[(expression, date, precision, kind)] in one sentence, leftmost first, no overlaps"""
+    found, taken = [], []
+    for kind, pattern in PATTERNS:
+        for match in pattern.finditer(text):
+            start, end = match.span()
+            if any(start < t_end and t_start < end for t_start, t_end in taken):
+                continue
+            resolved = resolve(kind, match, ref)
+            if resolved is None:
+                continue
+            taken.append((start, end))
+            found.append((start, match.group(0), *resolved, kind))
+    return [entry[1:] for entry in sorted(found)]
+
+
+def extract(transcript, today=None):
+    """
+    Date candidates of a conversation, oldest first: one per sentence with
+    an absolute date, a relative date next to an event word, or a milestone
+    (birthday, anniversary...) even without a date
+    [{index, sender, sentence, dates: [{expression, date, precision}], type}]
+    """
+    today = today or date.today()
+    candidates = []
+    for index, (text, user, t) in enumerate(zip(transcript.texts, transcript.is_user, transcript.times)):
+        if not text:
+            continue
+        ref = datetime.fromtimestamp(t).date() if t == t else today  # NaN: undated message
+        for sentence in _SENTENCES.findall(text):
+            sentence = sentence.strip()
+            if not sentence:
+                continue
+            dates = find_dates(sentence, ref)
+            kind = event_type(sentence)
+            if not (kind in MILESTONES or (dates and kind) or
+                    any(date_kind in ABSOLUTE_KINDS for *_, date_kind in dates)):
+                continue
+            candidates.append({
+                'index': index,
+                'sender': 'User' if user else transcript.contact_name,
+                'sentence': sentence,
+                'dates': [{'expression': expr, 'date': day.isoformat(), 'precision': precision}
+                          for expr, day, precision, _ in dates],
+                'type': kind,
+            })
+    _record(len(candidates))
+    return candidates
+
+
+def candidate_line(candidate):
+    """Prompt line for a candidate: the sentence plus what its dates resolve to"""
+    line = f"{candidate['sender']}: {candidate['sentence']}"
+    if candidate['dates']:
+        resolved = '; '.join(
+            f"\"{d['expression']}\" = {date.fromisoformat(d['date']):%A}, {label(date.fromisoformat(d['date']))}"
+            + (f" ({d['precision']})" if d['precision'] != 'day' else '')
+            for d in candidate['dates']
+        )
+        line += f"  [resolved: {resolved}]"
+    return line
+
+
+def local_dates(candidates, contact_name, today=None):
+    """dates_found entries built from candidates alone (no model)"""
+    today = today or date.today()
+    found = []
+    for candidate in candidates:
+        if not candidate['dates']:
+            continue
+        day = date.fromisoformat(candidate['dates'][0]['date'])
+        when, relative = describe(day, today)
+        kind = candidate['type'] or 'event'
+        found.append({
+            'type': kind,
+            'person': contact_name if candidate['sender'] != 'User' else 'You',
+            'date': when,
+            'date_relative': relative,
+            'context': candidate['sentence'],
+            'significance': SIGNIFICANCE.get(kind, 'low'),
+        })
+    return found
+
+
+# ============================================================================
+# STATS
+# ============================================================================
+
+_stats_lock = threading.Lock()
+_stats = {'conversations': 0, 'without_dates': 0, 'candidates': 0}
+
+
+def _record(candidates):
+    with _stats_lock:
+        _stats['conversations'] += 1
+        _stats['without_dates'] += not candidates
+        _stats['candidates'] += candidates
+
+
+def stats():
+    with _stats_lock:
+        snapshot = dict(_stats)
+    # Share of conversations answered without a model call
+    snapshot['model_skip_rate'] = (
+        round(snapshot['without_dates'] / snapshot['conversations'], 3) if snapshot['conversations'] else None
+    )
+    return snapshot
@@ -0,0 +1,232 @@
+"""
+Atlas Contact Features
+One set of per-contact signals (recency, frequency, last sender, reply
+times...) for every agent that needs them, instead of each agent deriving
+its own from client fields or raw messages:
+
+- ContactFeatures folds messages in as they are appended, so keeping the
+  features of a stored conversation current costs O(new messages)
+- a read is O(1): the features are running sums, turned into averages and
+  now-relative values (days since the last message) on read
+- version = messages folded in (the conversation's cursor), so caches can
+  key on it
+- inline requests (no stored conversation) get the same features from
+  their transcript, built once per request
+
+A reply is a message right after one from the other side (user replies
+feed the health score); gaps over MAX_REPLY_HOURS are not replies.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import transcript as transcripts
+from conversations import conversation_store
+
+
+FEATURE_STORE_SIZE = int(os.environ.get('FEATURE_STORE_SIZE', 10000))
+
+# Request key the features are memoized under
+FEATURES_KEY = '_features'
+
+MAX_REPLY_HOURS = 168
+TREND_WINDOW_DAYS = 30    # activity of the last window vs the one before
+SLOWDOWN_ALPHA = 0.2      # weight of the newest reply in the recent reply-time average
+
+
+class _Replies:
+    """Running count / mean / variance (Welford) and recent average of reply gaps"""
+
+    __slots__ = ('count', 'mean', 'm2', 'recent')
+
+    def __init__(self):
+        self.count, self.mean, self.m2, self.recent = 0, 0.0, 0.0, None
+
+    def add(self, hours):
+        self.count += 1
+        delta = hours - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (hours - self.mean)
+        self.recent = hours if self.recent is None else SLOWDOWN_ALPHA * hours + (1 - SLOWDOWN_ALPHA) * self.recent
+
+    def variation(self):
+        if self.count < 2 or self.mean <= 0:
+            return 0.0
+        return math.sqrt(self.m2 / self.count) / self.mean
+
+
+class ContactFeatures:
+    """Features of one conversation, updated message by message"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = 0
+        self.user_messages = 0
+        self.contact_messages = 0
+        self.timed = 0
+        self.first_at = None
+        self.last_at = None
+        self.last_is_user = None
+        self.last_text = ''
+        self.last_from_them = ''
+        self.previous = None          # (time, is_user) of the last dated message
+        self.user_replies = _Replies()
+        self.contact_replies = _Replies()
+        self.daily = {}               # day number -> dated messages, last 2 trend windows
+
+    @classmethod
+    def from_transcript(cls, transcript):
+        features = cls()
+        features.apply(transcript.texts, transcript.is_user, transcript.times)
+        return features
+
+    def apply(self, texts, is_user, times):
+        """Fold in messages (oldest first); times are epoch seconds, NaN when unknown"""
+        for text, user, t in zip(texts, is_user, times):
+            user = bool(user)
+            self.version += 1
+            if user:
+                self.user_messages += 1
+            else:
+                self.contact_messages += 1
+                self.last_from_them = text
+            self.last_is_user = user
+            self.last_text = text
+            if t != t:  # NaN: undated
+                continue
+
+            self.timed += 1
+            self.first_at = t if self.first_at is None else min(self.first_at, t)
+            if self.previous is not None:
+                previous_t, previous_user = self.previous
+                gap = (t - previous_t) / 3600
+                if previous_user != user and 0 < gap < MAX_REPLY_HOURS:
+                    (self.user_replies if user else self.contact_replies).add(gap)
+            self.previous = (t, user)
+
+            day = int(t // 86400)
+            self.daily[day] = self.daily.get(day, 0) + 1
+            if self.last_at is None or t > self.last_at:
+                self.last_at = t
+                if len(self.daily) > 2 * TREND_WINDOW_DAYS + 1:
+                    for stale in [d for d in self.daily if d < day - 2 * TREND_WINDOW_DAYS]:
+                        del self.daily[stale]
+
+    def snapshot(self, now=None):
+        """The features as of now"""
+        now = time.time() if now is None else now
+        count = self.user_messages + self.contact_messages
+        features = {
+            'version': self.version,
+            'message_count': count,
+            'user_messages': self.user_messages,
+            'contact_messages': self.contact_messages,
+            'timed_messages': self.timed,
+            'last_message': self.last_from_them,
+            'last_text': self.last_text,
+            'last_message_from': None if self.last_is_user is None else 'me' if self.last_is_user else 'them',
+            'last_message_at': self.last_at,
+            'days_since_last_message': None,
+            'hours_since_last_message': None,
+            'avg_messages_per_week': None,
+            'avg_reply_hours': self.user_replies.mean if self.user_replies.count else None,
+            'reply_variation': self.user_replies.variation(),
+            'reply_samples': self.user_replies.count,
+            'reply_slowdown': (self.user_replies.recent / self.user_replies.mean
+                               if self.user_replies.count >= 4 and self.user_replies.mean > 0 else 1.0),
+            'contact_avg_reply_hours': self.contact_replies.mean if self.contact_replies.count else None,
+            'activity_ratio': 1.0,
+        }
+        if self.last_at is None:
+            return features
+
+        seconds = max(0.0, now - self.last_at)
+        span_weeks = max((self.last_at - self.first_at) / (86400 * 7), 1)
+        today = int(now // 86400)
+        recent = sum(n for day, n in self.daily.items() if day > today - TREND_WINDOW_DAYS)
+        before = sum(n for day, n in self.daily.items()
+                     if today - 2 * TREND_WINDOW_DAYS < day <= today - TREND_WINDOW_DAYS)
+        features.update({
+            'days_since_last_message': seconds / 86400,
+            'hours_since_last_message': seconds / 3600,
+            'avg_messages_per_week': round(self.timed / span_weeks, 1),
+            'activity_ratio': (recent + 1) / (before + 1),
+        })
+        return features
+
+
+class FeatureStore:
+    """ContactFeatures of stored conversations, caught up on each read (LRU)"""
+
+    def __init__(self, max_size=FEATURE_STORE_SIZE):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.contacts = OrderedDict()
+        self.counters = {'reads': 0, 'messages_applied': 0, 'rebuilds': 0}
+
+    def sync(self, conversation):
+        """Fold in the conversation's messages not applied yet; returns its ContactFeatures"""
+        with self.lock:
+            features = self.contacts.get(conversation.id)
+            if features is None:
+                features = self.contacts[conversation.id] = ContactFeatures()
+                self.counters['rebuilds'] += 1
+            self.contacts.move_to_end(conversation.id)
+            while len(self.contacts) > self.max_size:
+                self.contacts.popitem(last=False)
+
+        with features.lock:
+            new = conversation.since(features.version)
+            if new:
+                features.apply(
+                    [m.get('text', '') for m in new],
+                    [m.get('isUser') for m in new],
+                    [transcripts.parse_epoch(m.get('timestamp')) for m in new]
+                )
+                with self.lock:
+                    self.counters['messages_applied'] += len(new)
+        return features
+
+    def read(self, conversation_id, now=None):
+        """Features of a stored conversation, None if unknown"""
+        conversation = conversation_store.get(str(conversation_id))
+        if conversation is None:
+            return None
+        features = self.sync(conversation)
+        with self.lock:
+            self.counters['reads'] += 1
+        with features.lock:
+            return features.snapshot(now)
+
+    def read_many(self, conversation_ids, now=None):
+        now = time.time() if now is None else now
+        return {str(cid): self.read(cid, now) for cid in conversation_ids}
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+            counters['contacts'] = len(self.contacts)
+        return counters
+
+
+feature_store = FeatureStore()
+
+
+def for_request(data):
+    """
+    The request's contact features, memoized in the request: the stored
+    conversation's when it is referenced by conversation_id (and not sent
+    inline), else built from the request's transcript
+    """
+    features = data.get(FEATURES_KEY)
+    if features is not None:
+        return features
+    if data.get('conversation_id') and not any(data.get(f) for f in transcripts.SOURCE_FIELDS):
+        features = feature_store.read(data['conversation_id'])
+    if features is None:
+        features = ContactFeatures.from_transcript(transcripts.for_request(data)).snapshot()
+    data[FEATURES_KEY] = features
+    return features
@@ -0,0 +1,231 @@
+"""
+Atlas Relationship Forecast
+Local forecast of a contact's health score from its history, instead of
+asking the model to guess the 30 / 90 day scores:
+
+- a robust linear trend (Huber-weighted least squares, recent points
+  weighing more) fitted to each score series
+- predictions at 30 and 90 days with an 80% band that widens with the
+  horizon and the scatter of the history
+- every contact's series is padded into one matrix and fitted together,
+  so forecasting a whole dashboard is a handful of array operations
+
+With one point (or none) the forecast is flat at the current score and
+only the band reflects the uncertainty.
+"""
+
+import math
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from transcript import parse_epoch
+
+
+HORIZONS = (30, 90)           # days
+HALF_LIFE_DAYS = 60           # weight of a point halves every HALF_LIFE_DAYS back
+DEFAULT_SPACING_DAYS = 7      # between points without (parseable) dates
+HUBER_K = 1.345
+IRLS_ITERATIONS = 5
+BAND_Z = 1.2816               # 80% band
+DEFAULT_SIGMA = 8.0           # score points; scatter assumed with under 3 points
+MIN_SIGMA = 2.0
+ATTENTION_SCORE = 40          # below this health_score calls a relationship 'needs_attention'
+
+
+def series(history, now=None):
+    """(days relative to now, scores) of a [{date, score}] history, oldest first"""
+    points = []
+    for entry in history or []:
+        try:
+            points.append((parse_epoch(entry.get('date')), float(entry['score'])))
+        except (KeyError, TypeError, ValueError):
+            continue
+    now = time.time() if now is None else now
+    if any(math.isnan(t) for t, _ in points):
+        # Undated history: evenly spaced, ending now
+        n = len(points)
+        return [-(n - 1 - i) * DEFAULT_SPACING_DAYS for i in range(n)], [s for _, s in points]
+    points.sort()
+    return [(t - now) / 86400 for t, _ in points], [s for _, s in points]
+
+
+def fit(histories):
+    """
+    Robust trend of each non-empty (days, scores) series, all fitted at once
+    Returns arrays (level at day 0, slope per day, residual sigma, points,
+    weighted mean day, weighted day spread) with one entry per series
+    """
+    m = len(histories)
+    width = max((len(s) for _, s in histories), default=0) or 1
+    x = np.zeros((m, width))
+    y = np.zeros((m, width))
+    mask = np.zeros((m, width))
+    for i, (days, scores) in enumerate(histories):
+        x[i, :len(days)] = days
+        y[i, :len(scores)] = scores
+        mask[i, :len(scores)] = 1
+    n = mask.sum(axis=1)
+
+    last = np.max(np.where(mask > 0, x, -np.inf), axis=1)
+    decay = mask * 0.5 ** ((last[:, None] - x) / HALF_LIFE_DAYS)
+    weights = decay.copy()
+    for _ in range(IRLS_ITERATIONS):
+        sw = np.maximum(weights.sum(axis=1), 1e-12)
+        xm = (weights * x).sum(axis=1) / sw
+        ym = (weights * y).sum(axis=1) / sw
+        dx = x - xm[:, None]
+        sxx = (weights * dx * dx).sum(axis=1)
+        slope = np.where(sxx > 1e-9, (weights * dx * (y - ym[:, None])).sum(axis=1) / np.maximum(sxx, 1e-9), 0)
+        residuals = y - (ym[:, None] + slope[:, None] * dx)
+        scale = 1.4826 * np.nanmedian(np.where(mask > 0, np.abs(residuals), np.nan), axis=1)
+        scale = np.maximum(scale, MIN_SIGMA / 2)
+        u = np.abs(residuals) / (HUBER_K * scale[:, None])
+        weights = decay * np.minimum(1, 1 / np.maximum(u, 1e-12))
+
+    sw = np.maximum(weights.sum(axis=1), 1e-12)
+    # Weighted residual variance, corrected for the two fitted parameters
+    variance = (weights * residuals * residuals).sum(axis=1) / sw * n / np.maximum(n - 2, 1)
+    sigma = np.where(n >= 3, np.maximum(np.sqrt(variance), MIN_SIGMA), DEFAULT_SIGMA)
+    level = ym - slope * xm  # at day 0 (now)
+    return level, slope, sigma, n, xm, sxx
+
+
+def trajectory(change):
+    if change <= -20:
+        return 'steep_decline'
+    if change <= -10:
+        return 'moderate_decline'
+    if change <= -3:
+        return 'slight_decline'
+    if change < 3:
+        return 'stable'
+    if change < 10:
+        return 'slight_improvement'
+    return 'strong_improvement'
+
+
+def forecast(contacts, now=None):
+    """
+    Forecasts of [{contact_name, health_history, current_health (optional
+    fallback when there is no history)}], in input order; None for a
+    contact with neither
+    """
+    now = time.time() if now is None else now
+    histories = []
+    for contact in contacts:
+        days, scores = series(contact.get('health_history'), now)
+        if not scores and contact.get('current_health') is not None:
+            days, scores = [0.0], [float(contact['current_health'])]
+        histories.append((days, scores))
+    fitted = [i for i, (_, scores) in enumerate(histories) if scores]
+    if not fitted:
+        return [None] * len(contacts)
+
+    level, slope, sigma, n, xm, sxx = fit([histories[i] for i in fitted])
+    results = [None] * len(contacts)
+    for i, index in enumerate(fitted):
+        contact, scores = contacts[index], histories[index][1]
+        current = int(round(scores[-1]))
+        predictions = {}
+        for horizon in HORIZONS:
+            predicted = level[i] + slope[i] * horizon
+            spread = ((horizon - xm[i]) ** 2 / sxx[i]) if sxx[i] > 1e-9 else horizon / 30
+            band = BAND_Z * sigma[i] * math.sqrt(1 + 1 / max(n[i], 1) + spread)
+            predictions[horizon] = (predicted, band)
+        results[index] = _assessment(contact.get('contact_name', 'Contact'), current, predictions,
+                                     float(slope[i]), float(sigma[i]), int(n[i]), now)
+    return results
+
+
+def _clip(value):
+    return int(round(min(max(value, 0), 100)))
+
+
+def _confidence(band, points):
+    if points < 3:
+        return 'low'
+    return 'high' if band <= 8 else 'medium' if band <= 16 else 'low'
+
+
+def _assessment(contact_name, current, predictions, slope, sigma, points, now):
+    predicted_30, band_30 = predictions[30]
+    predicted_90, band_90 = predictions[90]
+    trajectory_30 = trajectory(_clip(predicted_30) - current)
+    trajectory_90 = trajectory(_clip(predicted_90) - current)
+    per_week = slope * 7
+
+    if points < 2:
+        reasoning = 'Only one health score so far; assuming it holds'
+    elif abs(per_week) < 0.5:
+        reasoning = f"Health score has held steady over {points} data points"
+    else:
+        reasoning = (f"Health score {'rising' if per_week > 0 else 'falling'} about "
+                     f"{abs(per_week):.1f} points per week over {points} data points")
+
+    risk_factors = []
+    if per_week <= -0.5:
+        risk_factors.append({
+            'factor': 'Declining health score trend',
+            'severity': 'high' if per_week <= -2 else 'medium',
+            'impact': _clip(predicted_30) - current,
+            'mitigation': 'Schedule regular check-ins'
+        })
+    if sigma >= 12 and points >= 3:
+        risk_factors.append({
+            'factor': 'Health score swings a lot between check-ins',
+            'severity': 'low',
+            'impact': -int(round(sigma)),
+            'mitigation': 'Keep a steadier rhythm of messages'
+        })
+
+    milestones = []
+    if slope < 0 and current >= ATTENTION_SCORE:
+        days_left = (current - ATTENTION_SCORE) / -slope
+        if days_left <= max(predictions):
+            reached = datetime.fromtimestamp(now) + timedelta(days=days_left)
+            deadline = datetime.fromtimestamp(now) + timedelta(days=max(days_left - 14, 0))
+            milestones.append({
+                'event': 'Health score likely to drop into needs-attention range',
+                'predicted_date': f"{reached:%B} {reached.day}, {reached.year}",
+                'prevention_deadline': f"{deadline:%B} {deadline.day}, {deadline.year}"
+            })
+
+    if 'decline' in trajectory_30:
+        intervention = {'action': f"Reach out to {contact_name} this week", 'priority': 'high',
+                        'expected_impact': f"+{max(current - _clip(predicted_30), 1)} points", 'timing': 'within 3 days'}
+    elif 'improvement' in trajectory_30:
+        intervention = {'action': 'Keep up the current rhythm of conversation', 'priority': 'low',
+                        'expected_impact': 'keeps the upward trend', 'timing': 'ongoing'}
+    else:
+        intervention = {'action': 'Maintain regular communication', 'priority': 'medium',
+                        'expected_impact': 'keeps the score stable', 'timing': 'this week'}
+
+    return {
+        'current_health': current,
+        'forecast_30_days': {
+            'predicted_score': _clip(predicted_30),
+            'confidence': _confidence(band_30, points),
+            'trajectory': trajectory_30,
+            'reasoning': reasoning,
+            'range': [_clip(predicted_30 - band_30), _clip(predicted_30 + band_30)]
+        },
+        'forecast_90_days': {
+            'predicted_score': _clip(predicted_90),
+            'confidence': _confidence(band_90, points),
+            'trajectory': trajectory_90,
+            'range': [_clip(predicted_90 - band_90), _clip(predicted_90 + band_90)]
+        },
+        'risk_factors': risk_factors,
+        'protective_factors': [],
+        'interventions': [intervention],
+        'milestones': milestones,
+        'summary': (f"Health {current} now, forecast {_clip(predicted_30)} in 30 days and "
+                    f"{_clip(predicted_90)} in 90 days ({trajectory_90.replace('_', ' ')})."),
+        'model': {
+            'points': points,
+            'slope_per_week': round(per_week, 2),
+            'residual_sd': round(sigma, 2)
+        }
+    }
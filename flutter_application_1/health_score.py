@@ -0,0 +1,148 @@
+"""
+Atlas Relationship Health Scoring
+Local, vectorized version of the health rubric the model used to be asked
+to apply (frequency, recency, engagement), so scores take milliseconds
+and no model call:
+
+- features() picks the rubric's inputs from a contact's running features
+  (features.py): messages per week, recency, reply times and their
+  variation, and the activity trend
+- score() maps features of any number of contacts through the rubric's
+  breakpoints as arrays, so scoring a whole contact list is one call
+- warmth and topic diversity need the message text: the model adds them
+  (with written insights) only when a narrative is asked for
+
+Requests without timestamps (counts and averages only) score from those.
+"""
+
+import numpy as np
+
+
+# Rubric breakpoints (linear between points, flat outside)
+FREQUENCY_POINTS = ([0, 5, 10, 20, 50, 100], [10, 30, 50, 70, 90, 100])        # messages / week
+COUNT_POINTS = ([0, 10, 20, 50, 100, 200], [10, 25, 40, 60, 80, 95])           # total messages, no timestamps
+RECENCY_POINTS = ([0, 1, 3, 7, 14, 30, 60], [100, 90, 70, 50, 30, 10, 0])      # days since last message
+ENGAGEMENT_POINTS = ([0, 2, 6, 24, 48, 96], [100, 90, 70, 50, 30, 10])         # average reply hours
+VARIANCE_PENALTY_POINTS = ([0.5, 1.0], [10, 20])                                # reply-time variation (CV)
+
+WEIGHTS = {'frequency': 0.30, 'recency': 0.35, 'engagement': 0.35}
+NARRATIVE_WEIGHT = 0.25  # share of warmth / diversity in the overall score when available
+
+DEFAULT_REPLY_HOURS = 24
+
+
+def features(contact, message_count=None, days_since_last=None, messages_per_week=None,
+             avg_reply_hours=None):
+    """
+    Scoring inputs of one contact from its features (features.py); explicit
+    values (from the request) stand in where the conversation has no
+    timestamps to derive them from
+    """
+    timed = contact['last_message_at'] is not None
+    return {
+        'message_count': contact['message_count'] or message_count,
+        'days_since_last': contact['days_since_last_message'] if timed else days_since_last,
+        'messages_per_week': contact['avg_messages_per_week'] if timed else messages_per_week,
+        'avg_reply_hours': contact['avg_reply_hours'] if contact['avg_reply_hours'] is not None else avg_reply_hours,
+        'reply_variation': contact['reply_variation'],
+        'reply_samples': contact['reply_samples'],
+        'reply_slowdown': contact['reply_slowdown'],
+        'activity_ratio': contact['activity_ratio'],
+    }
+
+
+def score(contacts, warmth=None, diversity=None):
+    """
+    Health of each contact from its features(), in input order
+    warmth / diversity: optional per-contact 0-100 scores (None entries allowed)
+    """
+    n = len(contacts)
+    if not n:
+        return []
+
+    def column(field, default):
+        return np.array([c[field] if c[field] is not None else default for c in contacts], dtype=np.float64)
+
+    has_rate = np.array([c['messages_per_week'] is not None for c in contacts])
+    per_week = column('messages_per_week', 0)
+    count = column('message_count', 0)
+    days = column('days_since_last', 0)
+    reply_hours = column('avg_reply_hours', DEFAULT_REPLY_HOURS)
+    variation = column('reply_variation', 0)
+    slowdown = column('reply_slowdown', 1)
+    activity = column('activity_ratio', 1)
+
+    frequency = np.where(has_rate, np.interp(per_week, *FREQUENCY_POINTS), np.interp(count, *COUNT_POINTS))
+    recency = np.interp(days, *RECENCY_POINTS)
+    penalty = np.where(variation >= VARIANCE_PENALTY_POINTS[0][0], np.interp(variation, *VARIANCE_PENALTY_POINTS), 0)
+    engagement = np.clip(np.interp(reply_hours, *ENGAGEMENT_POINTS) - penalty, 0, 100)
+
+    overall = (WEIGHTS['frequency'] * frequency + WEIGHTS['recency'] * recency +
+               WEIGHTS['engagement'] * engagement)
+
+    warmth = np.array([np.nan if w is None else w for w in (warmth or [None] * n)], dtype=np.float64)
+    diversity = np.array([np.nan if d is None else d for d in (diversity or [None] * n)], dtype=np.float64)
+    both = np.stack([warmth, diversity])
+    known = ~np.isnan(both)
+    narrative = np.nansum(both, axis=0) / np.maximum(known.sum(axis=0), 1)
+    overall = np.where(known.any(axis=0), (1 - NARRATIVE_WEIGHT) * overall + NARRATIVE_WEIGHT * narrative, overall)
+    overall = np.clip(np.rint(overall), 0, 100).astype(int)
+
+    trend = np.where((activity < 0.8) | (slowdown >= 2), 'declining',
+                     np.where(activity > 1.25, 'improving', 'stable'))
+
+    results = []
+    for i, contact in enumerate(contacts):
+        breakdown = {
+            'frequency_score': int(round(frequency[i])),
+            'recency_score': int(round(recency[i])),
+            'engagement_score': int(round(engagement[i])),
+        }
+        if not np.isnan(warmth[i]):
+            breakdown['warmth_score'] = int(round(warmth[i]))
+        if not np.isnan(diversity[i]):
+            breakdown['diversity_score'] = int(round(diversity[i]))
+        results.append(_assessment(contact, int(overall[i]), breakdown, str(trend[i]), reply_hours[i], days[i]))
+    return results
+
+
+def _assessment(contact, overall, breakdown, trend, reply_hours, days):
+    status = ('excellent' if overall >= 80 else 'good' if overall >= 60
+              else 'fair' if overall >= 40 else 'needs_attention')
+
+    insights = []
+    if contact['reply_samples']:
+        insights.append(f"Your average response time is {reply_hours:.1f} hours "
+                        f"over {contact['reply_samples']} replies")
+    else:
+        insights.append(f"Average response time: {reply_hours:.1f} hours")
+    insights.append(f"Last contact: {days:.1f} days ago")
+    if contact['messages_per_week'] is not None:
+        insights.append(f"About {contact['messages_per_week']:.1f} messages per week")
+    else:
+        insights.append(f"Total messages: {int(contact['message_count'] or 0)}")
+    if contact['reply_variation'] >= 1:
+        insights.append('Response times are very inconsistent')
+    if contact['reply_slowdown'] >= 2:
+        insights.append('Your replies have been getting slower')
+
+    suggestions = [
+        'Reach out soon!' if days > 7 else 'Keep up the conversation!',
+        'Try to respond faster' if reply_hours > 24 else 'Good response time!'
+    ]
+    return {
+        'overall_score': overall,
+        'breakdown': breakdown,
+        'status': status,
+        'insights': insights,
+        'suggestions': suggestions,
+        'relationship_trend': trend,
+        'priority_level': 'high' if days > 7 or reply_hours > 24 else 'low' if overall >= 80 else 'medium',
+        'metrics': {
+            'messages_per_week': round(contact['messages_per_week'], 1) if contact['messages_per_week'] is not None else None,
+            'days_since_last': round(float(days), 1),
+            'avg_response_hours': round(float(reply_hours), 1),
+            'response_variance': round(contact['reply_variation'], 2),
+            'response_samples': contact['reply_samples'],
+        }
+    }
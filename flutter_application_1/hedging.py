@@ -0,0 +1,240 @@
+"""
+Atlas Hedged Requests
+Tail-latency hedging across the two model upstreams: if the primary has not
+answered within its recent p95 (configurable), the same prompt is sent to
+the secondary and whichever good answer arrives first wins.
+
+- LatencyTracker keeps a rolling window of successful latencies per upstream
+  and turns it into the hedge delay
+- hedged_call (threads, Flask mode) / hedged_call_async (ASGI mode) race the
+  two calls and cancel the loser. In ASGI mode its task is cancelled, which
+  closes its connection; a blocking loser thread is handed a cancelled
+  Attempt: its concurrency slot is freed at once and it stops reading (and
+  closes the connection) at its next streamed chunk.
+- Hedge rate and win rate are reported for /metrics so the extra upstream
+  cost can be tuned
+"""
+
+import asyncio
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+HEDGE_ENABLED = os.environ.get('LLM_HEDGE', '0') == '1'
+HEDGE_PERCENTILE = float(os.environ.get('LLM_HEDGE_PERCENTILE', 95))
+HEDGE_MIN_DELAY = float(os.environ.get('LLM_HEDGE_MIN_DELAY', 0.5))  # seconds
+HEDGE_MAX_DELAY = float(os.environ.get('LLM_HEDGE_MAX_DELAY', 8))  # seconds, also used until warmed up
+HEDGE_MIN_SAMPLES = int(os.environ.get('LLM_HEDGE_MIN_SAMPLES', 20))
+HEDGE_WINDOW = int(os.environ.get('LLM_HEDGE_WINDOW', 200))
+
+_pool = ThreadPoolExecutor(max_workers=int(os.environ.get('LLM_HEDGE_WORKERS', 16)))
+
+_stats_lock = threading.Lock()
+_stats = {'calls': 0, 'hedged': 0, 'primary_wins': 0, 'secondary_wins': 0, 'failed': 0}
+
+
+def _count(field):
+    with _stats_lock:
+        _stats[field] += 1
+
+
+class Cancelled(Exception):
+    """Raised in a hedged call that lost the race"""
+
+
+class Attempt:
+    """Cancellation handle of one side of a blocking hedged call"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cancelled = False
+        self.callbacks = []
+
+    def cancel(self):
+        with self.lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def once(self, release):
+        """release() wrapped to run at most once: when the call is done, or as soon as it loses"""
+        lock = threading.Lock()
+        done = []
+
+        def release_once(*args, **kwargs):
+            with lock:
+                if done:
+                    return
+                done.append(True)
+            release(*args, **kwargs)
+
+        with self.lock:
+            if not self.cancelled:
+                self.callbacks.append(release_once)
+                return release_once
+        release_once()
+        return release_once
+
+    def check(self):
+        if self.cancelled:
+            raise Cancelled()
+
+    def watch(self, chunks):
+        """chunks, stopping with Cancelled once the call has lost"""
+        for chunk in chunks:
+            self.check()
+            yield chunk
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies for one upstream"""
+
+    def __init__(self, window=HEDGE_WINDOW):
+        self.lock = threading.Lock()
+        self.samples = deque(maxlen=window)
+
+    def record(self, latency):
+        with self.lock:
+            self.samples.append(latency)
+
+    def percentile(self, pct):
+        with self.lock:
+            ordered = sorted(self.samples)
+        if not ordered:
+            return None
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def hedge_delay(self):
+        """How long to wait on this upstream before hedging"""
+        with self.lock:
+            warmed_up = len(self.samples) >= HEDGE_MIN_SAMPLES
+        if not warmed_up:
+            return HEDGE_MAX_DELAY
+        return min(HEDGE_MAX_DELAY, max(HEDGE_MIN_DELAY, self.percentile(HEDGE_PERCENTILE)))
+
+    def stats(self):
+        with self.lock:
+            count = len(self.samples)
+        p50 = self.percentile(50)
+        tail = self.percentile(HEDGE_PERCENTILE)
+        return {
+            'samples': count,
+            'p50': round(p50, 3) if p50 is not None else None,
+            f'p{HEDGE_PERCENTILE:g}': round(tail, 3) if tail is not None else None,
+            'hedge_delay': round(self.hedge_delay(), 3)
+        }
+
+
+latency = {}  # upstream name -> LatencyTracker
+
+
+def tracker(name):
+    return latency.setdefault(name, LatencyTracker())
+
+
+def _record_winner(winner):
+    _count('primary_wins' if winner == 'primary' else 'secondary_wins')
+    if winner == 'secondary':
+        print("[HEDGE] Secondary upstream won")
+
+
+def hedged_call(primary_fn, secondary_fn, delay):
+    """
+    Run primary_fn(attempt); if it has no good (non-None) answer after delay
+    seconds, also run secondary_fn(attempt) and return the first good answer
+    (or None). The loser's Attempt is cancelled.
+    """
+    _count('calls')
+    attempts = {'primary': Attempt(), 'secondary': Attempt()}
+    primary = _pool.submit(primary_fn, attempts['primary'])
+    done, _ = wait([primary], timeout=delay)
+
+    # Primary answered before the hedge fired
+    if done:
+        result = _result(primary)
+        if result is not None:
+            _record_winner('primary')
+            return result
+
+    _count('hedged')
+    print(f"[HEDGE] Primary slow or failed after {delay:.2f}s, hedging to secondary")
+    calls = {_pool.submit(secondary_fn, attempts['secondary']): 'secondary'}
+    if not done:
+        calls[primary] = 'primary'
+
+    pending = set(calls)
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            result = _result(future)
+            if result is not None:
+                for loser in pending:
+                    loser.cancel()
+                    attempts[calls[loser]].cancel()
+                _record_winner(calls[future])
+                return result
+
+    _count('failed')
+    return None
+
+
+async def hedged_call_async(primary_fn, secondary_fn, delay):
+    """hedged_call for coroutines; the losing request is cancelled"""
+    _count('calls')
+    primary = asyncio.ensure_future(primary_fn())
+    calls = {primary: 'primary'}
+
+    try:
+        done, _ = await asyncio.wait([primary], timeout=delay)
+        if done:
+            del calls[primary]
+            result = _result(primary)
+            if result is not None:
+                _record_winner('primary')
+                return result
+
+        _count('hedged')
+        print(f"[HEDGE] Primary slow or failed after {delay:.2f}s, hedging to secondary")
+        calls[asyncio.ensure_future(secondary_fn())] = 'secondary'
+
+        pending = set(calls)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                result = _result(task)
+                if result is not None:
+                    _record_winner(calls[task])
+                    return result
+    finally:
+        for task in calls:
+            task.cancel()
+
+    _count('failed')
+    return None
+
+
+def _result(future):
+    """Result of a finished call, None if it raised"""
+    try:
+        return future.result()
+    except Exception as e:
+        print(f"[HEDGE] Call failed: {e}")
+        return None
+
+
+def stats():
+    with _stats_lock:
+        counters = dict(_stats)
+    hedged = counters['hedged']
+    counters['enabled'] = HEDGE_ENABLED
+    counters['hedge_rate'] = round(hedged / counters['calls'], 3) if counters['calls'] else 0.0
+    # Share of hedges where the secondary request actually paid off
+    counters['win_rate'] = round(counters['secondary_wins'] / hedged, 3) if hedged else 0.0
+    counters['latency'] = {name: t.stats() for name, t in latency.items()}
+    return counters
@@ -0,0 +1,189 @@
+"""
+Atlas Intent Gate
+Cheap local check of whether a conversation's recent tail asks for an
+action (meeting, follow-up, sharing, planning), so action detection only
+calls the model for conversations where one is likely:
+
+- compiled keyword patterns per intent ("grab coffee", "send me the
+  link", "any update?")
+- a linear model over hashed word uni- and bigrams, recent messages
+  weighing more; its weights start from seed phrases and can be replaced
+  by trained ones (INTENT_MODEL_PATH, an .npz with weights and bias)
+- an intent clears the gate when its probability reaches INTENT_THRESHOLD
+
+The share of conversations the gate answers without a model call is
+reported as skip_rate.
+"""
+
+import os
+import re
+import threading
+import zlib
+
+import numpy as np
+
+
+INTENT_THRESHOLD = float(os.environ.get('INTENT_THRESHOLD', 0.5))
+INTENT_TAIL = int(os.environ.get('INTENT_TAIL', 10))          # newest messages classified
+INTENT_MODEL_PATH = os.environ.get('INTENT_MODEL_PATH', '')
+
+INTENTS = ('meeting', 'follow_up', 'share', 'plan')
+DIMENSION = 1 << 12       # hashed n-gram buckets
+RECENCY_DECAY = 0.8       # weight of a message relative to the one after it
+KEYWORD_WEIGHT = 3.0      # logit added per (recency-weighted) keyword hit
+SEED_WEIGHT = 1.0
+SEED_BIAS = -3.0
+
+# A concrete time, so "dinner saturday?" reads as a meeting and "talk to you later" does not
+TIME = (r"(today|tonight|tomorrow|tmrw|this (morning|afternoon|evening|week|weekend)|"
+        r"next (week|weekend)|(mon|tues|wednes|thurs|fri|satur|sun)day|noon|"
+        r"at \d{1,2}(:\d\d)?|\d{1,2}(:\d\d)? ?(am|pm))")
+GET_TOGETHER = r"(talk|chat|call|dinner|lunch|breakfast|brunch|coffee|drinks)"
+ACTIVITY = r"(go|do|try|get|plan|trip|party|camping|hike|hiking|beach|wedding|concert|festival|vacation)"
+
+KEYWORDS = {
+    'meeting': re.compile(
+        r"\b(meet(ing)? ?up|let'?s meet|grab (a )?(coffee|lunch|dinner|drinks?|bite)|catch up|hang out|"
+        r"get together|video call|facetime|zoom|are you free|you free|free (on|this|tomorrow|tonight|later)|"
+        r"what time works|when works|schedule|come over|can we (talk|chat|call|meet)|give me a call|"
+        r"call (me|you)|hop on a call|"
+        rf"{GET_TOGETHER}\b[^.!?]{{0,30}}\b{TIME}|{TIME}\b[^.!?]{{0,30}}\b{GET_TOGETHER})\b", re.I),
+    'follow_up': re.compile(
+        r"\b(let me know|get back to (me|you)|any (update|news)|did you (get|see|hear|check)|"
+        r"still waiting|waiting (for|on)|follow(ing)? up|haven'?t heard|remind me|circle back|"
+        r"keep me posted|what do you think)\b", re.I),
+    'share': re.compile(
+        r"(https?://\S+|\b(send (me|you|it|over|them)|share|sharing|the link|photos?|pics?|pictures?|"
+        r"video|article|playlist|recipe|check (this|it) out|"
+        r"(you|we) (should|gotta|have to|need to|must) (watch|read|listen( to)?|see|try|check out)|"
+        r"recommend)\b)", re.I),
+    'plan': re.compile(
+        r"\b(plan(s|ning)?|trip|party|tickets?|reservation|book (a|the)|vacation|road trip|"
+        r"birthday|concert|festival|wedding|camping|hike|let'?s (go|do)|we should (go|do|try|get)|"
+        rf"{ACTIVITY}\b[^.!?]{{0,30}}\b(this|next) (week|weekend|month|saturday|sunday|summer))\b", re.I),
+}
+
+SEEDS = {
+    'meeting': ["want to grab coffee", "lunch tomorrow", "dinner this week", "meet up soon",
+                "are you free on friday", "let's catch up", "hop on a call",
+                "can we talk tomorrow", "call you tonight", "dinner on saturday"],
+    'follow_up': ["let me know", "any update on", "did you hear back", "still waiting on",
+                  "get back to me", "what do you think", "did you get my message"],
+    'share': ["send me the link", "share the photos", "check this out", "you should watch",
+              "we should watch", "send me the pics", "here is the article", "can you send"],
+    'plan': ["we should plan", "plan a trip", "book tickets", "go camping", "make a reservation",
+             "road trip", "birthday party", "let's go to the beach"],
+}
+
+STOPWORDS = {'a', 'an', 'the', 'to', 'on', 'of', 'me', 'my', 'you', 'we', 'is', 'it', 'this',
+             'that', 'and', 'or', 'for', 'in', 'at', 'can', 'should', 'did', 'are', 'what', 'here'}
+
+_WORDS = re.compile(r"[a-z']+|\?")
+
+ACTIONS = {
+    'meeting': ('book_meeting', 'Book a Meeting', 'You talked about meeting up', 'calendar'),
+    'follow_up': ('send_followup', 'Send Follow-up', 'Something is waiting for an answer', 'message'),
+    'share': ('share_content', 'Share Content', 'Something was asked to be shared', 'share'),
+    'plan': ('plan_event', 'Plan Event', 'You discussed making plans', 'event'),
+}
+
+
+def _ngrams(text):
+    words = _WORDS.findall(text.lower())
+    grams = [w for w in words if w not in STOPWORDS]
+    grams += [f"{a} {b}" for a, b in zip(words, words[1:])]
+    return grams
+
+
+def _bucket(gram):
+    return zlib.crc32(gram.encode('utf-8')) & (DIMENSION - 1)
+
+
+def seed_model():
+    """(weights [intents x DIMENSION], bias [intents]) from the seed phrases"""
+    weights = np.zeros((len(INTENTS), DIMENSION))
+    for i, intent in enumerate(INTENTS):
+        for phrase in SEEDS[intent]:
+            for gram in set(_ngrams(phrase)):
+                weights[i, _bucket(gram)] = SEED_WEIGHT
+    return weights, np.full(len(INTENTS), SEED_BIAS)
+
+
+def load_model(path=INTENT_MODEL_PATH):
+    if path:
+        model = np.load(path)
+        weights, bias = model['weights'], model['bias']
+        if weights.shape != (len(INTENTS), DIMENSION) or bias.shape != (len(INTENTS),):
+            raise ValueError(f"{path}: expected weights {(len(INTENTS), DIMENSION)} and bias {(len(INTENTS),)}")
+        return weights, bias
+    return seed_model()
+
+
+class IntentGate:
+    """Intent probabilities of a conversation tail, and the skip-rate counters"""
+
+    def __init__(self, model=None, threshold=INTENT_THRESHOLD, tail=INTENT_TAIL):
+        self.weights, self.bias = model or load_model()
+        self.threshold = threshold
+        self.tail = tail
+        self.lock = threading.Lock()
+        self.counters = {'checked': 0, 'skipped': 0, **{intent: 0 for intent in INTENTS}}
+
+    def classify(self, texts, is_user):
+        """{intent: probability} for messages oldest first"""
+        texts, is_user = list(texts)[-self.tail:], list(is_user)[-self.tail:]
+        n = len(texts)
+        x = np.zeros(DIMENSION)
+        hits = np.zeros(len(INTENTS))
+        for age, text in enumerate(reversed(texts)):
+            weight = RECENCY_DECAY ** age
+            buckets = [_bucket(gram) for gram in _ngrams(text)]
+            np.add.at(x, buckets, weight)
+            hits += weight * np.array([bool(KEYWORDS[intent].search(text)) for intent in INTENTS])
+        # An unanswered question from them is an open loop
+        if n and not is_user[-1] and texts[-1].rstrip().endswith('?'):
+            hits[INTENTS.index('follow_up')] += 1
+        logits = self.weights @ np.minimum(x, 1) + self.bias + KEYWORD_WEIGHT * hits
+        probabilities = 1 / (1 + np.exp(-logits))
+        return {intent: round(float(p), 3) for intent, p in zip(INTENTS, probabilities)}
+
+    def check(self, transcript):
+        """(intents clearing the threshold, most likely first; all probabilities)"""
+        scores = self.classify(transcript.texts, transcript.is_user)
+        cleared = sorted((i for i in INTENTS if scores[i] >= self.threshold), key=lambda i: -scores[i])
+        with self.lock:
+            self.counters['checked'] += 1
+            self.counters['skipped'] += not cleared
+            for intent in cleared:
+                self.counters[intent] += 1
+        return cleared, scores
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+        counters['threshold'] = self.threshold
+        counters['skip_rate'] = round(counters['skipped'] / counters['checked'], 3) if counters['checked'] else None
+        return counters
+
+
+def describe(cleared, scores):
+    """Cleared intents for a prompt, e.g. 'meeting (0.93), share (0.61)'"""
+    return ', '.join(f"{intent} ({scores[intent]:.2f})" for intent in cleared) or 'none'
+
+
+def local_actions(cleared, scores):
+    """detect_actions entries for the cleared intents, without the model"""
+    actions = []
+    for intent in cleared:
+        action_type, title, description, icon = ACTIONS[intent]
+        actions.append({
+            'action_type': action_type,
+            'title': title,
+            'description': description,
+            'priority': 'high' if scores[intent] >= 0.85 else 'medium',
+            'icon': icon,
+        })
+    return actions
+
+
+gate = IntentGate()
@@ -0,0 +1,122 @@
+"""
+Atlas Incremental JSON Extractor
+One parser for pulling the JSON answer out of model text, shared by every
+agent instead of index('{')/rindex('}'), greedy regexes and ```json fences.
+
+JsonStreamExtractor consumes text as it streams in and knows the moment the
+first top-level JSON object / array is closed, so the caller can stop the
+generation there instead of paying for the prose models add afterwards.
+Prose, markdown fences and stray braces before the JSON are skipped; a
+candidate that turns out not to be valid JSON is dropped and scanning
+resumes right after its opening bracket.
+"""
+
+import json
+
+
+class JsonStreamExtractor:
+    """
+    Incremental scanner for the first top-level JSON value in streamed text
+    expect: opening characters to accept at top level ('{', '[' or '{[')
+    """
+
+    def __init__(self, expect='{['):
+        self.expect = expect
+        self.buffer = ''
+        self.pos = 0
+        self.start = None     # buffer index of the current candidate's opening bracket
+        self.stack = []       # open containers of the current candidate
+        self.in_string = False
+        self.escaped = False
+        self.item_start = None
+        self.item_depth = 0
+        self.items = []       # completed objects nested directly in an array
+        self.done = False
+        self.value = None
+        self.end = None       # buffer index just past the closing bracket
+
+    def feed(self, text):
+        """Consume more text; True once the top-level value is complete"""
+        if self.done:
+            return True
+        self.buffer += text
+
+        while self.pos < len(self.buffer):
+            char = self.buffer[self.pos]
+
+            if self.start is None:
+                if char in self.expect:
+                    self.start = self.pos
+                    self.stack = [char]
+            elif self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in '{[':
+                if char == '{' and self.stack[-1] == '[' and self.item_start is None:
+                    self.item_start = self.pos
+                    self.item_depth = len(self.stack)
+                self.stack.append(char)
+            elif char in '}]':
+                if (char == '}') != (self.stack[-1] == '{'):
+                    self._reject()
+                    continue
+                self.stack.pop()
+                if self.item_start is not None and len(self.stack) == self.item_depth:
+                    self._complete_item()
+                if not self.stack:
+                    self.pos += 1
+                    if self._complete():
+                        return True
+                    continue
+
+            self.pos += 1
+
+        return False
+
+    def take_items(self):
+        """Array items completed since the last call (e.g. each smart reply)"""
+        items, self.items = self.items, []
+        return items
+
+    def _complete_item(self):
+        try:
+            self.items.append(json.loads(self.buffer[self.item_start:self.pos + 1]))
+        except ValueError:
+            pass
+        self.item_start = None
+
+    def _complete(self):
+        try:
+            self.value = json.loads(self.buffer[self.start:self.pos])
+        except ValueError:
+            self._reject()
+            return False
+        self.done = True
+        self.end = self.pos
+        return True
+
+    def _reject(self):
+        """Not JSON after all: resume scanning after the candidate's opening bracket"""
+        self.pos = self.start + 1
+        self.start = None
+        self.stack = []
+        self.in_string = False
+        self.escaped = False
+        self.item_start = None
+
+
+def extract_json(text, expect='{['):
+    """
+    First top-level JSON object/array in a complete model answer
+    Raises ValueError when there is none (callers fall back as before)
+    """
+    extractor = JsonStreamExtractor(expect)
+    if not extractor.feed(text or ''):
+        raise ValueError("No JSON found in response")
+    return extractor.value
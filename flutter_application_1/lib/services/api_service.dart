@@ -11,6 +11,9 @@ class ApiService {
   factory ApiService() => _instance;
   ApiService._internal();
 
+  // Server cursor (messages stored) per synced conversation
+  final Map<String, int> _cursors = {};
+
   /// Summarize a chat conversation using NVIDIA Nemotron via backend
   Future<ReachlySummary> summarizeChat(String chatLog) async {
     try {
@@ -35,4 +38,88 @@ class ApiService {
       rethrow;
     }
   }
+
+  /// Upload only the messages added since the last sync
+  /// messages is the full local conversation, oldest first; returns the server cursor
+  Future<int> syncConversation({
+    required String conversationId,
+    required String contactName,
+    required List<Map<String, dynamic>> messages,
+  }) async {
+    var cursor = _cursors[conversationId] ?? 0;
+    for (var attempt = 0; attempt < 2; attempt++) {
+      final start = cursor <= messages.length ? cursor : messages.length;
+      final response = await http.post(
+        Uri.parse('$baseUrl/conversations/append'),
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: jsonEncode({
+          'conversation_id': conversationId,
+          'contact_name': contactName,
+          'cursor': start,
+          'messages': messages.sublist(start),
+        }),
+      ).timeout(const Duration(seconds: 30));
+
+      final data = jsonDecode(response.body);
+      if (response.statusCode == 200) {
+        cursor = data['cursor'];
+        _cursors[conversationId] = cursor;
+        return cursor;
+      } else if (response.statusCode == 409) {
+        // Server lost messages (restart): resend from its cursor
+        cursor = data['cursor'];
+      } else {
+        throw Exception('Server error: ${response.statusCode}');
+      }
+    }
+    throw Exception('Conversation sync failed');
+  }
+
+  /// Run all conversation-screen agents in one request
+  /// Returns {agent_name: {status, response}} from /agent/conversation_open
+  /// With conversationId, only new messages are uploaded (see syncConversation)
+  Future<Map<String, dynamic>> openConversation({
+    required String contactName,
+    required List<Map<String, dynamic>> messages,
+    List<String>? agents,
+    String? conversationId,
+    Map<String, dynamic> extra = const {},
+  }) async {
+    try {
+      if (conversationId != null) {
+        await syncConversation(
+          conversationId: conversationId,
+          contactName: contactName,
+          messages: messages,
+        );
+      }
+      final response = await http.post(
+        Uri.parse('$baseUrl/agent/conversation_open'),
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: jsonEncode({
+          'contact_name': contactName,
+          if (conversationId != null)
+            'conversation_id': conversationId
+          else
+            'messages': messages,
+          if (agents != null) 'agents': agents,
+          ...extra,
+        }),
+      ).timeout(const Duration(seconds: 60));
+
+      if (response.statusCode == 200) {
+        final data = jsonDecode(response.body);
+        return Map<String, dynamic>.from(data['results'] ?? {});
+      } else {
+        throw Exception('Server error: ${response.statusCode}');
+      }
+    } catch (e) {
+      print('API Error: $e');
+      rethrow;
+    }
+  }
 }
@@ -93,6 +93,50 @@ class ApiServicePro {
     }
   }
 
+  /// Streaming Ghostwriter: emits the message text as it is generated
+  Stream<String> writeMessageStream({
+    required String messageContent,
+    required List<String> writingSamples,
+  }) async* {
+    final client = http.Client();
+    try {
+      final request = http.Request('POST', Uri.parse('$baseUrl/write_message/stream'))
+        ..headers['Content-Type'] = 'application/json'
+        ..body = jsonEncode({
+          'message': messageContent,
+          'writing_samples': writingSamples,
+        });
+
+      final response = await client.send(request).timeout(const Duration(seconds: 30));
+      if (response.statusCode != 200) {
+        throw Exception('Writing error: ${response.statusCode}');
+      }
+
+      var text = '';
+      String? event;
+      await for (final line in response.stream
+          .transform(utf8.decoder)
+          .transform(const LineSplitter())) {
+        if (line.startsWith('event:')) {
+          event = line.substring(6).trim();
+        } else if (line.startsWith('data:')) {
+          final data = jsonDecode(line.substring(5));
+          if (event == 'token') {
+            text += data['text'];
+            yield text;
+          } else if (event == 'done') {
+            yield data['message'];
+          }
+        }
+      }
+    } catch (e) {
+      print('Ghostwriter Error: $e');
+      rethrow;
+    } finally {
+      client.close();
+    }
+  }
+
   /// 🔍 AGENT 4: Scout Social Agent - Multi-Modal Analysis
   /// Uses: Scout VLM NIM (Llama 3.1 Nemotron Nano VL)
   Future<SocialTouchpoint> analyzeSocial({
@@ -150,42 +150,62 @@ class NotificationService {
   }
 
   // Check all conversations for follow-ups
+  // The server schedules every contact's next follow-up from its texting
+  // pattern; sync the contacts once and show the ones that have come due
   static Future<void> checkAllConversationsForFollowUps() async {
-    final prefs = await SharedPreferences.getInstance();
     final conversations = MockDataService.getMockConversations();
-    
-    for (final conversation in conversations) {
-      // Get last message time from preferences
-      final lastCheckKey = 'last_check_${conversation.contactName}';
-      final lastCheck = prefs.getInt(lastCheckKey) ?? 0;
-      final hoursSince = (DateTime.now().millisecondsSinceEpoch - lastCheck) ~/ (1000 * 60 * 60);
-      
-      // Skip if checked recently (within 12 hours)
-      if (hoursSince < 12) continue;
-      
-      // Get AI prediction
-      final prediction = await predictFollowUp(
-        contactName: conversation.contactName,
-        chatLog: conversation.getFullChatLog(),
-        lastMessage: conversation.lastMessage,
-        hoursSinceMessage: hoursSince,
+
+    try {
+      await http.post(
+        Uri.parse('$baseUrl/notifications/contacts'),
+        headers: {'Content-Type': 'application/json'},
+        body: jsonEncode({
+          'contacts': conversations.map(_notificationContact).toList(),
+        }),
       );
 
-      // Show notification if AI suggests follow-up
-      if (prediction['should_follow_up'] == true) {
+      final response = await http.post(
+        Uri.parse('$baseUrl/notifications/pending'),
+        headers: {'Content-Type': 'application/json'},
+        body: jsonEncode({}),
+      );
+      if (response.statusCode != 200) return;
+
+      final data = jsonDecode(response.body);
+      for (final notification in data['notifications'] ?? []) {
+        final days = (notification['days_since_last_message'] ?? 0) as num;
         await showFollowUpNotification(
-          contactName: conversation.contactName,
-          lastMessage: conversation.lastMessage,
-          hoursSinceMessage: hoursSince,
-          suggestedReply: prediction['suggested_message'],
+          contactName: notification['contact_name'],
+          lastMessage: notification['notification_message'] ?? '',
+          hoursSinceMessage: (days * 24).round(),
+          suggestedReply:
+              '${notification['notification_message']}\n💡 ${notification['suggested_action']}',
         );
-        
-        // Update last check time
-        await prefs.setInt(lastCheckKey, DateTime.now().millisecondsSinceEpoch);
       }
+    } catch (e) {
+      print('Error checking follow-ups: $e');
     }
   }
 
+  // What the notification scheduler needs to know about a conversation
+  static Map<String, dynamic> _notificationContact(Conversation conversation) {
+    final messages = conversation.messages;
+    double messagesPerWeek = 0;
+    if (messages.isNotEmpty) {
+      final spanDays = messages.last.timestamp.difference(messages.first.timestamp).inHours / 24;
+      final spanWeeks = spanDays / 7 < 1 ? 1 : spanDays / 7;
+      messagesPerWeek = messages.length / spanWeeks;
+    }
+
+    return {
+      'contact_id': conversation.id,
+      'contact_name': conversation.contactName,
+      'last_message_at': conversation.lastMessageTime.toUtc().toIso8601String(),
+      'last_message_from': messages.isNotEmpty && messages.last.isUser ? 'me' : 'them',
+      'avg_messages_per_week': messagesPerWeek,
+    };
+  }
+
   // Manual check for a specific conversation
   static Future<void> checkConversationForFollowUp(Conversation conversation) async {
     final prefs = await SharedPreferences.getInstance();
@@ -38,34 +38,51 @@ class _SmartReplyWidgetState extends State<SmartReplyWidget> {
   }
 
   Future<void> _loadSmartReplies() async {
+    // Streamed: each suggestion is shown as soon as the model finishes it
+    final client = http.Client();
     try {
-      final response = await http.post(
-        Uri.parse('http://localhost:5000/agent/smart_reply'),
-        headers: {'Content-Type': 'application/json'},
-        body: json.encode({
+      final request = http.Request(
+        'POST',
+        Uri.parse('http://localhost:5000/agent/smart_reply/stream'),
+      )
+        ..headers['Content-Type'] = 'application/json'
+        ..body = json.encode({
           'contact_name': widget.contactName,
           'last_message': widget.lastMessage,
           'conversation_history': widget.conversationHistory,
           'user_name': 'Heet',
-        }),
-      ).timeout(const Duration(seconds: 5));
+        });
+
+      final response = await client.send(request).timeout(const Duration(seconds: 5));
 
       if (response.statusCode == 200) {
-        final data = json.decode(response.body);
-        if (mounted && data['success'] == true) {
-          setState(() {
-            _replies = List<Map<String, dynamic>>.from(data['replies']);
-            _isLoading = false;
-          });
-          return;
+        String? event;
+        await for (final line in response.stream
+            .transform(utf8.decoder)
+            .transform(const LineSplitter())
+            .timeout(const Duration(seconds: 5))) {
+          if (line.startsWith('event:')) {
+            event = line.substring(6).trim();
+          } else if (line.startsWith('data:') && event == 'reply') {
+            final reply = Map<String, dynamic>.from(json.decode(line.substring(5)));
+            if (mounted) {
+              setState(() {
+                _replies = [..._replies, reply];
+                _isLoading = false;
+              });
+            }
+          }
         }
+        if (_replies.isNotEmpty) return;
       }
     } catch (e) {
       print('Smart reply error: $e');
+    } finally {
+      client.close();
     }
     
     // INTELLIGENT FALLBACK based on conversation context
-    if (mounted) {
+    if (mounted && _replies.isEmpty) {
       setState(() {
         _replies = _generateContextualReplies();
         _isLoading = false;
@@ -0,0 +1,224 @@
+"""
+Atlas Adaptive Concurrency Limiter
+One limiter per model upstream, learning how many concurrent generations it
+can take before latency or errors blow up (AIMD on a latency signal):
+
+- every answer within LIMITER_LATENCY_TOLERANCE x the long-run latency
+  baseline grows the limit by 1/limit (about +1 per limit's worth of calls)
+- an error, a 429 or a slow answer shrinks it by LIMITER_BACKOFF
+- calls over the limit wait in a priority queue (bounded by size and time)
+  and are shed with LimitExceeded when it is full or they waited too long
+
+So excess load queues here instead of inside the Brev NIM or as 429s from
+the hosted API. Threads (Flask mode) and coroutines (ASGI mode) share the
+same slots and queue.
+
+Queued calls are served by priority class (interactive > default >
+background), so voice booking and smart replies jump ahead of forecasts
+and insights when the upstream is saturated. Waiting ages a call up one
+class every LIMITER_PRIORITY_AGING seconds, so background work is delayed
+but never starved. A full queue sheds its lowest-priority waiter to make
+room for a more urgent call.
+"""
+
+import asyncio
+import os
+import threading
+import time
+
+
+LIMITER_ENABLED = os.environ.get('LLM_LIMITER', '1') != '0'
+LIMITER_INITIAL = float(os.environ.get('LIMITER_INITIAL', 8))
+LIMITER_MIN = float(os.environ.get('LIMITER_MIN', 1))
+LIMITER_MAX = float(os.environ.get('LIMITER_MAX', 64))
+LIMITER_BACKOFF = float(os.environ.get('LIMITER_BACKOFF', 0.9))
+LIMITER_LATENCY_TOLERANCE = float(os.environ.get('LIMITER_LATENCY_TOLERANCE', 2.0))
+LIMITER_MAX_QUEUE = int(os.environ.get('LIMITER_MAX_QUEUE', 64))
+LIMITER_QUEUE_TIMEOUT = float(os.environ.get('LIMITER_QUEUE_TIMEOUT', 10))  # seconds
+
+LIMITER_PRIORITY_AGING = float(os.environ.get('LIMITER_PRIORITY_AGING', 2))  # seconds of waiting per class
+
+BASELINE_ALPHA = 0.05  # EWMA weight of the long-run latency baseline
+
+# Lower rank is served first
+PRIORITY_CLASSES = {'interactive': 0, 'default': 1, 'background': 2}
+
+
+class LimitExceeded(Exception):
+    """Call shed by the limiter (queue full or queued too long)"""
+
+
+class _Waiter:
+    """A queued call; woken once it was handed a slot (granted) or shed"""
+
+    def __init__(self, priority='default', loop=None):
+        self.priority = priority if priority in PRIORITY_CLASSES else 'default'
+        self.rank = PRIORITY_CLASSES[self.priority]
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.loop = loop
+        if loop is None:
+            self.event = threading.Event()
+        else:
+            self.future = loop.create_future()
+
+    def effective_rank(self, now):
+        """Class rank, improved by one class per LIMITER_PRIORITY_AGING seconds waited"""
+        return self.rank - (now - self.enqueued) / LIMITER_PRIORITY_AGING
+
+    def wake(self, granted=True):
+        self.granted = granted
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit with a bounded priority wait queue"""
+
+    def __init__(self, name, initial=LIMITER_INITIAL, min_limit=LIMITER_MIN, max_limit=LIMITER_MAX,
+                 max_queue=LIMITER_MAX_QUEUE, queue_timeout=LIMITER_QUEUE_TIMEOUT):
+        self.name = name
+        self.limit = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.waiters = []  # arrival order; served by effective rank
+        self.baseline = None
+        self.rejected = 0
+        self.timed_out = 0
+        self.displaced = 0
+        self.decreases = 0
+        self.served = {name: 0 for name in PRIORITY_CLASSES}
+
+    # -- acquiring a slot -----------------------------------------------------
+
+    def _try_acquire(self, waiter):
+        """Take a slot now (True) or queue waiter; callers hold self.lock"""
+        if self.in_flight < int(self.limit) and not self.waiters:
+            self.in_flight += 1
+            self.served[waiter.priority] += 1
+            return True
+        if len(self.waiters) >= self.max_queue:
+            now = time.monotonic()
+            lowest = max(self.waiters, key=lambda w: w.effective_rank(now))
+            if waiter.rank >= lowest.effective_rank(now):
+                self.rejected += 1
+                raise LimitExceeded(f"{self.name}: queue full ({len(self.waiters)} waiting)")
+            # Make room by shedding the least urgent queued call
+            self.waiters.remove(lowest)
+            self.displaced += 1
+            lowest.wake(granted=False)
+        self.waiters.append(waiter)
+        return False
+
+    def _abandon(self, waiter, timed_out=False):
+        """Drop a waiter that gave up; False if a slot was already handed to it"""
+        with self.lock:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+                self.timed_out += timed_out
+                return True
+            return False
+
+    def _check_granted(self, waiter):
+        if not waiter.granted:
+            raise LimitExceeded(f"{self.name}: shed for higher-priority work")
+
+    def acquire(self, priority='default'):
+        """Block until a slot is free (Flask mode)"""
+        if not LIMITER_ENABLED:
+            return
+        waiter = _Waiter(priority)
+        with self.lock:
+            if self._try_acquire(waiter):
+                return
+        if not waiter.event.wait(self.queue_timeout) and self._abandon(waiter, timed_out=True):
+            raise LimitExceeded(f"{self.name}: waited {self.queue_timeout:.0f}s for a slot")
+        self._check_granted(waiter)
+
+    async def acquire_async(self, priority='default'):
+        """Await a free slot (ASGI mode)"""
+        if not LIMITER_ENABLED:
+            return
+        waiter = _Waiter(priority, asyncio.get_running_loop())
+        with self.lock:
+            if self._try_acquire(waiter):
+                return
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if self._abandon(waiter, timed_out=True):
+                raise LimitExceeded(f"{self.name}: waited {self.queue_timeout:.0f}s for a slot")
+        except asyncio.CancelledError:
+            if not self._abandon(waiter) and waiter.granted:
+                self.release()  # slot arrived as we were cancelled: pass it on
+            raise
+        self._check_granted(waiter)
+
+    # -- releasing a slot -----------------------------------------------------
+
+    def release(self, latency=None, overloaded=False):
+        """
+        Free the slot and learn from the call
+        latency: seconds, or None when there's nothing to learn (e.g. cancelled)
+        overloaded: the upstream errored, timed out or returned 429
+        """
+        if not LIMITER_ENABLED:
+            return
+        with self.lock:
+            if latency is not None:
+                self._update_limit(latency, overloaded)
+            self.in_flight -= 1
+            # Hand freed slots straight to the most urgent queued calls
+            now = time.monotonic()
+            while self.waiters and self.in_flight < int(self.limit):
+                waiter = min(self.waiters, key=lambda w: w.effective_rank(now))
+                self.waiters.remove(waiter)
+                self.in_flight += 1
+                self.served[waiter.priority] += 1
+                waiter.wake()
+
+    def _update_limit(self, latency, overloaded):
+        if self.baseline is None:
+            self.baseline = latency
+        slow = latency > self.baseline * LIMITER_LATENCY_TOLERANCE
+        if not overloaded:
+            self.baseline += BASELINE_ALPHA * (latency - self.baseline)
+
+        if overloaded or slow:
+            new_limit = max(self.min_limit, self.limit * LIMITER_BACKOFF)
+            if int(new_limit) < int(self.limit):
+                print(f"[LIMITER] {self.name}: limit {int(self.limit)} -> {int(new_limit)} "
+                      f"({'error' if overloaded else f'slow {latency:.1f}s'})")
+            self.limit = new_limit
+            self.decreases += 1
+        elif self.in_flight * 2 >= self.limit:
+            # Only grow while the limit is actually being used
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'enabled': LIMITER_ENABLED,
+                'limit': int(self.limit),
+                'in_flight': self.in_flight,
+                'queue_depth': len(self.waiters),
+                'queued_by_priority': {
+                    name: sum(1 for w in self.waiters if w.priority == name) for name in PRIORITY_CLASSES
+                },
+                'served_by_priority': dict(self.served),
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'displaced': self.displaced,
+                'decreases': self.decreases,
+                'latency_baseline': round(self.baseline, 3) if self.baseline is not None else None
+            }
@@ -0,0 +1,180 @@
+"""
+Atlas LLM Response Cache
+Content-addressed cache for chat completions, keyed by a canonical hash of
+(model, messages, temperature, max_tokens) plus any guided-decoding schema
+
+- In-memory LRU with per-entry TTL, bounded by entry count and bytes
+- Optional SQLite backend (LLM_CACHE_PATH) so entries survive restarts
+- Hit / miss / eviction counters for /metrics
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+CACHE_ENABLED = os.environ.get('LLM_CACHE', '1') != '0'
+CACHE_MAX_ENTRIES = int(os.environ.get('LLM_CACHE_MAX_ENTRIES', 1000))
+CACHE_MAX_BYTES = int(os.environ.get('LLM_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+CACHE_DEFAULT_TTL = float(os.environ.get('LLM_CACHE_DEFAULT_TTL', 600))
+
+# Set to a file path (e.g. /tmp/atlas_llm_cache.db) to persist across restarts
+CACHE_PATH = os.environ.get('LLM_CACHE_PATH', '')
+
+KEY_FIELDS = ('model', 'messages', 'temperature', 'max_tokens', 'nvext', 'response_format')
+
+
+def make_key(payload):
+    """Canonical sha256 of the fields that determine a completion"""
+    canonical = json.dumps(
+        {field: payload.get(field) for field in KEY_FIELDS},
+        sort_keys=True,
+        separators=(',', ':'),
+        ensure_ascii=False
+    )
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+# ============================================================================
+# PERSISTENT BACKEND
+# ============================================================================
+
+class SqliteBackend:
+    """Write-through store behind the memory LRU"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self.conn.execute("DELETE FROM llm_cache WHERE expires_at < ?", (time.time(),))
+        self.conn.commit()
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row and row[1] > time.time():
+            return row[0], row[1]
+        return None
+
+    def set(self, key, value, expires_at):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at)
+            )
+            self.conn.commit()
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM llm_cache")
+            self.conn.commit()
+
+
+# ============================================================================
+# RESPONSE CACHE
+# ============================================================================
+
+class ResponseCache:
+    """Thread-safe LRU + TTL cache of completion results"""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES, backend=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.backend = backend
+        self.entries = OrderedDict()  # key -> (expires_at, serialized value)
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.persistent_hits = 0
+
+    def get(self, key):
+        """Cached result for key, or None (a fresh copy each time)"""
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry:
+                if entry[0] > now:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return json.loads(entry[1])
+                self._drop(key)
+
+        stored = self.backend.get(key) if self.backend else None
+        with self.lock:
+            if stored:
+                value, expires_at = stored
+                self._store(key, value, expires_at)
+                self.hits += 1
+                self.persistent_hits += 1
+                return json.loads(value)
+            self.misses += 1
+            return None
+
+    def set(self, key, result, ttl=CACHE_DEFAULT_TTL):
+        if ttl <= 0:
+            return
+        value = json.dumps(result)
+        expires_at = time.time() + ttl
+        with self.lock:
+            self._store(key, value, expires_at)
+        if self.backend:
+            self.backend.set(key, value, expires_at)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+        if self.backend:
+            self.backend.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': CACHE_ENABLED,
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+                'persistent': self.backend.path if self.backend else None,
+                'persistent_hits': self.persistent_hits
+            }
+
+    # Callers hold self.lock for the helpers below
+
+    def _store(self, key, value, expires_at):
+        if key in self.entries:
+            self._drop(key)
+        self.entries[key] = (expires_at, value)
+        self.bytes += len(value)
+        while self.entries and (len(self.entries) > self.max_entries or self.bytes > self.max_bytes):
+            oldest = next(iter(self.entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def _drop(self, key):
+        _, value = self.entries.pop(key)
+        self.bytes -= len(value)
+
+
+response_cache = ResponseCache(backend=SqliteBackend(CACHE_PATH) if CACHE_PATH else None)
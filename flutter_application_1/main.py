@@ -7,7 +7,8 @@ and ElevenLabs for voice synthesis
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 import os
-import requests
+
+import upstream
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for Flutter web app
@@ -115,7 +116,7 @@ Provide your analysis in this exact JSON format:
             "max_tokens": 500
         }
         
-        response = requests.post(NVIDIA_API_URL, json=payload, headers=headers, timeout=30)
+        response = upstream.post(NVIDIA_API_URL, json=payload, headers=headers, timeout=30)
         
         if response.status_code == 200:
             result = response.json()
@@ -161,7 +162,7 @@ def generate_audio_summary(text):
         }
         
         url = f"{ELEVENLABS_API_URL}/{ELEVENLABS_VOICE_ID}"
-        response = requests.post(url, json=payload, headers=headers, timeout=30)
+        response = upstream.post(url, json=payload, headers=headers, timeout=30)
         
         if response.status_code == 200:
             # Save audio file or upload to storage
@@ -3,13 +3,48 @@ Atlas Auto-Agent System with ElevenLabs Voice Integration
 Fully automated multi-agent system that works seamlessly in the background
 """
 
-from flask import Flask, request, jsonify, make_response
+from flask import Flask, Response, request, jsonify, make_response
 from flask_cors import CORS
 import os
-import requests
+import sys
 import json
+import math
+import asyncio
+import inspect
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
 from datetime import datetime, timedelta
 
+import upstream
+from llm_cache import response_cache, make_key, CACHE_ENABLED, CACHE_DEFAULT_TTL
+from singleflight import ai_flights, async_ai_flights
+import singleflight
+from circuit_breaker import CircuitBreaker, HealthProber
+import hedging
+from limiter import AdaptiveLimiter, LimitExceeded
+import streaming
+from json_stream import JsonStreamExtractor, extract_json
+import schemas
+import prompts
+import context_budget
+from context_budget import CONTEXT_DEFAULT_BUDGET
+from summaries import RollingSummaries
+import summaries
+from conversations import conversation_store, CursorAhead
+import transcript as transcripts
+import date_extract
+import sentiment
+import health_score
+import forecast
+import conversation_stats
+import intent_gate
+import notifications
+from notifications import NotificationScheduler
+from transcript import history_lines, TRANSCRIPT_KEY
+import features as contact_features
+from features import FEATURES_KEY, feature_store
+
 app = Flask(__name__)
 
 # Simple CORS - allow everything
@@ -44,6 +79,10 @@ def after_request(response):
 BREV_SERVER = os.environ.get('BREV_SERVER_URL', 'http://localhost')
 ORCHESTRATOR_URL = f"{BREV_SERVER}:8001/v1/chat/completions"
 SCOUT_VLM_URL = f"{BREV_SERVER}:8002/v1/chat/completions"
+BREV_CONFIGURED = BREV_SERVER != 'http://localhost'
+
+# NVIDIA hosted API (always available, used when Brev is off or unhealthy)
+NVIDIA_API_URL = "https://integrate.api.nvidia.com/v1/chat/completions"
 
 # API Keys
 NVIDIA_API_KEY = os.environ.get('NVIDIA_API_KEY', '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')
@@ -59,70 +98,521 @@ ELEVENLABS_VOICE_ID = "21m00Tcm4TlvDq8ikWAM"  # Rachel voice - natural and profe
 ORCHESTRATOR_MODEL = "nvidia/nemotron-4-340b-instruct"  # For Brev server
 FALLBACK_MODEL = "meta/llama-3.1-8b-instruct"  # For NVIDIA API direct
 
+# Response cache TTL (seconds) per agent; 0 disables caching for that agent.
+# History-derived agents change slowly, so an unchanged conversation can be
+# answered from cache; voice commands are one-off and never cached.
+AGENT_CACHE_TTLS = {
+    'key_dates_agent': 6 * 3600,
+    'conversation_insights_agent': 3600,
+    'relationship_forecast_agent': 3600,
+    'agent_relationship_health': 1800,
+    'agent_context_recall': 1800,
+    'agent_sentiment_analysis': 1800,
+    'conversation_starter_agent': 900,
+    'agent_smart_reply': 300,
+    'agent_smart_reply_stream': 300,
+    'voice_book_meeting': 0,
+}
+
+# Due follow-up notifications are queued for /notifications/pending and, when
+# set, also POSTed to this URL (e.g. a push gateway)
+NOTIFICATION_WEBHOOK_URL = os.environ.get('NOTIFICATION_WEBHOOK_URL', '')
+# Have the model word due notifications (rule-based wording otherwise)
+NOTIFICATION_PHRASING = os.environ.get('NOTIFICATION_PHRASING', '1') != '0'
+
+# Circuit breaker per model upstream; 'brev' only when a Brev server is configured
+BREAKERS = {'nvidia': CircuitBreaker('nvidia')}
+if BREV_CONFIGURED:
+    BREAKERS = {'brev': CircuitBreaker('brev'), **BREAKERS}
+
+# Adaptive concurrency limit per model upstream (learned from latency / errors)
+LIMITERS = {name: AdaptiveLimiter(name) for name in BREAKERS}
+
+# Scheduling class per agent when an upstream's concurrency limit is saturated:
+# interactive calls jump the queue, background ones can wait a few seconds.
+# Agents not listed are 'default'.
+AGENT_PRIORITIES = {
+    'voice_book_meeting': 'interactive',
+    'agent_smart_reply': 'interactive',
+    'agent_smart_reply_stream': 'interactive',
+    'relationship_forecast_agent': 'background',
+    'conversation_insights_agent': 'background',
+    'key_dates_agent': 'background',
+    'rolling_summary': 'background',
+    'rolling_summary_merge': 'background',
+    'agent_smart_notifications': 'background',
+}
+
+# Interactive agents whose model calls are hedged to the other upstream when
+# the primary runs past its recent p95 (needs LLM_HEDGE=1 and a Brev server)
+HEDGED_AGENTS = {'voice_book_meeting', 'agent_smart_reply'}
+
+# Token budget for the conversation history in each agent's prompt, filled
+# from the newest message backwards (CONTEXT_DEFAULT_BUDGET if not listed)
+AGENT_CONTEXT_BUDGETS = {
+    'voice_book_meeting': 200,
+    'agent_smart_notifications': 200,
+    'agent_relationship_health': 500,
+    'auto_book_meeting': 500,
+    'agent_sentiment_analysis': 600,
+    'key_dates_agent': 800,
+    'relationship_forecast_agent': 800,
+    'agent_smart_reply': 1000,
+    'agent_smart_reply_stream': 1000,
+    'conversation_starter_agent': 1000,
+    'conversation_insights_agent': 600,  # plus the stats (conversation_stats.py) instead of the whole log
+}
+
+# Most tokens of messages / summaries fed to one rolling-summary call
+SUMMARY_INPUT_BUDGET = int(os.environ.get('SUMMARY_INPUT_BUDGET', 3000))
+
+# Structured output for agents with a schema in schemas.AGENT_SCHEMAS:
+# 'nvext' (NIM guided_json), 'response_format' (OpenAI json_schema) or 'off'.
+# An upstream that rejects the parameters is remembered and sent plain requests.
+GUIDED_DECODING = os.environ.get('GUIDED_DECODING', 'nvext')
+GUIDED_UNSUPPORTED = set()  # upstream names
+
+# Threads used to fan out agents in Flask mode (/agent/conversation_open)
+FAN_OUT_POOL = ThreadPoolExecutor(max_workers=int(os.environ.get('FAN_OUT_WORKERS', 16)))
+
 
 # ============================================================================
 # CORE AI ENGINE
 # ============================================================================
 
-def call_ai(system_prompt, user_prompt, use_brev=True):
+def choose_upstream(use_brev=True):
+    """
+    Preferred upstream ('brev' or 'nvidia') unless its circuit is open,
+    in which case fail over to the other one. None if every circuit is open.
+    """
+    preferred = 'brev' if use_brev and BREV_CONFIGURED else 'nvidia'
+    candidates = [preferred] + [name for name in BREAKERS if name != preferred]
+    
+    for name in candidates:
+        if BREAKERS[name].allow_request():
+            if name != preferred:
+                print(f"[AI] {preferred} circuit open, failing over to {name}")
+            return name
+    return None
+
+
+def guided_params(schema):
+    """Request fields that constrain decoding to a JSON schema"""
+    if GUIDED_DECODING == 'response_format':
+        return {'response_format': {
+            'type': 'json_schema',
+            'json_schema': {'name': 'agent_output', 'schema': schema}
+        }}
+    return {'nvext': {'guided_json': schema}}
+
+
+def without_guided_params(payload):
+    return {k: v for k, v in payload.items() if k not in ('nvext', 'response_format')}
+
+
+def build_ai_request(system_prompt, user_prompt, target='nvidia', schema=None):
+    """
+    Build the chat completion request for the chosen upstream
+    Shared by call_ai (Flask mode) and call_ai_async (ASGI mode)
+    schema: JSON schema the answer must follow (guided decoding)
+    """
+    if target == 'brev':
+        url = ORCHESTRATOR_URL
+        model = ORCHESTRATOR_MODEL
+        print(f"[AI] Using Brev server: {url}")
+        print(f"[AI] Model: {model}")
+    else:
+        # Direct NVIDIA API
+        url = NVIDIA_API_URL
+        model = FALLBACK_MODEL  # Use working model
+        print(f"[AI] Using NVIDIA API: {url}")
+        print(f"[AI] Model: {model}")
+    
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {NVIDIA_API_KEY}"
+    }
+    
+    payload = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        "temperature": 0.7,
+        "max_tokens": 1000
+    }
+    if schema and GUIDED_DECODING != 'off' and target not in GUIDED_UNSUPPORTED:
+        payload.update(guided_params(schema))
+    
+    print(f"[AI] Calling AI with model: {model}")
+    print(f"[AI] Payload preview: {str(payload)[:200]}...")
+    
+    return url, headers, payload
+
+
+def is_overloaded(status_code):
+    return status_code >= 500 or status_code == 429
+
+
+def record_upstream_result(target, status_code, latency):
+    """Feed the upstream's circuit breaker: 5xx / 429 / slow answers count as failures"""
+    if is_overloaded(status_code):
+        BREAKERS[target].record_failure(f"HTTP {status_code}")
+    else:
+        BREAKERS[target].record_success(latency)
+
+
+def probe_completion(target):
+    """A one-token completion: the prober times it against the breaker's latency threshold"""
+    url, headers, payload = build_ai_request('Reply with OK.', 'OK', target=target)
+    response = upstream.post(url, json={**payload, 'max_tokens': 1},
+                             headers=headers, timeout=BREAKERS[target].latency_threshold)
+    return response.status_code == 200
+
+
+def probe_brev(completion=False):
+    """Brev NIM is healthy once it lists its models (503 while still loading)"""
+    if completion:
+        return probe_completion('brev')
+    response = upstream.get(f"{BREV_SERVER}:8001/v1/models", timeout=5)
+    return response.status_code == 200
+
+
+def probe_nvidia(completion=False):
+    if completion:
+        return probe_completion('nvidia')
+    response = upstream.get(
+        NVIDIA_API_URL.replace('/chat/completions', '/models'),
+        headers={"Authorization": f"Bearer {NVIDIA_API_KEY}"},
+        timeout=5
+    )
+    return response.status_code == 200
+
+
+health_prober = HealthProber({
+    name: (breaker, probe_brev if name == 'brev' else probe_nvidia)
+    for name, breaker in BREAKERS.items()
+})
+
+
+def read_ai_response(response):
+    """Return the parsed completion, or None on a non-200 answer"""
+    print(f"[AI] Response status: {response.status_code}")
+    
+    if response.status_code == 200:
+        print(f"[AI] SUCCESS: AI response received")
+        result = response.json()
+        print(f"[AI] Response preview: {str(result)[:200]}...")
+        return result
+    else:
+        print(f"[AI] ERROR: {response.status_code}")
+        print(f"[AI] Response: {response.text[:500]}")
+        return None
+
+
+def hedge_target(primary, agent, hedge=None):
+    """Upstream to hedge this call to, or None when the call isn't hedged"""
+    if hedge is None:
+        hedge = hedging.HEDGE_ENABLED and agent in HEDGED_AGENTS
+    if not hedge:
+        return None
+    for name in BREAKERS:
+        if name != primary and BREAKERS[name].allow_request():
+            return name
+    return None
+
+
+def completion_from_text(content):
+    """Wrap streamed text in the shape of a non-streamed completion (for the cache)"""
+    return {'choices': [{'message': {'role': 'assistant', 'content': content}}]}
+
+
+def completion_until_json(deltas):
+    """
+    Assemble a streamed completion, stopping as soon as the first top-level
+    JSON value is closed. Whatever the model would have written after it is
+    never generated; the kept text ends at the closing bracket.
+    """
+    extractor = JsonStreamExtractor()
+    parts = []
+    for delta in deltas:
+        parts.append(delta)
+        if extractor.feed(delta):
+            print(f"[AI] JSON complete after {len(extractor.buffer)} chars, stopping generation")
+            return completion_from_text(extractor.buffer[:extractor.end])
+    return completion_from_text(''.join(parts))
+
+
+async def completion_until_json_async(deltas):
+    extractor = JsonStreamExtractor()
+    parts = []
+    async for delta in deltas:
+        parts.append(delta)
+        if extractor.feed(delta):
+            print(f"[AI] JSON complete after {len(extractor.buffer)} chars, stopping generation")
+            return completion_from_text(extractor.buffer[:extractor.end])
+    return completion_from_text(''.join(parts))
+
+
+def stream_ai_response(url, headers, payload, stop_at_json=True, attempt=None):
+    """
+    (status_code, completion) of a stream: true request, cut off after its JSON
+    attempt: hedging.Attempt; reading stops (hedging.Cancelled) once it has lost
+    """
+    lines = upstream.stream_lines(url, headers=headers, json={**payload, 'stream': True}, timeout=30)
+    deltas = streaming.chat_deltas(lines)
+    if attempt is not None:
+        deltas = attempt.watch(deltas)
+    try:
+        if stop_at_json:
+            return 200, completion_until_json(deltas)
+        return 200, completion_from_text(''.join(deltas))
+    except upstream.StatusError as e:
+        print(f"[AI] ERROR: {e.status_code}")
+        print(f"[AI] Response: {e.text[:500]}")
+        return e.status_code, None
+    finally:
+        lines.close()  # drops the connection, so the NIM stops generating
+
+
+async def stream_ai_response_async(url, headers, payload):
+    lines = upstream.async_stream_lines(url, headers=headers, json={**payload, 'stream': True}, timeout=30)
+    try:
+        return 200, await completion_until_json_async(streaming.chat_deltas_async(lines))
+    except upstream.StatusError as e:
+        print(f"[AI] ERROR: {e.status_code}")
+        print(f"[AI] Response: {e.text[:500]}")
+        return e.status_code, None
+    finally:
+        await lines.aclose()
+
+
+def send_ai_request(url, headers, payload, stop_at_json=False, attempt=None):
+    """
+    (status_code, completion) of one HTTP request to the model
+    Hedged calls (attempt) are streamed, so a loser can stop mid-answer
+    """
+    if stop_at_json or attempt is not None:
+        return stream_ai_response(url, headers, payload, stop_at_json, attempt)
+    response = upstream.post(
+        url,
+        headers=headers,
+        json=payload,
+        timeout=30
+    )
+    return response.status_code, read_ai_response(response)
+
+
+async def send_ai_request_async(url, headers, payload, stop_at_json=False):
+    if stop_at_json:
+        return await stream_ai_response_async(url, headers, payload)
+    response = await upstream.async_post(
+        url,
+        headers=headers,
+        json=payload,
+        timeout=30
+    )
+    return response.status_code, read_ai_response(response)
+
+
+def rejects_guided_params(target, status_code, payload):
+    """
+    True when the upstream refused the request over its guided-decoding
+    parameters; it is sent plain requests from now on and this one is
+    retried once without them, in the same concurrency slot
+    """
+    if status_code not in (400, 422) or payload == without_guided_params(payload):
+        return False
+    GUIDED_UNSUPPORTED.add(target)
+    print(f"[AI] {target} rejected guided decoding ({status_code}), retrying without it")
+    return True
+
+
+def post_ai(target, ai_request, priority='default', stop_at_json=False, attempt=None):
+    """
+    Send one built request to one upstream
+    Waits for a concurrency slot (served by priority); feeds the breaker,
+    limiter and latency window. stop_at_json streams the answer and stops
+    the generation once its JSON is complete.
+    attempt: hedging.Attempt of a hedged call; when it loses, its slot is
+    freed right away and the call stops at its next streamed chunk,
+    without feeding the breaker
+    """
+    url, headers, payload = ai_request
+    LIMITERS[target].acquire(priority)
+    release = attempt.once(LIMITERS[target].release) if attempt is not None else LIMITERS[target].release
+    started = time.monotonic()
+    overloaded = None  # stays None if the call is cancelled (hedge loser)
+    try:
+        if attempt is not None:
+            attempt.check()
+        status_code, result = send_ai_request(url, headers, payload, stop_at_json, attempt)
+        if rejects_guided_params(target, status_code, payload):
+            status_code, result = send_ai_request(url, headers, without_guided_params(payload), stop_at_json, attempt)
+        overloaded = is_overloaded(status_code)
+    except hedging.Cancelled:
+        raise
+    except Exception as e:
+        overloaded = True
+        BREAKERS[target].record_failure(e)
+        raise
+    finally:
+        elapsed = time.monotonic() - started
+        release(elapsed if overloaded is not None else None, overloaded)
+    record_upstream_result(target, status_code, elapsed)
+    if result is not None:
+        hedging.tracker(target).record(elapsed)
+    return result
+
+
+async def post_ai_async(target, ai_request, priority='default', stop_at_json=False):
+    url, headers, payload = ai_request
+    await LIMITERS[target].acquire_async(priority)
+    started = time.monotonic()
+    overloaded = None  # stays None if the call is cancelled (hedge loser)
+    try:
+        status_code, result = await send_ai_request_async(url, headers, payload, stop_at_json)
+        if rejects_guided_params(target, status_code, payload):
+            status_code, result = await send_ai_request_async(
+                url, headers, without_guided_params(payload), stop_at_json
+            )
+        overloaded = is_overloaded(status_code)
+    except Exception as e:
+        overloaded = True
+        BREAKERS[target].record_failure(e)
+        raise
+    finally:
+        elapsed = time.monotonic() - started
+        LIMITERS[target].release(elapsed if overloaded is not None else None, overloaded)
+    record_upstream_result(target, status_code, elapsed)
+    if result is not None:
+        hedging.tracker(target).record(elapsed)
+    return result
+
+
+def record_prompt_tokens(agent, payload):
+    """Count the prompt tokens of a request going upstream (cache misses only)"""
+    tokens = context_budget.count_messages(payload['messages'], payload['model'])
+    context_budget.record_prompt(agent or 'call_ai', tokens)
+
+
+def cache_ttl(agent):
+    return AGENT_CACHE_TTLS.get(agent, CACHE_DEFAULT_TTL) if CACHE_ENABLED else 0
+
+
+def cached_ai_response(agent, key):
+    """Cached result for this request key, or None"""
+    if cache_ttl(agent) <= 0:
+        return None
+    result = response_cache.get(key)
+    if result is not None:
+        print(f"[CACHE] HIT {agent or 'call_ai'} ({key[:12]})")
+    return result
+
+
+def cache_ai_response(agent, key, result):
+    if result is not None and cache_ttl(agent) > 0:
+        response_cache.set(key, result, cache_ttl(agent))
+
+
+def call_ai(system_prompt, user_prompt, use_brev=True, agent=None, hedge=None, priority=None,
+            stop_at_json=False, schema=None):
     """
     Unified AI calling function
     Use Brev server if available, fallback to direct API
+    agent: calling flow name, selects the response cache TTL
+    hedge: race the other upstream after the hedge delay
+           (default: LLM_HEDGE=1 and agent in HEDGED_AGENTS)
+    priority: 'interactive' | 'default' | 'background' (default: AGENT_PRIORITIES)
+    stop_at_json: stream the answer and stop generating once its JSON is closed
+    schema: JSON schema sent as guided-decoding parameters
     """
     try:
-        # Choose endpoint - PREFER Brev server
-        if use_brev and BREV_SERVER != 'http://localhost':
-            url = ORCHESTRATOR_URL
-            model = ORCHESTRATOR_MODEL
-            print(f"[AI] Using Brev server: {url}")
-            print(f"[AI] Model: {model}")
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {NVIDIA_API_KEY}"
-            }
-        else:
-            # Fallback to direct NVIDIA API
-            url = "https://integrate.api.nvidia.com/v1/chat/completions"
-            model = FALLBACK_MODEL  # Use working model
-            print(f"[AI] Using NVIDIA API: {url}")
-            print(f"[AI] Model: {model}")
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {NVIDIA_API_KEY}"
-            }
+        target = choose_upstream(use_brev)
+        if target is None:
+            print("[AI] All upstream circuits open, skipping model call")
+            return None
         
-        payload = {
-            "model": model,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            "temperature": 0.7,
-            "max_tokens": 1000
-        }
+        ai_request = build_ai_request(system_prompt, user_prompt, target, schema)
+        key = make_key(ai_request[2])
         
-        print(f"[AI] Calling AI with model: {ORCHESTRATOR_MODEL}")
-        print(f"[AI] Payload preview: {str(payload)[:200]}...")
+        result = cached_ai_response(agent, key)
+        if result is not None:
+            return result
         
-        response = requests.post(
-            url,
-            headers=headers,
-            json=payload,
-            timeout=30
-        )
+        secondary = hedge_target(target, agent, hedge)
+        priority = priority or AGENT_PRIORITIES.get(agent, 'default')
+        
+        def fetch():
+            record_prompt_tokens(agent, ai_request[2])
+            if secondary:
+                result = hedging.hedged_call(
+                    lambda attempt: post_ai(target, ai_request, priority, stop_at_json, attempt),
+                    lambda attempt: post_ai(secondary, build_ai_request(system_prompt, user_prompt, secondary, schema),
+                                            priority, stop_at_json, attempt),
+                    hedging.tracker(target).hedge_delay()
+                )
+            else:
+                result = post_ai(target, ai_request, priority, stop_at_json)
+            cache_ai_response(agent, key, result)
+            return result
+        
+        # Identical prompts already in flight share that call
+        return ai_flights.do(key, fetch)
+            
+    except LimitExceeded as e:
+        print(f"[AI] Shed by concurrency limiter: {e}")
+        return None
+    except Exception as e:
+        print(f"[AI] EXCEPTION: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+
+async def call_ai_async(system_prompt, user_prompt, use_brev=True, agent=None, hedge=None, priority=None,
+                        stop_at_json=False, schema=None):
+    """
+    call_ai for the ASGI gateway
+    Awaits the upstream instead of blocking a thread while the model generates
+    """
+    try:
+        target = choose_upstream(use_brev)
+        if target is None:
+            print("[AI] All upstream circuits open, skipping model call")
+            return None
         
-        print(f"[AI] Response status: {response.status_code}")
+        ai_request = build_ai_request(system_prompt, user_prompt, target, schema)
+        key = make_key(ai_request[2])
         
-        if response.status_code == 200:
-            print(f"[AI] SUCCESS: AI response received")
-            result = response.json()
-            print(f"[AI] Response preview: {str(result)[:200]}...")
+        # Cache (SQLite) and token counting block: worker thread
+        result = await asyncio.to_thread(cached_ai_response, agent, key)
+        if result is not None:
             return result
-        else:
-            print(f"[AI] ERROR: {response.status_code}")
-            print(f"[AI] Response: {response.text[:500]}")
-            return None
+        
+        secondary = hedge_target(target, agent, hedge)
+        priority = priority or AGENT_PRIORITIES.get(agent, 'default')
+        
+        async def fetch():
+            await asyncio.to_thread(record_prompt_tokens, agent, ai_request[2])
+            if secondary:
+                result = await hedging.hedged_call_async(
+                    lambda: post_ai_async(target, ai_request, priority, stop_at_json),
+                    lambda: post_ai_async(secondary, build_ai_request(system_prompt, user_prompt, secondary, schema),
+                                         priority, stop_at_json),
+                    hedging.tracker(target).hedge_delay()
+                )
+            else:
+                result = await post_ai_async(target, ai_request, priority, stop_at_json)
+            await asyncio.to_thread(cache_ai_response, agent, key, result)
+            return result
+        
+        return await async_ai_flights.do(key, fetch)
             
+    except LimitExceeded as e:
+        print(f"[AI] Shed by concurrency limiter: {e}")
+        return None
     except Exception as e:
         print(f"[AI] EXCEPTION: {e}")
         import traceback
@@ -130,12 +620,542 @@ def call_ai(system_prompt, user_prompt, use_brev=True):
         return None
 
 
+def parse_agent_json(agent, result):
+    """
+    The agent's JSON answer if it parses and matches schemas.AGENT_SCHEMAS,
+    else None (the agent falls back). Outcomes are counted for /metrics.
+    """
+    if result is None:
+        schemas.record(agent, 'unavailable')
+        return None
+    schema = schemas.AGENT_SCHEMAS.get(agent, {})
+    try:
+        content = result['choices'][0]['message']['content']
+        data = extract_json(content, '[' if schema.get('type') == 'array' else '{')
+    except (ValueError, KeyError, IndexError, TypeError) as e:
+        print(f"[AI] {agent}: unparseable answer ({e})")
+        schemas.record(agent, 'unparsed')
+        return None
+    errors = schemas.validate(agent, data)
+    if errors:
+        print(f"[AI] {agent}: answer does not match its schema: {'; '.join(errors[:5])}")
+        schemas.record(agent, 'invalid')
+        return None
+    schemas.record(agent, 'valid')
+    return data
+
+
+def call_ai_json(system_prompt, user_prompt, use_brev=True, agent=None):
+    """
+    call_ai for structured agents: guided by the agent's schema, stopped once
+    the JSON is closed, then parsed and validated
+    Returns (data, result): data is None when unusable, result when unavailable
+    """
+    result = call_ai(system_prompt, user_prompt, use_brev, agent=agent, stop_at_json=True,
+                     schema=schemas.AGENT_SCHEMAS.get(agent))
+    return parse_agent_json(agent, result), result
+
+
+async def call_ai_json_async(system_prompt, user_prompt, use_brev=True, agent=None):
+    result = await call_ai_async(system_prompt, user_prompt, use_brev, agent=agent, stop_at_json=True,
+                                 schema=schemas.AGENT_SCHEMAS.get(agent))
+    return parse_agent_json(agent, result), result
+
+
+def stream_deltas(target, url, headers, payload):
+    """Content deltas of a stream: true request, resent plain if guided decoding is refused"""
+    try:
+        yield from streaming.chat_deltas(
+            upstream.stream_lines(url, headers=headers, json={**payload, 'stream': True}, timeout=30)
+        )
+    except upstream.StatusError as e:
+        if not rejects_guided_params(target, e.status_code, payload):
+            raise
+        yield from streaming.chat_deltas(
+            upstream.stream_lines(url, headers=headers, json={**without_guided_params(payload), 'stream': True},
+                                  timeout=30)
+        )
+
+
+async def stream_deltas_async(target, url, headers, payload):
+    try:
+        async for delta in streaming.chat_deltas_async(
+            upstream.async_stream_lines(url, headers=headers, json={**payload, 'stream': True}, timeout=30)
+        ):
+            yield delta
+        return
+    except upstream.StatusError as e:
+        if not rejects_guided_params(target, e.status_code, payload):
+            raise
+    async for delta in streaming.chat_deltas_async(
+        upstream.async_stream_lines(url, headers=headers, json={**without_guided_params(payload), 'stream': True},
+                                    timeout=30)
+    ):
+        yield delta
+
+
+def call_ai_stream(system_prompt, user_prompt, use_brev=True, agent=None, priority=None, stop_at_json=False):
+    """
+    call_ai with stream: true - yields content deltas as the model generates them
+    Same upstream choice, limiter slot, breaker and cache as call_ai; closing
+    the generator early closes the upstream connection and stops generation.
+    stop_at_json: the stream ends once its JSON is closed; that answer is
+    complete (recorded and cached) even if the consumer stops reading there
+    """
+    target = choose_upstream(use_brev)
+    if target is None:
+        print("[AI] All upstream circuits open, skipping model call")
+        return
+    
+    url, headers, payload = build_ai_request(system_prompt, user_prompt, target, schemas.AGENT_SCHEMAS.get(agent))
+    key = make_key(payload)
+    
+    cached = cached_ai_response(agent, key)
+    if cached is not None:
+        yield cached['choices'][0]['message']['content']
+        return
+    
+    record_prompt_tokens(agent, payload)
+    LIMITERS[target].acquire(priority or AGENT_PRIORITIES.get(agent, 'default'))
+    answer = StreamedAnswer(stop_at_json)
+    try:
+        for delta in stream_deltas(target, url, headers, payload):
+            complete = answer.add(delta)
+            yield delta
+            if complete:
+                return
+        answer.finish()
+    except Exception as e:
+        answer.failed = True
+        BREAKERS[target].record_failure(e)
+        raise
+    finally:
+        # Also runs when the consumer stops early (disconnect, JSON closed)
+        completion = answer.settle(target)
+        if completion is not None:
+            cache_ai_response(agent, key, completion)
+
+
+async def call_ai_stream_async(system_prompt, user_prompt, use_brev=True, agent=None, priority=None,
+                               stop_at_json=False):
+    """call_ai_stream for the ASGI gateway"""
+    target = choose_upstream(use_brev)
+    if target is None:
+        print("[AI] All upstream circuits open, skipping model call")
+        return
+    
+    url, headers, payload = build_ai_request(system_prompt, user_prompt, target, schemas.AGENT_SCHEMAS.get(agent))
+    key = make_key(payload)
+    
+    cached = await asyncio.to_thread(cached_ai_response, agent, key)
+    if cached is not None:
+        yield cached['choices'][0]['message']['content']
+        return
+    
+    await asyncio.to_thread(record_prompt_tokens, agent, payload)
+    await LIMITERS[target].acquire_async(priority or AGENT_PRIORITIES.get(agent, 'default'))
+    answer = StreamedAnswer(stop_at_json)
+    try:
+        async for delta in stream_deltas_async(target, url, headers, payload):
+            complete = answer.add(delta)
+            yield delta
+            if complete:
+                return
+        answer.finish()
+    except Exception as e:
+        answer.failed = True
+        BREAKERS[target].record_failure(e)
+        raise
+    finally:
+        completion = answer.settle(target)
+        if completion is not None:
+            await asyncio.to_thread(cache_ai_response, agent, key, completion)
+
+
+class StreamedAnswer:
+    """
+    Outcome of one streamed model call, settled however the stream ends:
+    complete (all text, or its JSON closed), failed, or abandoned by the
+    consumer mid-answer
+    """
+    
+    def __init__(self, stop_at_json=False):
+        self.started = time.monotonic()
+        self.extractor = JsonStreamExtractor() if stop_at_json else None
+        self.parts = []
+        self.text = None      # set once the answer is complete
+        self.failed = False
+    
+    def add(self, delta):
+        """Take one delta; True once the answer is complete (its JSON closed)"""
+        if not self.parts:
+            print(f"[AI] First token after {time.monotonic() - self.started:.2f}s")
+        self.parts.append(delta)
+        if self.extractor is not None and self.extractor.feed(delta):
+            print(f"[AI] JSON complete after {len(self.extractor.buffer)} chars, stopping generation")
+            self.text = self.extractor.buffer[:self.extractor.end]
+            return True
+        return False
+    
+    def finish(self):
+        self.text = ''.join(self.parts)
+    
+    def settle(self, target):
+        """
+        Release the limiter slot and feed the breaker; the completion to
+        cache, None unless complete. Abandoned answers give the limiter no
+        latency sample (partial), but still show the upstream is answering.
+        """
+        elapsed = time.monotonic() - self.started
+        if self.failed:
+            LIMITERS[target].release(elapsed, True)
+            return None
+        if self.text is None:
+            LIMITERS[target].release(None, False)
+            if self.parts:
+                BREAKERS[target].record_success(elapsed)
+            return None
+        LIMITERS[target].release(elapsed, False)
+        BREAKERS[target].record_success(elapsed)
+        return completion_from_text(self.text)
+
+
+# ============================================================================
+# AGENT FLOWS
+# ============================================================================
+# Every agent below is a generator "flow": it yields its slow steps (model
+# calls, voice synthesis) and returns (body, status). The Flask server runs
+# those steps with blocking calls; main_auto_asgi awaits them instead, so
+# both serving modes share the same prompts, parsing and fallbacks.
+
+FLOW_ROUTES = {}  # rule -> (flow, methods), also used by main_auto_asgi
+STREAM_ROUTES = {}  # rule -> streaming flow (Server-Sent Events), POST only
+
+
+def ask_ai(system_prompt, user_prompt, use_brev=True, stop_at_json=False):
+    """
+    Flow step: model call, resumes with the call_ai result
+    stop_at_json: the agent only wants the JSON answer, stop generating after it
+    """
+    return ('ai', (system_prompt, user_prompt), {'use_brev': use_brev, 'stop_at_json': stop_at_json})
+
+
+def ask_ai_json(system_prompt, user_prompt, use_brev=True):
+    """
+    Flow step: schema-guided model call for the flow's JSON answer
+    Resumes with (data, result): data is the validated JSON or None,
+    result is None when the model was unavailable
+    """
+    return ('ai_json', (system_prompt, user_prompt), {'use_brev': use_brev})
+
+
+def speak(text):
+    """Flow step: ElevenLabs voice message, resumes with the audio URL"""
+    return ('voice', (text,), {})
+
+
+def fan_out(flows):
+    """Flow step: run several flows concurrently, resumes with their (body, status) list"""
+    return ('fan_out', (flows,), {})
+
+
+# Streaming flows (stream_route) use these steps instead of ask_ai and
+# return their final body, which is sent as the closing 'done' event.
+
+def ask_ai_stream(system_prompt, user_prompt, use_brev=True, stop_at_json=False):
+    """
+    Streaming flow step: start a streamed model call, resumes with its handle
+    stop_at_json: the stream ends (and is cached) once its JSON is closed
+    """
+    return ('ai_stream', (system_prompt, user_prompt), {'use_brev': use_brev, 'stop_at_json': stop_at_json})
+
+
+def read_stream(stream):
+    """Streaming flow step: next text delta of a stream, None once it has ended"""
+    return ('stream_read', (stream,), {})
+
+
+def emit(event, data):
+    """Streaming flow step: send one Server-Sent Event to the client"""
+    return ('emit', (event, data), {})
+
+
+def context_model(use_brev=True):
+    """Model whose tokenizer budgets a flow's prompt (the preferred upstream's)"""
+    return ORCHESTRATOR_MODEL if use_brev and BREV_CONFIGURED else FALLBACK_MODEL
+
+
+def summarize_history(lines, merge=False):
+    """Model call behind the rolling summaries: a block of messages (or older summaries) -> one summary"""
+    agent = 'rolling_summary_merge' if merge else 'rolling_summary'
+    text, _ = context_budget.fit_newest(lines, SUMMARY_INPUT_BUDGET, context_model())
+    system_prompt, user_prompt = prompts.render(agent, text='\n'.join(text))
+    result = call_ai(system_prompt, user_prompt, agent=agent)
+    if not result:
+        return None
+    return result['choices'][0]['message']['content'].strip() or None
+
+
+rolling_summaries = RollingSummaries(summarize_history)
+
+
+def summary_key(data):
+    """Rolling-summary chain of a request's conversation: its stored id, else its contact"""
+    if data.get('conversation_id'):
+        return ('conversation', str(data['conversation_id']))
+    return ('contact', data.get('contact_name') or 'Contact')
+
+
+def conversation_summary(data, lines):
+    """
+    (rolling summary, lines not covered by it) for an agent's history of the
+    request's conversation. The summary is folded from the transcript's
+    canonical lines, so it only applies when the agent's lines render the
+    same messages (one line each); other histories get no summary.
+    """
+    transcript = transcripts.for_request(data)
+    if len(lines) != len(transcript):
+        return '', lines
+    summary, unfolded = rolling_summaries.context(summary_key(data), transcript.lines)
+    return summary, lines[len(lines) - len(unfolded):]
+
+
+def budget_history(agent, history, use_brev=True, conversation=None):
+    """
+    Newest part of a conversation that fits the agent's token budget
+    history: list of message lines, or a newline-separated log
+    conversation: the request the history belongs to; its rolling summary
+                  stands in for everything before the recent tail, so the
+                  prompt stays the same size as history grows
+    """
+    lines = [line for line in history.split('\n') if line.strip()] if isinstance(history, str) else list(history)
+    budget = AGENT_CONTEXT_BUDGETS.get(agent, CONTEXT_DEFAULT_BUDGET)
+    model = context_model(use_brev)
+    
+    summary, unfolded = conversation_summary(conversation, lines) if conversation is not None else ('', lines)
+    if summary:
+        # At most half the budget for the summary (its most recent part), the rest for the tail
+        summary_lines, summary_tokens = context_budget.fit_newest(summary.split('\n'), budget // 2, model)
+        kept, tokens = context_budget.fit_newest(unfolded, budget - summary_tokens, model)
+        tokens += summary_tokens
+        text = (f"[Summary of {len(lines) - len(unfolded)} earlier messages]\n" + '\n'.join(summary_lines) +
+                "\n\n[Recent messages]\n" + '\n'.join(kept))
+    else:
+        kept, tokens = context_budget.fit_newest(unfolded, budget, model)
+        text = '\n'.join(kept)
+    
+    context_budget.record_history(agent, tokens, len(kept), len(unfolded) - len(kept))
+    if len(kept) < len(lines):
+        print(f"[CONTEXT] {agent}: kept newest {len(kept)}/{len(lines)} lines "
+              f"{'+ summary ' if summary else ''}({tokens} tokens)")
+    return text
+
+
+def step_agent(flow):
+    """
+    Agent of the step a flow just yielded: the innermost flow it delegates
+    to with `yield from` (so /summarize_chat's steps are auto_analyze's and
+    share its schema, cache entries and in-flight calls)
+    """
+    while inspect.isgenerator(flow.gi_yieldfrom):
+        flow = flow.gi_yieldfrom
+    return flow.__name__
+
+
+def run_flow(flow):
+    """Drive a flow to its (body, status) with blocking calls (Flask mode)"""
+    if not inspect.isgenerator(flow):
+        return flow
+    
+    step_result = None
+    try:
+        while True:
+            kind, args, kwargs = flow.send(step_result)
+            if kind == 'ai':
+                step_result = call_ai(*args, agent=step_agent(flow), **kwargs)
+            elif kind == 'ai_json':
+                step_result = call_ai_json(*args, agent=step_agent(flow), **kwargs)
+            elif kind == 'voice':
+                step_result = generate_voice_message(*args, **kwargs)
+            else:
+                step_result = list(FAN_OUT_POOL.map(run_flow_safely, *args))
+    except StopIteration as done:
+        return done.value
+
+
+def advance(flow, step_result):
+    """flow.send for a worker thread: the return value comes back as a ('done', (value,), {}) step"""
+    try:
+        return flow.send(step_result)
+    except StopIteration as done:
+        return 'done', (done.value,), {}
+
+
+async def run_flow_async(flow):
+    """
+    Drive a flow to its (body, status) with awaited calls (ASGI mode)
+    The flow's own code between steps (store reads, token counting, local
+    engines) runs in a worker thread, so it never blocks the event loop
+    """
+    if not inspect.isgenerator(flow):
+        return flow
+    
+    step_result = None
+    while True:
+        kind, args, kwargs = await asyncio.to_thread(advance, flow, step_result)
+        if kind == 'done':
+            return args[0]
+        if kind == 'ai':
+            step_result = await call_ai_async(*args, agent=step_agent(flow), **kwargs)
+        elif kind == 'ai_json':
+            step_result = await call_ai_json_async(*args, agent=step_agent(flow), **kwargs)
+        elif kind == 'voice':
+            step_result = await generate_voice_message_async(*args, **kwargs)
+        else:
+            step_result = list(await asyncio.gather(*[run_flow_safely_async(f) for f in args[0]]))
+
+
+def run_flow_safely(flow):
+    """run_flow for fan_out: one failing agent must not fail the others"""
+    try:
+        return run_flow(flow)
+    except Exception as e:
+        return {'success': False, 'error': str(e)}, 500
+
+
+async def run_flow_safely_async(flow):
+    try:
+        return await run_flow_async(flow)
+    except Exception as e:
+        return {'success': False, 'error': str(e)}, 500
+
+
+def run_stream_flow(flow):
+    """Drive a streaming flow, yielding SSE frames as it emits them (Flask mode)"""
+    if not inspect.isgenerator(flow):
+        yield streaming.sse_event('done', flow[0])
+        return
+    
+    streams = []
+    step_result = None
+    try:
+        while True:
+            kind, args, kwargs = flow.send(step_result)
+            step_result = None
+            if kind == 'ai_stream':
+                step_result = call_ai_stream(*args, agent=step_agent(flow), **kwargs)
+                streams.append(step_result)
+            elif kind == 'stream_read':
+                try:
+                    step_result = next(args[0], None)
+                except Exception as e:
+                    print(f"[STREAM] Upstream stream failed: {e}")
+            elif kind == 'emit':
+                yield streaming.sse_event(*args)
+            else:
+                raise ValueError(f"Step '{kind}' is not supported in streaming flows")
+    except StopIteration as done:
+        yield streaming.sse_event('done', done.value)
+    finally:
+        # Finished early or client disconnected: stop any generation still running
+        for stream in streams:
+            stream.close()
+
+
+async def run_stream_flow_async(flow):
+    """run_stream_flow for the ASGI gateway"""
+    if not inspect.isgenerator(flow):
+        yield streaming.sse_event('done', flow[0])
+        return
+    
+    streams = []
+    step_result = None
+    try:
+        while True:
+            kind, args, kwargs = await asyncio.to_thread(advance, flow, step_result)
+            step_result = None
+            if kind == 'done':
+                yield streaming.sse_event('done', args[0])
+                return
+            if kind == 'ai_stream':
+                step_result = call_ai_stream_async(*args, agent=step_agent(flow), **kwargs)
+                streams.append(step_result)
+            elif kind == 'stream_read':
+                try:
+                    step_result = await args[0].__anext__()
+                except StopAsyncIteration:
+                    pass
+                except Exception as e:
+                    print(f"[STREAM] Upstream stream failed: {e}")
+            elif kind == 'emit':
+                yield streaming.sse_event(*args)
+            else:
+                raise ValueError(f"Step '{kind}' is not supported in streaming flows")
+    finally:
+        for stream in streams:
+            await stream.aclose()
+
+
+def with_conversation(flow, resolve=True):
+    """
+    Route entry for a flow: a request naming a stored conversation
+    ({conversation_id}, no inline messages) gets it expanded first
+    Returns the flow's generator, or a (body, status) error
+    """
+    if not resolve:
+        return flow
+    
+    @wraps(flow)
+    def entry(data):
+        resolved = resolve_conversation(data)
+        return resolved if isinstance(resolved, tuple) else flow(resolved)
+    return entry
+
+
+def flow_route(rule, methods=('POST',), resolve=True):
+    """
+    Register a flow as a Flask route (and in FLOW_ROUTES for the ASGI gateway)
+    resolve=False: the flow reads conversation_id itself
+    """
+    def decorator(flow):
+        entry = with_conversation(flow, resolve)
+        
+        def view():
+            if request.method == 'OPTIONS':
+                return jsonify({'status': 'ok'}), 200
+            body, status = run_flow(entry(request.get_json(silent=True)))
+            return jsonify(body), status
+        
+        app.add_url_rule(rule, flow.__name__, view, methods=list(methods))
+        FLOW_ROUTES[rule] = (entry, methods)
+        return flow
+    return decorator
+
+
+def stream_route(rule):
+    """Register a streaming flow as a text/event-stream POST route (Flask and ASGI)"""
+    def decorator(flow):
+        entry = with_conversation(flow)
+        
+        def view():
+            frames = run_stream_flow(entry(request.get_json(silent=True) or {}))
+            return Response(frames, mimetype='text/event-stream', headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
+            })
+        
+        app.add_url_rule(rule, flow.__name__, view, methods=['POST'])
+        STREAM_ROUTES[rule] = entry
+        return flow
+    return decorator
+
+
 # ============================================================================
 # AUTO-AGENT: CONVERSATION ANALYZER
 # ============================================================================
 
-@app.route('/auto_analyze_conversation', methods=['POST', 'OPTIONS'])
-def auto_analyze_conversation():
+@flow_route('/auto_analyze_conversation', methods=('POST', 'OPTIONS'))
+def auto_analyze_conversation(data):
     """
     AUTOMATIC: Called when user opens a conversation
     Analyzes full chat history and provides:
@@ -144,65 +1164,39 @@ def auto_analyze_conversation():
     3. Suggested reply
     4. Action opportunities (booking, follow-up, etc.)
     """
-    # Handle OPTIONS preflight
-    if request.method == 'OPTIONS':
-        return jsonify({'status': 'ok'}), 200
-    
     try:
-        data = request.json
-        chat_log = data.get('chat_log', '')
+        chat_log = history_lines(data, 'chat_log')
         contact_name = data.get('contact_name', '')
         
-        system_prompt = f"""You are Atlas's Auto-Analyzer for {contact_name}.
-Analyze this conversation AUTOMATICALLY and provide actionable insights.
-
-Return ONLY valid JSON:
-{{
-  "summary_text": "one sentence summary",
-  "topics": ["topic1", "topic2", "topic3"],
-  "suggested_reply": "natural response",
-  "action_needed": "booking|follow_up|none",
-  "action_details": {{
-    "type": "meeting|lunch|call",
-    "suggested_time": "when to schedule",
-    "reason": "why this makes sense"
-  }}
-}}"""
-
-        user_prompt = f"Conversation with {contact_name}:\n{chat_log}"
+        system_prompt, user_prompt = prompts.render(
+            'auto_analyze_conversation', contact_name=contact_name,
+            chat_log=budget_history('auto_analyze_conversation', chat_log, conversation=data)
+        )
         
-        result = call_ai(system_prompt, user_prompt)
+        analysis, _ = yield ask_ai_json(system_prompt, user_prompt)
         
-        if result:
-            try:
-                content = result['choices'][0]['message']['content']
-                if '{' in content:
-                    json_start = content.index('{')
-                    json_end = content.rindex('}') + 1
-                    parsed = json.loads(content[json_start:json_end])
-                    return jsonify(parsed)
-            except:
-                pass
+        if analysis is not None:
+            return analysis, 200
         
         # Fallback
-        return jsonify({
+        return {
             "summary_text": "Conversation analyzed",
             "topics": ["general discussion"],
             "suggested_reply": "Thanks for sharing!",
             "action_needed": "none",
             "action_details": {}
-        })
+        }, 200
         
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return {"error": str(e)}, 500
 
 
 # ============================================================================
 # AUTO-AGENT: SMART BOOKING SYSTEM
 # ============================================================================
 
-@app.route('/auto_book_meeting', methods=['POST'])
-def auto_book_meeting():
+@flow_route('/auto_book_meeting', methods=('POST',))
+def auto_book_meeting(data):
     """
     AUTOMATIC: Triggered when AI detects booking opportunity
     1. Checks calendars (mock for now, add Google Calendar API)
@@ -211,47 +1205,17 @@ def auto_book_meeting():
     4. Returns booking confirmation
     """
     try:
-        data = request.json
         contact_name = data.get('contact_name', '')
         meeting_type = data.get('meeting_type', 'meeting')
         chat_context = data.get('chat_context', '')
         
         # Step 1: AI determines best time
-        system_prompt = """You are Atlas's Booking Agent.
-Analyze the conversation and calendar availability to suggest the BEST meeting time.
-
-Return ONLY valid JSON:
-{
-  "suggested_time": "Day, Time (e.g., Tomorrow at 3 PM)",
-  "meeting_type": "lunch|coffee|meeting|call",
-  "location": "where to meet or 'video call'",
-  "message_to_send": "natural message to propose this",
-  "confidence": "high|medium|low"
-}"""
-
-        user_prompt = f"""Contact: {contact_name}
-Meeting Type: {meeting_type}
-Recent conversation: {chat_context}
-
-User's Calendar (mock):
-- Today: 2 PM - 5 PM (busy)
-- Tomorrow: Free after 12 PM
-- This Weekend: Saturday morning free
-
-Friend's typical availability: Weekday afternoons, weekends"""
+        system_prompt, user_prompt = prompts.render(
+            'auto_book_meeting', contact_name=contact_name, meeting_type=meeting_type,
+            chat_context=budget_history('auto_book_meeting', chat_context, conversation=data)
+        )
 
-        result = call_ai(system_prompt, user_prompt)
-        
-        booking_data = None
-        if result:
-            try:
-                content = result['choices'][0]['message']['content']
-                if '{' in content:
-                    json_start = content.index('{')
-                    json_end = content.rindex('}') + 1
-                    booking_data = json.loads(content[json_start:json_end])
-            except:
-                pass
+        booking_data, _ = yield ask_ai_json(system_prompt, user_prompt)
         
         if not booking_data:
             # Fallback
@@ -262,6 +1226,8 @@ Friend's typical availability: Weekday afternoons, weekends"""
                 "message_to_send": f"Hey! Want to grab {meeting_type} tomorrow around 3?",
                 "confidence": "medium"
             }
+        # The schema leaves the place open; the model may not know it yet
+        booking_data.setdefault('location', 'TBD')
         
         # Step 2: Generate ElevenLabs voice message
         voice_script = f"""Hi {contact_name}, this is Atlas, your AI assistant speaking. 
@@ -270,21 +1236,60 @@ I've checked both calendars and found that {booking_data['suggested_time']} work
 Would you like me to schedule {booking_data['meeting_type']} at {booking_data['location']}? 
 Let me know and I'll send the calendar invite!"""
         
-        audio_url = generate_voice_message(voice_script)
+        audio_url = yield speak(voice_script)
         
         booking_data['voice_message_url'] = audio_url
         booking_data['voice_script'] = voice_script
         
-        return jsonify(booking_data)
+        return booking_data, 200
         
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return {"error": str(e)}, 500
 
 
 # ============================================================================
 # ELEVENLABS VOICE GENERATION
 # ============================================================================
 
+def build_voice_request(text):
+    """ElevenLabs text-to-speech request for text (url, headers, payload)"""
+    url = f"{ELEVENLABS_API_URL}/{ELEVENLABS_VOICE_ID}"
+    
+    payload = {
+        "text": text,
+        "model_id": "eleven_monolingual_v1",
+        "voice_settings": {
+            "stability": 0.5,
+            "similarity_boost": 0.75
+        }
+    }
+    
+    headers = {
+        "Accept": "audio/mpeg",
+        "Content-Type": "application/json",
+        "xi-api-key": ELEVENLABS_API_KEY
+    }
+    
+    return url, headers, payload
+
+
+def save_voice_response(response):
+    """Store the returned audio and return its URL (None on error)"""
+    if response.status_code == 200:
+        # Save audio file
+        audio_filename = f"atlas_voice_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp3"
+        audio_path = f"/tmp/{audio_filename}"
+        
+        with open(audio_path, 'wb') as f:
+            f.write(response.content)
+        
+        # Return URL (in production, upload to S3/Cloud Storage)
+        return f"http://localhost:5000/audio/{audio_filename}"
+    else:
+        print(f"ElevenLabs Error: {response.status_code}")
+        return None
+
+
 def generate_voice_message(text):
     """
     Generate natural voice message using ElevenLabs
@@ -295,38 +1300,25 @@ def generate_voice_message(text):
             print("ElevenLabs: No API key, returning mock URL")
             return "https://mock-audio-url.com/atlas-voice.mp3"
         
-        url = f"{ELEVENLABS_API_URL}/{ELEVENLABS_VOICE_ID}"
-        
-        payload = {
-            "text": text,
-            "model_id": "eleven_monolingual_v1",
-            "voice_settings": {
-                "stability": 0.5,
-                "similarity_boost": 0.75
-            }
-        }
-        
-        headers = {
-            "Accept": "audio/mpeg",
-            "Content-Type": "application/json",
-            "xi-api-key": ELEVENLABS_API_KEY
-        }
-        
-        response = requests.post(url, json=payload, headers=headers, timeout=30)
-        
-        if response.status_code == 200:
-            # Save audio file
-            audio_filename = f"atlas_voice_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp3"
-            audio_path = f"/tmp/{audio_filename}"
+        url, headers, payload = build_voice_request(text)
+        response = upstream.post(url, json=payload, headers=headers, timeout=30)
+        return save_voice_response(response)
             
-            with open(audio_path, 'wb') as f:
-                f.write(response.content)
-            
-            # Return URL (in production, upload to S3/Cloud Storage)
-            return f"http://localhost:5000/audio/{audio_filename}"
-        else:
-            print(f"ElevenLabs Error: {response.status_code}")
-            return None
+    except Exception as e:
+        print(f"ElevenLabs Exception: {e}")
+        return None
+
+
+async def generate_voice_message_async(text):
+    """generate_voice_message for the ASGI gateway"""
+    try:
+        if ELEVENLABS_API_KEY == 'your-elevenlabs-key-here':
+            print("ElevenLabs: No API key, returning mock URL")
+            return "https://mock-audio-url.com/atlas-voice.mp3"
+        
+        url, headers, payload = build_voice_request(text)
+        response = await upstream.async_post(url, json=payload, headers=headers, timeout=30)
+        return save_voice_response(response)
             
     except Exception as e:
         print(f"ElevenLabs Exception: {e}")
@@ -344,8 +1336,8 @@ def serve_audio(filename):
 # AUTO-AGENT: CONTEXTUAL ACTIONS
 # ============================================================================
 
-@app.route('/detect_actions', methods=['POST'])
-def detect_actions():
+@flow_route('/detect_actions', methods=('POST',))
+def detect_actions(data):
     """
     AUTOMATIC: Detects what actions the user can take
     - Book meeting
@@ -354,82 +1346,55 @@ def detect_actions():
     - Plan event
     """
     try:
-        data = request.json
-        chat_log = data.get('chat_log', '')
+        chat_log = history_lines(data, 'chat_log')
         contact_name = data.get('contact_name', '')
         
-        system_prompt = """You are Atlas's Action Detector.
-Analyze the conversation and detect what actions make sense.
-
-Return ONLY valid JSON array:
-[
-  {
-    "action_type": "book_meeting|send_followup|share_content|plan_event",
-    "title": "Short action title",
-    "description": "Why this action makes sense",
-    "priority": "high|medium|low",
-    "icon": "calendar|message|share|event"
-  }
-]"""
-
-        user_prompt = f"Conversation with {contact_name}:\n{chat_log}"
+        # Local intent gate: no likely intent, no model call
+        cleared, scores = intent_gate.gate.check(transcripts.for_request(data))
+        if not cleared:
+            return {"actions": [], "intents": scores}, 200
         
-        result = call_ai(system_prompt, user_prompt)
+        system_prompt, user_prompt = prompts.render(
+            'detect_actions', contact_name=contact_name,
+            chat_log=budget_history('detect_actions', chat_log, conversation=data),
+            intents=intent_gate.describe(cleared, scores)
+        )
         
-        if result:
-            try:
-                content = result['choices'][0]['message']['content']
-                if '[' in content:
-                    json_start = content.index('[')
-                    json_end = content.rindex(']') + 1
-                    actions = json.loads(content[json_start:json_end])
-                    return jsonify({"actions": actions})
-            except:
-                pass
+        actions, _ = yield ask_ai_json(system_prompt, user_prompt)
         
-        # Fallback
-        return jsonify({
-            "actions": [
-                {
-                    "action_type": "send_followup",
-                    "title": "Send Follow-up",
-                    "description": "Continue the conversation",
-                    "priority": "medium",
-                    "icon": "message"
-                }
-            ]
-        })
+        if actions is not None:
+            allowed = {intent_gate.ACTIONS[intent][0] for intent in cleared}
+            actions = [a for a in actions if a.get('action_type') in allowed]
+        # Fallback: the gate's own actions
+        return {"actions": actions or intent_gate.local_actions(cleared, scores), "intents": scores}, 200
         
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return {"error": str(e)}, 500
 
 
 # ============================================================================
 # ORIGINAL ENDPOINT (KEEP FOR COMPATIBILITY)
 # ============================================================================
 
-@app.route('/summarize_chat', methods=['POST'])
-def summarize_chat():
+@flow_route('/summarize_chat', methods=('POST',))
+def summarize_chat(data):
     """Original chat summarization - now calls auto_analyze"""
     try:
-        data = request.json
-        chat_log = data.get('chat_log', '')
-        
         # Forward to auto analyzer
-        result = auto_analyze_conversation()
+        result = yield from auto_analyze_conversation(data)
         return result
         
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return {"error": str(e)}, 500
 
 
 # ============================================================================
 # HEALTH & INFO
 # ============================================================================
 
-@app.route('/')
-def home():
-    return jsonify({
+@flow_route('/', methods=('GET',))
+def home(data):
+    return {
         'status': 'online',
         'service': 'Atlas Auto-Agent System',
         'features': [
@@ -445,66 +1410,69 @@ def home():
             '/detect_actions',
             '/summarize_chat'
         ],
-        'brev_status': 'connected' if BREV_SERVER != 'http://localhost' else 'local_mode',
-        'elevenlabs_status': 'active' if ELEVENLABS_API_KEY != 'your-elevenlabs-key-here' else 'need_api_key'
-    })
-
-
-@app.route('/health')
-def health():
-    return jsonify({'status': 'ok'}), 200
-
-
-@app.route('/predict_followup', methods=['POST'])
-def predict_followup():
+        'brev_status': 'connected' if BREV_CONFIGURED else 'local_mode',
+        'elevenlabs_status': 'active' if ELEVENLABS_API_KEY != 'your-elevenlabs-key-here' else 'need_api_key',
+        'upstream': upstream.pool_stats()
+    }, 200
+
+
+@flow_route('/health', methods=('GET',))
+def health(data):
+    return {'status': 'ok'}, 200
+
+
+@flow_route('/metrics', methods=('GET',))
+def metrics(data):
+    """Counters for the performance layers in front of the model"""
+    return {
+        'llm_cache': response_cache.stats(),
+        'singleflight': singleflight.stats(),
+        'hedging': hedging.stats(),
+        'concurrency': {name: limiter.stats() for name, limiter in LIMITERS.items()},
+        'circuit_breakers': {name: breaker.stats() for name, breaker in BREAKERS.items()},
+        'structured_output': {
+            'guided_decoding': GUIDED_DECODING,
+            'unsupported_upstreams': sorted(GUIDED_UNSUPPORTED),
+            'agents': schemas.stats()
+        },
+        'prompts': prompts.stats(),
+        'context': context_budget.stats(),
+        'rolling_summaries': rolling_summaries.stats(),
+        'conversations': conversation_store.stats(),
+        'notifications': notifier.stats(),
+        'date_prefilter': date_extract.stats(),
+        'sentiment': sentiment.engine.stats(),
+        'conversation_stats': conversation_stats.engine.stats(),
+        'intent_gate': intent_gate.gate.stats(),
+        'features': feature_store.stats(),
+        'upstream': upstream.pool_stats()
+    }, 200
+
+
+@flow_route('/predict_followup', methods=('POST',))
+def predict_followup(data):
     """
     AI-powered follow-up prediction
     Analyzes conversation context to determine if/when to follow up
     """
     try:
-        data = request.json
         contact_name = data.get('contact_name')
-        chat_log = data.get('chat_log', '')
-        last_message = data.get('last_message', '')
-        hours_since_message = data.get('hours_since_message', 0)
+        chat_log = history_lines(data, 'chat_log')
+        features = contact_features.for_request(data)
+        last_message = data.get('last_message') or features['last_text']
+        hours_since_message = (round(features['hours_since_last_message'], 1)
+                               if features['last_message_at'] is not None else data.get('hours_since_message', 0))
         
         # AI Analysis Prompt
-        system_prompt = """You are Atlas, an AI relationship intelligence assistant.
-Analyze conversations to determine if the user should follow up with their contact.
-Consider:
-- Time since last message
-- Conversation context and tone
-- Relationship importance signals
-- Open loops or pending items
-- Social norms and politeness
-
-Return JSON with:
-{
-  "should_follow_up": boolean,
-  "urgency": "low" | "medium" | "high" | "critical",
-  "suggested_message": "Brief, contextual follow-up message",
-  "reasoning": "Why this follow-up is recommended",
-  "best_time": "morning" | "afternoon" | "evening" | "now",
-  "wait_hours": number (hours to wait before following up)
-}"""
-
-        user_prompt = f"""Analyze this conversation with {contact_name}:
-
-LAST MESSAGE (sent {hours_since_message} hours ago):
-"{last_message}"
-
-FULL CONVERSATION HISTORY:
-{chat_log}
-
-Should the user follow up? Generate a natural, contextual follow-up message if yes."""
+        system_prompt, user_prompt = prompts.render(
+            'predict_followup', contact_name=contact_name, hours_since_message=hours_since_message,
+            last_message=last_message, chat_log=budget_history('predict_followup', chat_log, conversation=data)
+        )
 
         # Call AI
-        ai_response = call_ai(system_prompt, user_prompt, use_brev=True)
+        result, _ = yield ask_ai_json(system_prompt, user_prompt, use_brev=True)
         
-        try:
-            # Parse AI response as JSON
-            result = json.loads(ai_response['choices'][0]['message']['content'])
-        except (json.JSONDecodeError, KeyError, TypeError):
+        if result is None:
             # Fallback if AI doesn't return valid JSON
             result = {
                 'should_follow_up': hours_since_message > 24,
@@ -515,41 +1483,32 @@ Should the user follow up? Generate a natural, contextual follow-up message if y
                 'wait_hours': max(0, 24 - hours_since_message)
             }
         
-        return jsonify({
+        return {
             'success': True,
             'contact_name': contact_name,
             'hours_since_message': hours_since_message,
             **result
-        })
+        }, 200
         
     except Exception as e:
-        return jsonify({
+        return {
             'success': False,
             'error': str(e),
             'should_follow_up': False
-        }), 500
+        }, 500
 
 
-@app.route('/voice_book_meeting', methods=['POST', 'OPTIONS'])
-def voice_book_meeting():
+@flow_route('/voice_book_meeting', methods=('POST', 'OPTIONS'))
+def voice_book_meeting(data):
     """
     Voice-activated meeting booking with ElevenLabs + Google Calendar Integration
     Processes spoken commands to book meetings using Brev GPU multi-agent AI
     NOW: Checks user's calendar and suggests only available time slots!
     """
-    # Handle OPTIONS preflight request
-    if request.method == 'OPTIONS':
-        response = jsonify({'status': 'ok'})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
-        return response, 200
-    
     try:
-        data = request.json
         voice_command = data.get('voice_command', '')
         contact_name = data.get('contact_name')
-        chat_log = data.get('chat_log', '')
+        chat_log = history_lines(data, 'chat_log')
         free_calendar_slots = data.get('free_calendar_slots', '')  # ✨ NEW!
         has_calendar_data = data.get('has_calendar_data', False)  # ✨ NEW!
         
@@ -559,36 +1518,19 @@ def voice_book_meeting():
         
         # AI processes voice command with calendar awareness
         calendar_context = ""
-        voice_script_hint = "I suggest"
         if has_calendar_data and free_calendar_slots:
             calendar_context = f"\n\n📅 USER'S AVAILABLE TIME SLOTS (from Google Calendar):\n{free_calendar_slots}\n\n✅ IMPORTANT: Only suggest times from the available slots above!"
-            voice_script_hint = "Based on your calendar, you're free"
         
-        system_prompt = f"""You are Atlas, an AI meeting booking assistant with Google Calendar integration.
-
-{calendar_context}
-
-Parse the voice command and return ONLY valid JSON (no markdown, no explanation):
-{{
-  "meeting_type": "coffee|lunch|call|meeting|dinner",
-  "preferred_time": "description of when",
-  "duration_minutes": 60,
-  "location": "location or null",
-  "notes": "additional context",
-  "suggested_times": ["Tomorrow at 2pm", "Next week", "Friday afternoon"],
-  "voice_script": "Hi! I heard you want to book a [type]. {voice_script_hint} [time]. Sound good?"
-}}"""
-
-        user_prompt = f"""Voice Command: "{voice_command}"
-Contact: {contact_name}
-Chat History: {chat_log[:500] if chat_log else 'No history'}
-
-Return JSON only."""
+        system_prompt, user_prompt = prompts.render(
+            'voice_book_meeting', voice_command=voice_command, contact_name=contact_name,
+            chat_log=budget_history('voice_book_meeting', chat_log) if chat_log else 'No history',
+            calendar_context=calendar_context
+        )
 
         print(f"[BREV] Calling Brev AI at {BREV_SERVER}...")
         
         # Get AI analysis using Brev GPU
-        ai_result = call_ai(system_prompt, user_prompt, use_brev=True)
+        meeting_data, ai_result = yield ask_ai_json(system_prompt, user_prompt, use_brev=True)
         
         if not ai_result or 'choices' not in ai_result:
             print(f"❌ AI returned no result: {ai_result}")
@@ -602,69 +1544,54 @@ Return JSON only."""
                 "suggested_times": ["Tomorrow at 2pm", "Next week"],
                 "voice_script": f"Hi! I heard: {voice_command}. Let me help you book that meeting with {contact_name}."
             }
+        elif meeting_data is not None:
+            print(f"✅ Parsed meeting data: {meeting_data.get('meeting_type')} at {meeting_data.get('preferred_time')}")
         else:
             ai_response = ai_result['choices'][0]['message']['content']
-            print(f"[BREV] AI Response: {ai_response[:200]}...")
-            
-            # Try to parse JSON from AI response
-            try:
-                # Remove markdown code blocks if present
-                if '```' in ai_response:
-                    ai_response = ai_response.split('```json')[1].split('```')[0] if '```json' in ai_response else ai_response.split('```')[1].split('```')[0]
-                
-                meeting_data = json.loads(ai_response.strip())
-                print(f"✅ Parsed meeting data: {meeting_data.get('meeting_type')} at {meeting_data.get('preferred_time')}")
-            except json.JSONDecodeError as e:
-                print(f"❌ JSON parse error: {e}")
-                print(f"Raw response: {ai_response}")
-                # Fallback with parsed info
-                meeting_data = {
-                    "meeting_type": "meeting",
-                    "preferred_time": "soon",
-                    "duration_minutes": 60,
-                    "location": None,
-                    "notes": voice_command,
-                    "suggested_times": ["Tomorrow at 2pm"],
-                    "voice_script": f"Hi {contact_name}! I heard your request: {voice_command}. Let me help you schedule that."
-                }
+            print(f"Raw response: {ai_response}")
+            # Fallback with parsed info
+            meeting_data = {
+                "meeting_type": "meeting",
+                "preferred_time": "soon",
+                "duration_minutes": 60,
+                "location": None,
+                "notes": voice_command,
+                "suggested_times": ["Tomorrow at 2pm"],
+                "voice_script": f"Hi {contact_name}! I heard your request: {voice_command}. Let me help you schedule that."
+            }
         
         # Generate voice confirmation with ElevenLabs
         voice_script = meeting_data.get('voice_script', 
             f"Hi! I've analyzed your request to {voice_command}. I suggest booking a {meeting_data.get('meeting_type', 'meeting')} with {contact_name}.")
         
         print(f"🔊 Generating ElevenLabs voice...")
-        voice_url = generate_voice_message(voice_script)
+        voice_url = yield speak(voice_script)
         print(f"✅ Voice URL: {voice_url}")
         
-        return jsonify({
+        return {
             'success': True,
             'meeting_data': meeting_data,
             'voice_message_url': voice_url,
             'voice_script': voice_script,
             'ai_analysis': meeting_data
-        })
+        }, 200
         
     except Exception as e:
         print(f"❌ Voice booking error: {e}")
         import traceback
         traceback.print_exc()
-        return jsonify({
+        return {
             'success': False,
             'error': str(e)
-        }), 500
+        }, 500
 
 
-@app.route('/book_google_calendar', methods=['POST', 'OPTIONS'])
-def book_google_calendar():
+@flow_route('/book_google_calendar', methods=('POST', 'OPTIONS'))
+def book_google_calendar(data):
     """
     Book meeting to Google Calendar
     """
-    # Handle OPTIONS preflight
-    if request.method == 'OPTIONS':
-        return jsonify({'status': 'ok'}), 200
-    
     try:
-        data = request.json
         contact_name = data.get('contact_name')
         contact_email = data.get('contact_email')
         start_time = datetime.fromisoformat(data.get('start_time'))
@@ -677,9 +1604,9 @@ def book_google_calendar():
         # Generate voice confirmation
         voice_script = f"Perfect! I've booked your meeting with {contact_name} on {start_time.strftime('%A, %B %d at %I:%M %p')}. A calendar invite has been sent to {contact_email}."
         
-        voice_url = generate_voice_message(voice_script)
+        voice_url = yield speak(voice_script)
         
-        return jsonify({
+        return {
             'success': True,
             'event_id': 'mock_event_123',
             'calendar_link': f'https://calendar.google.com/event?eid=mock_123',
@@ -691,695 +1618,493 @@ def book_google_calendar():
                 'end': end_time.isoformat(),
                 'description': description
             }
-        })
+        }, 200
         
     except Exception as e:
-        return jsonify({
+        return {
             'success': False,
             'error': str(e)
-        }), 500
+        }, 500
 
 
 # ============================================================================
 # NEW AI AGENT: SMART REPLY GENERATOR
 # ============================================================================
 
-@app.route('/agent/smart_reply', methods=['POST', 'OPTIONS'])
-def agent_smart_reply():
+FALLBACK_REPLIES = [
+    {"text": "Sounds good!", "tone": "positive", "emoji": "👍"},
+    {"text": "Let me check and get back to you", "tone": "neutral", "emoji": ""},
+    {"text": "Sure!", "tone": "brief", "emoji": ""}
+]
+
+
+def smart_reply_prompts(data, agent='agent_smart_reply'):
+    """(system_prompt, user_prompt) shared by /agent/smart_reply and its stream variant"""
+    last_message = data.get('last_message', '')
+    contact_name = data.get('contact_name', '')
+    conversation_history = history_lines(data, 'conversation_history')
+    user_name = data.get('user_name', 'User')
+    
+    return prompts.render(
+        agent, user_name=user_name, contact_name=contact_name,
+        conversation_history=budget_history(agent, conversation_history, conversation=data),
+        last_message=last_message
+    )
+
+
+@flow_route('/agent/smart_reply', methods=('POST', 'OPTIONS'))
+def agent_smart_reply(data):
     """
     Generates 3 personalized reply suggestions based on:
     - Conversation context
     - User's texting style
     - Urgency and tone
     """
-    if request.method == 'OPTIONS':
-        return jsonify({'status': 'ok'}), 200
-    
     try:
-        data = request.json
-        last_message = data.get('last_message', '')
-        contact_name = data.get('contact_name', '')
-        conversation_history = data.get('conversation_history', '')
-        user_name = data.get('user_name', 'User')
-        
-        system_prompt = f"""You are a Smart Reply Generator for {user_name}.
-Generate 3 personalized reply suggestions to {contact_name}'s message.
-
-Rules:
-1. Match the user's texting style (casual, emojis if they use them)
-2. Be contextually appropriate
-3. Vary the tone: one enthusiastic, one neutral, one brief
-4. Keep replies natural and authentic
-
-Return ONLY valid JSON:
-{{
-  "replies": [
-    {{"text": "reply 1", "tone": "enthusiastic", "emoji": "😊"}},
-    {{"text": "reply 2", "tone": "neutral", "emoji": "👍"}},
-    {{"text": "reply 3", "tone": "brief", "emoji": ""}}
-  ]
-}}"""
-
-        user_prompt = f"""Context: Recent conversation with {contact_name}
-{conversation_history}
-
-Latest message from {contact_name}: "{last_message}"
-
-Generate 3 smart reply suggestions."""
-        
-        result = call_ai(system_prompt, user_prompt)
-        
-        if result:
-            try:
-                # Extract content from AI response
-                content = result['choices'][0]['message']['content']
-                
-                # Find JSON in the response
-                if '{' in content:
-                    json_start = content.index('{')
-                    json_end = content.rindex('}') + 1
-                    json_str = content[json_start:json_end]
-                    parsed = json.loads(json_str)
-                    
-                    return jsonify({
-                        'success': True,
-                        'replies': parsed.get('replies', [])
-                    })
-                else:
-                    raise ValueError("No JSON found in response")
-                    
-            except (json.JSONDecodeError, ValueError, KeyError) as e:
-                print(f"Smart reply parse error: {e}")
-                # Fallback replies
-                return jsonify({
-                    'success': True,
-                    'replies': [
-                        {"text": "Sounds good!", "tone": "positive", "emoji": "👍"},
-                        {"text": "Let me check and get back to you", "tone": "neutral", "emoji": ""},
-                        {"text": "Sure!", "tone": "brief", "emoji": ""}
-                    ]
-                })
+        system_prompt, user_prompt = smart_reply_prompts(data)
+        
+        parsed, result = yield ask_ai_json(system_prompt, user_prompt)
+        
+        if parsed is not None:
+            return {
+                'success': True,
+                'replies': parsed['replies']
+            }, 200
+        elif result:
+            # Fallback replies
+            return {
+                'success': True,
+                'replies': FALLBACK_REPLIES
+            }, 200
         else:
-            return jsonify({
+            return {
                 'success': False,
                 'error': 'AI unavailable'
-            }), 500
+            }, 500
             
     except Exception as e:
-        return jsonify({
+        return {
             'success': False,
             'error': str(e)
-        }), 500
+        }, 500
 
 
+
+@stream_route('/agent/smart_reply/stream')
+def agent_smart_reply_stream(data):
+    """
+    Streaming /agent/smart_reply (Server-Sent Events)
+    Emits a 'reply' event for each suggestion as soon as the model has
+    finished writing it, then 'done' with the full {success, replies} body.
+    Generation stops once the JSON object is closed.
+    """
+    system_prompt, user_prompt = smart_reply_prompts(data, 'agent_smart_reply_stream')
+    
+    stream = yield ask_ai_stream(system_prompt, user_prompt, stop_at_json=True)
+    extractor = JsonStreamExtractor('{')
+    replies = []
+    
+    while True:
+        chunk = yield read_stream(stream)
+        if chunk is None:
+            break
+        complete = extractor.feed(chunk)
+        for reply in extractor.take_items():
+            replies.append(reply)
+            yield emit('reply', reply)
+        if complete:
+            break  # the runner closes the stream, so nothing after the JSON is generated
+    
+    errors = schemas.validate('agent_smart_reply_stream', extractor.value) if extractor.done else None
+    schemas.record('agent_smart_reply_stream', 'unparsed' if errors is None else 'invalid' if errors else 'valid')
+    if errors:
+        print(f"Smart reply stream does not match its schema: {'; '.join(errors[:5])}")
+    
+    if not replies:
+        print("Smart reply stream produced no replies, using fallback")
+        replies = FALLBACK_REPLIES
+        for reply in replies:
+            yield emit('reply', reply)
+    
+    return {'success': True, 'replies': replies}
+
 # ============================================================================
 # NEW AI AGENT: SENTIMENT TRACKER
 # ============================================================================
 
-@app.route('/agent/sentiment_analysis', methods=['POST', 'OPTIONS'])
-def agent_sentiment_analysis():
+@flow_route('/agent/sentiment_analysis', methods=('POST', 'OPTIONS'))
+def agent_sentiment_analysis(data):
     """
     Analyzes sentiment of messages over time
     Returns sentiment score and trend
+    Every message is labeled locally (sentiment.py, cached per message);
+    with narrative=true the model writes the insights text.
     """
-    if request.method == 'OPTIONS':
-        return jsonify({'status': 'ok'}), 200
-    
     try:
-        data = request.json
-        messages = data.get('messages', [])  # List of {text, timestamp, sender}
+        transcript = transcripts.for_request(data)  # messages: [{text, timestamp, sender}]
         contact_name = data.get('contact_name', '')
         
-        system_prompt = """You are a Sentiment Analysis Agent.
-Analyze the emotional tone of these messages over time.
-
-For each message, classify sentiment as:
-- positive (happy, excited, friendly)
-- neutral (informational, casual)
-- negative (sad, angry, frustrated)
-
-Also provide an overall trend and relationship health indicator.
-
-Return ONLY valid JSON:
-{
-  "messages": [
-    {"index": 0, "sentiment": "positive", "score": 0.8, "reason": "enthusiastic greeting"},
-    {"index": 1, "sentiment": "neutral", "score": 0.5, "reason": "factual response"}
-  ],
-  "overall_sentiment": "positive",
-  "trend": "improving|stable|declining",
-  "health_score": 85,
-  "insights": "Relationship seems healthy. Recent messages are warm and engaged."
-}"""
-
-        # Format messages for analysis
-        formatted_messages = "\n".join([
-            f"{i}. [{msg.get('sender', 'Unknown')}] {msg.get('text', '')}" 
-            for i, msg in enumerate(messages[:20])  # Analyze last 20 messages
-        ])
-        
-        user_prompt = f"""Analyze sentiment in conversation with {contact_name}:
-
-{formatted_messages}
-
-Provide sentiment analysis for each message and overall trend."""
+        analysis = sentiment.engine.analyze(transcript)
         
-        result = call_ai(system_prompt, user_prompt)
+        if data.get('narrative') and analysis['messages']:
+            labels = [m['sentiment'] for m in analysis['messages']]
+            # Format messages for analysis (newest that fit the token budget)
+            formatted_messages = budget_history(
+                'agent_sentiment_analysis',
+                [f"{line} ({label})" for line, label in zip(transcript.numbered_lines, labels)],
+                conversation=data
+            )
+            
+            system_prompt, user_prompt = prompts.render(
+                'agent_sentiment_analysis', contact_name=contact_name, formatted_messages=formatted_messages,
+                overall_sentiment=analysis['overall_sentiment'], trend=analysis['trend'],
+                positive=labels.count('positive'), neutral=labels.count('neutral'),
+                negative=labels.count('negative')
+            )
+            
+            parsed, _ = yield ask_ai_json(system_prompt, user_prompt)
+            
+            if parsed is not None and parsed.get('insights'):
+                analysis['insights'] = parsed['insights']
         
-        if result:
-            try:
-                parsed = json.loads(result)
-                return jsonify({
-                    'success': True,
-                    'data': parsed
-                })
-            except json.JSONDecodeError:
-                # Fallback analysis
-                return jsonify({
-                    'success': True,
-                    'data': {
-                        'overall_sentiment': 'neutral',
-                        'trend': 'stable',
-                        'health_score': 70,
-                        'insights': 'Conversation seems balanced and healthy.'
-                    }
-                })
-        else:
-            return jsonify({
-                'success': False,
-                'error': 'AI unavailable'
-            }), 500
+        return {
+            'success': True,
+            'data': analysis
+        }, 200
             
     except Exception as e:
-        return jsonify({
+        return {
             'success': False,
             'error': str(e)
-        }), 500
+        }, 500
 
 
 # ============================================================================
 # NEW AI AGENT: RELATIONSHIP HEALTH SCORE
 # ============================================================================
 
-@app.route('/agent/relationship_health', methods=['POST', 'OPTIONS'])
-def agent_relationship_health():
+def health_features(data):
+    """health_score inputs of one contact's request"""
+    return health_score.features(
+        contact_features.for_request(data),
+        message_count=data.get('message_count'),
+        days_since_last=data.get('days_since_last_message'),
+        messages_per_week=data.get('avg_messages_per_week') or None,  # 0 = not known
+        avg_reply_hours=data.get('avg_response_time_hours')
+    )
+
+
+@flow_route('/agent/relationship_health', methods=('POST', 'OPTIONS'))
+def agent_relationship_health(data):
     """
     Calculates comprehensive relationship health score (0-100)
-    Based on: frequency, sentiment, response time, topic diversity, conversation timing analysis
+    Frequency, recency and response-time engagement are scored locally from
+    the message timestamps (health_score.py, no model call). With
+    narrative=true the model adds warmth, topic diversity and written
+    insights from the conversation text.
     """
-    if request.method == 'OPTIONS':
-        return jsonify({'status': 'ok'}), 200
-    
     try:
-        data = request.json
         contact_name = data.get('contact_name', '')
-        message_count = data.get('message_count', 0)
-        days_since_last = data.get('days_since_last_message', 0)
-        avg_response_time_hours = data.get('avg_response_time_hours', 24)
-        conversation_history = data.get('conversation_history', '')
-        messages = data.get('messages', [])  # NEW: Array of message objects with timestamps
-        
-        # Calculate actual response times from message logs
-        response_times = []
-        last_other_time = None
-        
-        for msg in messages:
-            if 'timestamp' in msg and 'isUser' in msg:
-                timestamp = msg['timestamp']
-                is_user = msg['isUser']
-                
-                if not is_user:  # Their message
-                    last_other_time = timestamp
-                elif is_user and last_other_time:  # Your response
-                    # Calculate time between their message and your response
-                    try:
-                        from datetime import datetime
-                        their_time = datetime.fromisoformat(last_other_time.replace('Z', '+00:00'))
-                        your_time = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                        diff_hours = (your_time - their_time).total_seconds() / 3600
-                        if diff_hours > 0 and diff_hours < 168:  # Within a week
-                            response_times.append(diff_hours)
-                    except:
-                        pass
-                    last_other_time = None
-        
-        # Calculate average response time from actual data
-        actual_avg_response = sum(response_times) / len(response_times) if response_times else avg_response_time_hours
-        
-        # Calculate response consistency (how much it varies)
-        response_variance = 0
-        if len(response_times) > 1:
-            avg = sum(response_times) / len(response_times)
-            response_variance = sum((x - avg) ** 2 for x in response_times) / len(response_times)
-            response_variance = (response_variance ** 0.5) / avg if avg > 0 else 0  # Coefficient of variation
-        
-        system_prompt = f"""You are an AI Relationship Health Analyzer using NVIDIA Nemotron intelligence.
-Calculate a health score (0-100) for the relationship with {contact_name}.
-
-IMPORTANT CONTEXT ANALYSIS:
-- Total messages: {message_count}
-- Days since last contact: {days_since_last}
-- Actual average response time: {actual_avg_response:.1f} hours
-- Response consistency: {"Very consistent" if response_variance < 0.5 else "Variable" if response_variance < 1 else "Very inconsistent"}
-- Number of tracked responses: {len(response_times)}
-
-SCORING CRITERIA:
-1. **Frequency Score (0-100)**: Message count and interaction density
-   - 50+ messages/week = 90-100
-   - 20-49 messages/week = 70-89
-   - 10-19 messages/week = 50-69
-   - 5-9 messages/week = 30-49
-   - <5 messages/week = 10-29
-
-2. **Recency Score (0-100)**: Time since last message
-   - 0-1 days = 90-100
-   - 2-3 days = 70-89
-   - 4-7 days = 50-69
-   - 8-14 days = 30-49
-   - 15-30 days = 10-29
-   - 30+ days = 0-9
-
-3. **Engagement Score (0-100)**: Response time quality
-   - <2 hours = 90-100 (highly engaged)
-   - 2-6 hours = 70-89 (good engagement)
-   - 6-24 hours = 50-69 (moderate)
-   - 24-48 hours = 30-49 (slow)
-   - 48+ hours = 10-29 (very slow)
-   - If response times are inconsistent (high variance), reduce score by 10-20 points
-
-4. **Warmth Score (0-100)**: Emotional tone and conversation depth
-   - Analyze message content for warmth, empathy, humor
-   - Look for personal questions, follow-ups, emojis
-   - Detect genuine interest vs transactional communication
-
-5. **Diversity Score (0-100)**: Topic variety
-   - Multiple topics discussed = 80-100
-   - Few topics but deep = 60-79
-   - Repetitive topics = 40-59
-   - Only logistics/brief = 20-39
-
-INTELLIGENCE FACTORS:
-- If response time is >24 hours on average, flag as "needs attention"
-- If days since last message >7, recommend reaching out
-- If message count is low but recent, still growing relationship
-- If response times are getting slower over time, relationship weakening
-
-Return ONLY valid JSON:
-{{
-  "overall_score": 85,
-  "breakdown": {{
-    "frequency_score": 80,
-    "recency_score": 70,
-    "engagement_score": 90,
-    "diversity_score": 85,
-    "warmth_score": 88
-  }},
-  "status": "excellent|good|fair|needs_attention",
-  "insights": [
-    "Your response time is {actual_avg_response:.1f} hours - [analysis here]",
-    "[Contextual insight based on conversation patterns]",
-    "[Specific observation about relationship dynamic]"
-  ],
-  "suggestions": [
-    "[Actionable suggestion based on the data]",
-    "[Time-sensitive recommendation if needed]"
-  ],
-  "relationship_trend": "improving|stable|declining",
-  "priority_level": "high|medium|low"
-}}"""
-
-        user_prompt = f"""Analyze relationship health with {contact_name}:
-
-MESSAGE TIMING ANALYSIS:
-- Total messages exchanged: {message_count}
-- Days since last contact: {days_since_last}
-- Your actual average response time: {actual_avg_response:.1f} hours
-- Response time consistency: {response_variance:.2f} (0=perfect, >1=very inconsistent)
-- Tracked response samples: {len(response_times)}
-
-RECENT CONVERSATION SAMPLE:
-{conversation_history[:1500]}
-
-DETAILED INSTRUCTIONS:
-1. Use the ACTUAL response time data ({actual_avg_response:.1f} hours) not the generic average
-2. If response times are >24 hours, decrease engagement score significantly
-3. If days_since_last >7, decrease recency score and flag as needs attention
-4. Analyze conversation depth and emotional warmth from the text
-5. Provide specific, actionable insights based on this person's communication pattern
-
-Calculate comprehensive health score with context-aware intelligence."""
-        
-        result = call_ai(system_prompt, user_prompt)
-        
-        if result:
-            try:
-                parsed = json.loads(result)
-                
-                # Log the analysis for future improvement
-                print(f"\n🧠 Health Score Analysis for {contact_name}:")
-                print(f"   Score: {parsed.get('overall_score', 'N/A')}/100")
-                print(f"   Status: {parsed.get('status', 'N/A')}")
-                print(f"   Trend: {parsed.get('relationship_trend', 'N/A')}")
-                print(f"   Avg Response: {actual_avg_response:.1f}h")
-                
-                return jsonify({
-                    'success': True,
-                    'data': parsed
-                })
-            except json.JSONDecodeError:
-                # Fallback calculation with intelligence
-                base_score = 100
-                
-                # Recency penalty (aggressive)
-                if days_since_last > 30:
-                    base_score -= 50
-                elif days_since_last > 14:
-                    base_score -= 35
-                elif days_since_last > 7:
-                    base_score -= 20
-                elif days_since_last > 3:
-                    base_score -= 10
-                
-                # Response time penalty (context-aware)
-                if actual_avg_response > 48:
-                    base_score -= 30
-                elif actual_avg_response > 24:
-                    base_score -= 20
-                elif actual_avg_response > 12:
-                    base_score -= 10
-                
-                # Frequency bonus
-                if message_count > 100:
-                    base_score += 10
-                elif message_count < 20:
-                    base_score -= 10
-                
-                base_score = max(min(base_score, 100), 20)  # Clamp 20-100
-                
-                status = 'excellent' if base_score >= 80 else 'good' if base_score >= 60 else 'fair' if base_score >= 40 else 'needs_attention'
-                
-                return jsonify({
-                    'success': True,
-                    'data': {
-                        'overall_score': base_score,
-                        'status': status,
-                        'insights': [
-                            f'Average response time: {actual_avg_response:.1f} hours',
-                            f'Last contact: {days_since_last} days ago',
-                            f'Total messages: {message_count}'
-                        ],
-                        'suggestions': [
-                            'Reach out soon!' if days_since_last > 7 else 'Keep up the conversation!',
-                            'Try to respond faster' if actual_avg_response > 24 else 'Good response time!'
-                        ],
-                        'relationship_trend': 'stable',
-                        'priority_level': 'high' if days_since_last > 7 or actual_avg_response > 24 else 'medium'
-                    }
-                })
-        else:
-            return jsonify({
-                'success': False,
-                'error': 'AI unavailable'
-            }), 500
+        features = health_features(data)
+        health = health_score.score([features])[0]
+        
+        if data.get('narrative'):
+            system_prompt, user_prompt = prompts.render(
+                'agent_relationship_health',
+                contact_name=contact_name,
+                relationship_trend=health['relationship_trend'],
+                response_samples=health['metrics']['response_samples'],
+                days_since_last=health['metrics']['days_since_last'],
+                avg_response_hours=health['metrics']['avg_response_hours'],
+                conversation_history=budget_history(
+                    'agent_relationship_health', history_lines(data, 'conversation_history'), conversation=data
+                ),
+                **health['breakdown']
+            )
+            
+            parsed, _ = yield ask_ai_json(system_prompt, user_prompt)
+            
+            if parsed is not None:
+                narrated = health_score.score(
+                    [features], warmth=[parsed.get('warmth_score')], diversity=[parsed.get('diversity_score')]
+                )[0]
+                narrated['insights'] = health['insights'][:1] + (parsed.get('insights') or health['insights'][1:])
+                narrated['suggestions'] = parsed.get('suggestions') or health['suggestions']
+                health = narrated
+            else:
+                print(f"[HEALTH] No narrative for {contact_name}, returning computed scores")
+        
+        print(f"\n🧠 Health Score Analysis for {contact_name}:")
+        print(f"   Score: {health['overall_score']}/100")
+        print(f"   Status: {health['status']}")
+        print(f"   Trend: {health['relationship_trend']}")
+        print(f"   Avg Response: {health['metrics']['avg_response_hours']:.1f}h")
+        
+        return {
+            'success': True,
+            'data': health
+        }, 200
             
     except Exception as e:
         print(f"❌ Health score error: {e}")
-        return jsonify({
+        return {
             'success': False,
             'error': str(e)
-        }), 500
+        }, 500
+
+
+@flow_route('/agent/relationship_health/bulk', methods=('POST', 'OPTIONS'))
+def agent_relationship_health_bulk(data):
+    """
+    Health scores of many contacts in one call, computed locally
+    
+    Body: {contacts: [{contact_name, messages | conversation_id | message_count,
+                       days_since_last_message, avg_response_time_hours, ...}]}
+    Returns: {results: [{contact_name, success, data}]} in input order
+    No narrative here: one model call per contact is what bulk scoring avoids.
+    """
+    try:
+        started = time.time()
+        contacts = data.get('contacts') or []
+        
+        results, features, slots = [], [], []
+        for contact in contacts:
+            resolved = resolve_conversation(contact)
+            if isinstance(resolved, tuple):
+                body, _ = resolved
+                results.append({'contact_name': contact.get('contact_name', ''), 'success': False, 'error': body['error']})
+            else:
+                # A contact sent as {conversation_id} is named by its stored conversation
+                slots.append((len(results), resolved.get('contact_name', '')))
+                results.append(None)
+                features.append(health_features(resolved))
+        
+        for (slot, contact_name), health in zip(slots, health_score.score(features)):
+            results[slot] = {'contact_name': contact_name, 'success': True, 'data': health}
+        
+        elapsed_ms = (time.time() - started) * 1000
+        print(f"[HEALTH] Scored {len(features)} contacts in {elapsed_ms:.1f}ms")
+        return {
+            'success': True,
+            'results': results,
+            'scoring_ms': round(elapsed_ms, 2)
+        }, 200
+        
+    except Exception as e:
+        print(f"❌ Bulk health score error: {e}")
+        return {'success': False, 'error': str(e)}, 500
 
 
 # ============================================================================
 # NEW AI AGENT: CONTEXT RECALL
 # ============================================================================
 
-@app.route('/agent/context_recall', methods=['POST', 'OPTIONS'])
-def agent_context_recall():
+@flow_route('/agent/context_recall', methods=('POST', 'OPTIONS'))
+def agent_context_recall(data):
     """
     Surfaces relevant context from past conversations
     Shows reminders about important topics/events
     """
-    if request.method == 'OPTIONS':
-        return jsonify({'status': 'ok'}), 200
-    
     try:
-        data = request.json
         contact_name = data.get('contact_name', '')
-        conversation_history = data.get('conversation_history', '')
-        
-        system_prompt = f"""You are a Context Recall Agent.
-Analyze the conversation history with {contact_name} and surface:
-1. Important topics they mentioned recently
-2. Upcoming events/dates
-3. Things they're working on/worried about
-4. Good follow-up questions
-
-Return ONLY valid JSON:
-{{
-  "reminders": [
-    {{"type": "event", "text": "She mentioned job interview last week", "priority": "high"}},
-    {{"type": "topic", "text": "Planning vacation to Japan", "priority": "medium"}},
-    {{"type": "concern", "text": "Stressed about work deadline", "priority": "high"}}
-  ],
-  "suggested_questions": [
-    "How did your job interview go?",
-    "Any updates on the Japan trip?",
-    "Hope work is less stressful now!"
-  ],
-  "key_facts": [
-    "Lactose intolerant - avoid suggesting dairy restaurants",
-    "Loves hiking - suggest outdoor activities",
-    "Has a dog named Max"
-  ]
-}}"""
-
-        user_prompt = f"""Recall important context from conversation with {contact_name}:
-
-{conversation_history}
-
-Surface relevant reminders and suggestions."""
-        
-        result = call_ai(system_prompt, user_prompt)
+        conversation_history = history_lines(data, 'conversation_history')
+        
+        system_prompt, user_prompt = prompts.render(
+            'agent_context_recall', contact_name=contact_name,
+            conversation_history=budget_history('agent_context_recall', conversation_history, conversation=data)
+        )
+        
+        parsed, result = yield ask_ai_json(system_prompt, user_prompt)
         
         if result:
-            try:
-                parsed = json.loads(result)
-                return jsonify({
+            if parsed is not None:
+                return {
                     'success': True,
                     'data': parsed
-                })
-            except json.JSONDecodeError:
-                return jsonify({
+                }, 200
+            else:
+                return {
                     'success': True,
                     'data': {
                         'reminders': [],
                         'suggested_questions': ['How have you been?'],
                         'key_facts': []
                     }
-                })
+                }, 200
         else:
-            return jsonify({
+            return {
                 'success': False,
                 'error': 'AI unavailable'
-            }), 500
+            }, 500
             
     except Exception as e:
-        return jsonify({
+        return {
             'success': False,
             'error': str(e)
-        }), 500
+        }, 500
 
 
 # ============================================================================
 # NEW AI AGENT: SMART NOTIFICATION MANAGER
 # ============================================================================
 
-@app.route('/agent/smart_notifications', methods=['POST', 'OPTIONS'])
-def agent_smart_notifications():
+def notification_prompts(notification, avg_messages_per_week, last_message_from, history, conversation):
     """
-    Intelligent notification timing based on texting patterns using Nvidia Nemotron
+    (system_prompt, user_prompt) asking the model to word a rule-based notification
+    conversation: the request (or stored conversation) the history is of
+    """
+    contact_name = notification['contact_name']
+    return prompts.render(
+        'agent_smart_notifications',
+        contact_name=contact_name,
+        priority=notification['priority'],
+        relationship_type=notification['relationship_type'],
+        avg_messages_per_week=avg_messages_per_week,
+        days_since_last_message=notification['days_since_last_message'],
+        last_message_from=last_message_from,
+        notification_message=notification['notification_message'],
+        suggested_action=notification['suggested_action'],
+        conversation_history=budget_history('agent_smart_notifications', history, conversation=conversation) or 'Not available'
+    )
+
+
+@flow_route('/agent/smart_notifications', methods=('POST', 'OPTIONS'))
+def agent_smart_notifications(data):
+    """
+    Intelligent notification timing based on texting patterns
     
-    Logic:
+    Logic (notifications.py):
     - Frequent contacts (text often): Notify if no reply within hours/1 day
     - Occasional contacts: Notify after 3-5 days
     - Rare contacts: Notify after 1-2 weeks
     
-    Uses NVIDIA Nemotron GPU to understand relationship patterns
+    The decision is rule-based; NVIDIA Nemotron only words notifications
+    that are sent (skip with phrase=false)
     """
-    if request.method == 'OPTIONS':
-        return jsonify({'status': 'ok'}), 200
-    
     try:
-        data = request.json
         contact_name = data.get('contact_name', '')
-        message_count = data.get('message_count', 0)
-        days_since_last_message = data.get('days_since_last_message', 0)
-        avg_messages_per_week = data.get('avg_messages_per_week', 0)
-        last_message_from = data.get('last_message_from', 'them')  # 'me' or 'them'
-        conversation_history = data.get('conversation_history', '')
-        
-        system_prompt = f"""You are Atlas's Smart Notification Manager powered by NVIDIA Nemotron.
-
-Your job is to intelligently decide when to send notifications based on texting patterns.
-
-Analyze these patterns:
-- Contact: {contact_name}
-- Total messages: {message_count}
-- Days since last message: {days_since_last_message}
-- Average messages per week: {avg_messages_per_week}
-- Last message from: {last_message_from}
-
-RULES:
-1. FREQUENT CONTACTS (>10 msgs/week):
-   - If I sent last message & no reply for 1 day → Notify HIGH priority
-   - If they sent last message & I haven't replied for 6 hours → Notify URGENT
-   
-2. OCCASIONAL CONTACTS (3-10 msgs/week):
-   - If I sent last message & no reply for 3 days → Notify MEDIUM priority
-   - If they sent last message & I haven't replied for 1 day → Notify HIGH
-   
-3. RARE CONTACTS (<3 msgs/week):
-   - If I sent last message & no reply for 7 days → Notify LOW priority
-   - If they sent last message & I haven't replied for 3 days → Notify MEDIUM
-
-4. INACTIVE CONTACTS (>14 days no contact):
-   - Suggest gentle check-in → Notify LOW priority after 2 weeks
-
-Return ONLY valid JSON:
-{{
-  "should_notify": true/false,
-  "priority": "urgent|high|medium|low",
-  "notification_timing": "now|in_6_hours|in_1_day|in_3_days|in_1_week",
-  "relationship_type": "frequent|occasional|rare|inactive",
-  "notification_message": "Brief reason for notification",
-  "suggested_action": "What user should do",
-  "reasoning": "Why this timing makes sense based on texting pattern",
-  "wait_hours": 0-168 (hours to wait before notifying)
-}}"""
-
-        user_prompt = f"""Analyze notification timing for {contact_name}:
-
-Texting Pattern Analysis:
-- We exchange {avg_messages_per_week} messages per week on average
-- Last message was {days_since_last_message} days ago
-- Total message history: {message_count} messages
-- Last message sent by: {last_message_from}
-
-Recent conversation context:
-{conversation_history[:500]}
-
-Should I notify the user about this conversation? When and why?"""
-        
-        # Use NVIDIA Nemotron for intelligent analysis
-        result = call_ai(system_prompt, user_prompt, use_brev=True)
+        features = contact_features.for_request(data)
+        if features['last_message_at'] is not None:
+            days_since_last_message = features['days_since_last_message']
+            avg_messages_per_week = features['avg_messages_per_week']
+        else:
+            # No dated messages: the client's own numbers
+            days_since_last_message = data.get('days_since_last_message', 0)
+            avg_messages_per_week = data.get('avg_messages_per_week', 0)
+        last_message_from = features['last_message_from'] or data.get('last_message_from', 'them')  # 'me' or 'them'
         
-        if result:
-            try:
-                content = result['choices'][0]['message']['content']
-                
-                # Extract JSON from response
-                if '{' in content:
-                    json_start = content.index('{')
-                    json_end = content.rindex('}') + 1
-                    parsed = json.loads(content[json_start:json_end])
-                    
-                    return jsonify({
-                        'success': True,
-                        'data': parsed
-                    })
-            except json.JSONDecodeError:
-                pass
-        
-        # Fallback: Rule-based notification logic
-        relationship_type = 'frequent' if avg_messages_per_week > 10 else \
-                           'occasional' if avg_messages_per_week > 3 else \
-                           'rare' if avg_messages_per_week > 0 else 'inactive'
-        
-        should_notify = False
-        priority = 'low'
-        timing = 'in_1_week'
-        wait_hours = 168
-        notification_message = ''
-        suggested_action = ''
-        
-        # Apply rules
-        if relationship_type == 'frequent':
-            if last_message_from == 'me' and days_since_last_message >= 1:
-                should_notify = True
-                priority = 'high'
-                timing = 'now'
-                wait_hours = 0
-                notification_message = f"{contact_name} hasn't replied in {days_since_last_message} days (unusual for you two)"
-                suggested_action = "Send a gentle follow-up"
-            elif last_message_from == 'them' and days_since_last_message >= 0.25:  # 6 hours
-                should_notify = True
-                priority = 'urgent'
-                timing = 'now'
-                wait_hours = 0
-                notification_message = f"You haven't replied to {contact_name} yet (you usually reply quickly)"
-                suggested_action = "Reply to their message"
-        
-        elif relationship_type == 'occasional':
-            if last_message_from == 'me' and days_since_last_message >= 3:
-                should_notify = True
-                priority = 'medium'
-                timing = 'now'
-                wait_hours = 0
-                notification_message = f"No reply from {contact_name} in 3 days"
-                suggested_action = "Maybe check in?"
-            elif last_message_from == 'them' and days_since_last_message >= 1:
-                should_notify = True
-                priority = 'high'
-                timing = 'now'
-                wait_hours = 0
-                notification_message = f"{contact_name} sent a message yesterday"
-                suggested_action = "Reply when you have time"
-        
-        elif relationship_type == 'rare':
-            if last_message_from == 'me' and days_since_last_message >= 7:
-                should_notify = True
-                priority = 'low'
-                timing = 'now'
-                wait_hours = 0
-                notification_message = f"Been a week since you messaged {contact_name}"
-                suggested_action = "No rush, but maybe follow up?"
-            elif last_message_from == 'them' and days_since_last_message >= 3:
-                should_notify = True
-                priority = 'medium'
-                timing = 'now'
-                wait_hours = 0
-                notification_message = f"{contact_name} messaged 3 days ago"
-                suggested_action = "They might be waiting for your reply"
-        
-        else:  # inactive
-            if days_since_last_message >= 14:
-                should_notify = True
-                priority = 'low'
-                timing = 'in_1_week'
-                wait_hours = 168
-                notification_message = f"Haven't talked to {contact_name} in 2 weeks"
-                suggested_action = "Maybe send a friendly check-in?"
-        
-        return jsonify({
+        decision = notifications.evaluate(
+            contact_name, avg_messages_per_week, last_message_from, days_since_last_message
+        )
+        
+        if decision['should_notify'] and data.get('phrase', True):
+            system_prompt, user_prompt = notification_prompts(
+                {**decision, 'contact_name': contact_name, 'days_since_last_message': round(days_since_last_message, 1)},
+                avg_messages_per_week, last_message_from, history_lines(data, 'conversation_history'), data
+            )
+            parsed, _ = yield ask_ai_json(system_prompt, user_prompt, use_brev=True)
+            # The rules decided whether and when; the model only words it
+            decision.update(notifications.wording(parsed))
+        
+        return {
             'success': True,
-            'data': {
-                'should_notify': should_notify,
-                'priority': priority,
-                'notification_timing': timing,
-                'relationship_type': relationship_type,
-                'notification_message': notification_message,
-                'suggested_action': suggested_action,
-                'reasoning': f"Based on {relationship_type} texting pattern ({avg_messages_per_week} msgs/week)",
-                'wait_hours': wait_hours
-            }
-        })
+            'data': decision
+        }, 200
             
     except Exception as e:
-        return jsonify({
+        return {
             'success': False,
             'error': str(e)
-        }), 500
+        }, 500
+
+
+# ============================================================================
+# ALL-CONTACTS NOTIFICATION SCHEDULER
+# ============================================================================
+
+def phrase_notification(notification, contact):
+    """Scheduler hook: the model's wording of a due notification, None to keep the rule's"""
+    if not NOTIFICATION_PHRASING:
+        return None
+    source = {'contact_name': notification['contact_name'], 'messages': []}
+    conversation = conversation_store.get(str(contact['conversation_id'])) if contact.get('conversation_id') else None
+    if conversation is not None:
+        source.update(conversation_id=conversation.id, messages=conversation.since(0))
+    system_prompt, user_prompt = notification_prompts(
+        notification, contact['avg_messages_per_week'], contact['last_message_from'],
+        transcripts.for_request(source).lines, source
+    )
+    parsed, _ = call_ai_json(system_prompt, user_prompt, agent='agent_smart_notifications')
+    return parsed
+
+
+def deliver_notification(notification):
+    if NOTIFICATION_WEBHOOK_URL:
+        upstream.post(NOTIFICATION_WEBHOOK_URL, json=notification, timeout=10).raise_for_status()
+
+
+notifier = NotificationScheduler(deliver=deliver_notification, phrase=phrase_notification)
+
+
+def notification_contact(contact):
+    """
+    Scheduler entry for one contact of /notifications/contacts: the contact's
+    features (from inline messages or a stored conversation_id), else its
+    explicit last_message_at / last_message_from / avg_messages_per_week
+    None if the contact has no dated last message
+    """
+    resolved = resolve_conversation(contact)
+    if isinstance(resolved, tuple):
+        return None
+    features = contact_features.for_request(resolved)
+    
+    last_message_at = features['last_message_at']
+    avg_messages_per_week = features['avg_messages_per_week']
+    if last_message_at is None:
+        last_message_at = transcripts.parse_epoch(contact.get('last_message_at'))
+        if math.isnan(last_message_at):
+            return None
+        avg_messages_per_week = contact.get('avg_messages_per_week', 0)
+    last_message_from = features['last_message_from'] or contact.get('last_message_from') or 'them'
+    
+    return {
+        'key': str(contact.get('contact_id') or contact.get('conversation_id') or contact.get('contact_name')),
+        'contact_name': contact.get('contact_name') or resolved.get('contact_name') or 'Contact',
+        'conversation_id': contact.get('conversation_id'),
+        'last_message_at': last_message_at,
+        'last_message_from': last_message_from,
+        'avg_messages_per_week': avg_messages_per_week,
+    }
+
+
+@flow_route('/notifications/contacts', methods=('POST', 'OPTIONS'), resolve=False)
+def notifications_contacts(data):
+    """
+    Schedule follow-up notifications for all contacts at once
+    
+    Body: {contacts: [{contact_id, contact_name, last_message_at, last_message_from,
+                       avg_messages_per_week} | {contact_id, contact_name, messages | conversation_id}]}
+    Each contact's next due time is computed from the texting rules; due
+    notifications appear on /notifications/pending (and the webhook), so the
+    app no longer asks about every contact.
+    Returns: {scheduled, unscheduled, due_now, next_due_at}
+    """
+    try:
+        contacts = data.get('contacts') or []
+        entries = [entry for entry in map(notification_contact, contacts) if entry is not None]
+        result = notifier.upsert(entries)
+        result['unscheduled'] += len(contacts) - len(entries)
+        return {'success': True, **result}, 200
+    except Exception as e:
+        print(f"[NOTIFY] Scheduling failed: {e}")
+        return {'success': False, 'error': str(e)}, 500
+
+
+@flow_route('/notifications/pending', methods=('GET', 'POST', 'OPTIONS'), resolve=False)
+def notifications_pending(data):
+    """Due notifications not collected yet, oldest first (each is returned once)"""
+    limit = int((data or {}).get('limit') or 100)
+    return {'success': True, 'notifications': notifier.pending(limit)}, 200
 
 
 # ============================================================================
@@ -1388,386 +2113,192 @@ Should I notify the user about this conversation? When and why?"""
 # other important dates mentioned in messages
 # ============================================================================
 
-@app.route('/agent/key_dates', methods=['POST', 'OPTIONS'])
-def key_dates_agent():
+@flow_route('/agent/key_dates', methods=('POST', 'OPTIONS'))
+def key_dates_agent(data):
     """
     AGENT 4: Key Dates Intelligence
     Extracts and tracks important dates from conversation history
-    Analyzes last 20 messages to find birthdays, anniversaries, special events
+    Finds date expressions locally (date_extract.py); the model only classifies
+    the sentences that have one, and isn't called when there are none
     """
-    if request.method == 'OPTIONS':
-        return handle_options('agent/key_dates')
-    
     try:
-        data = request.get_json()
         contact_name = data.get('contact_name', 'Contact')
-        recent_messages = data.get('recent_messages', [])  # List of {text, timestamp, isUser}
-        
-        print(f"[KEY DATES AGENT] Analyzing {len(recent_messages)} messages for {contact_name}")
-        
-        # Analyze with AI to find key dates
-        system_prompt = """You are a Key Dates Intelligence Agent powered by NVIDIA AI.
-
-Your task: Extract important dates from conversations with extreme accuracy.
-
-CRITICAL RULES:
-1. NEVER return "null" - always provide specific values
-2. Extract EXACT dates when mentioned (e.g., "March 15th" -> "March 15, 2026")
-3. Calculate relative dates precisely (e.g., "next Friday" -> calculate actual date)
-4. If year not mentioned, assume upcoming occurrence in 2025/2026
-5. Always provide person name (contact's name if about them, or "Contact's [relation]")
-
-Date Types to Find:
-- birthday: Personal birthdays
-- anniversary: Relationship/work anniversaries  
-- graduation: School graduations
-- wedding: Wedding events
-- trip: Vacations/travel plans
-- meeting: Scheduled meetings
-- event: Other special events
-
-For EACH date, return this EXACT structure:
-{
-    "type": "birthday",
-    "person": "Sarah" OR "Sarah's brother" (NEVER null),
-    "date": "March 15, 2026" (NEVER null - calculate if needed),
-    "date_relative": "in 4 months" OR "2 weeks ago" (NEVER null),
-    "context": "Exact quote from conversation" (NEVER null),
-    "significance": "high" OR "medium" OR "low"
-}
-
-Examples:
-- "Happy birthday!" -> type: birthday, person: [contact_name], date: [today's date]
-- "My birthday is March 15" -> type: birthday, person: [contact_name], date: "March 15, 2026"
-- "Brother graduates in June" -> type: graduation, person: "[contact_name]'s brother", date: "June 15, 2025"
-
-Return VALID JSON ONLY:
-{
-    "dates_found": [...],
-    "summary": "Found X dates: [list them]"
-}
-
-If NO dates: return empty array with summary "No specific dates mentioned in recent conversation"."""
-
-        # Format messages for analysis
-        message_text = "\n".join([
-            f"{'User' if msg.get('isUser') else contact_name}: {msg.get('text')}"
-            for msg in recent_messages[-20:]  # Analyze last 20 messages
-        ])
+        transcript = transcripts.for_request(data)  # recent_messages: [{text, timestamp, isUser}]
+        today = datetime.now().date()
+        
+        candidates = date_extract.extract(transcript, today)
+        print(f"[KEY DATES AGENT] {len(candidates)} date candidates in {len(transcript)} messages for {contact_name}")
+        if not candidates:
+            return {
+                'success': True,
+                'data': {
+                    'dates_found': [],
+                    'summary': 'No specific dates mentioned in recent conversation'
+                }
+            }, 200
         
-        user_prompt = f"""Contact: {contact_name}
-Today's date: November 9, 2025
-
-Recent conversation:
-{message_text}
-
-Extract ALL dates with specific values (NO nulls). If you see "my birthday" and it's said recently, extract it as their birthday."""
+        # Candidate sentences with their resolved dates (newest that fit the token budget)
+        message_text = budget_history(
+            'key_dates_agent', [date_extract.candidate_line(c) for c in candidates],
+            use_brev=False, conversation=data
+        )
+        
+        system_prompt, user_prompt = prompts.render(
+            'key_dates_agent', contact_name=contact_name, message_text=message_text,
+            today=date_extract.label(today)
+        )
 
-        result = call_ai(system_prompt, user_prompt, use_brev=False)
+        dates_data, _ = yield ask_ai_json(system_prompt, user_prompt, use_brev=False)
         
-        if result and 'choices' in result:
-            ai_response = result['choices'][0]['message']['content']
-            print(f"[KEY DATES AGENT] AI Response: {ai_response[:200]}...")
-            
-            # Try to parse JSON from response
-            try:
-                import re
-                # Extract JSON from markdown code blocks if present
-                json_match = re.search(r'```(?:json)?\s*(\{.*\})\s*```', ai_response, re.DOTALL)
-                if json_match:
-                    json_str = json_match.group(1)
-                else:
-                    json_match = re.search(r'\{.*\}', ai_response, re.DOTALL)
-                    json_str = json_match.group() if json_match else None
-                
-                if json_str:
-                    dates_data = json.loads(json_str)
-                    
-                    # Validate and clean data - replace any nulls
-                    for date_entry in dates_data.get('dates_found', []):
-                        if not date_entry.get('person') or date_entry['person'] == 'null':
-                            date_entry['person'] = contact_name
-                        if not date_entry.get('date') or date_entry['date'] == 'null':
-                            date_entry['date'] = 'Date TBD'
-                        if not date_entry.get('date_relative') or date_entry['date_relative'] == 'null':
-                            date_entry['date_relative'] = 'Coming up'
-                        if not date_entry.get('context') or date_entry['context'] == 'null':
-                            date_entry['context'] = 'Mentioned in conversation'
-                        
-                        # Add icon based on type
-                        date_type = date_entry.get('type', '')
-                        if 'birthday' in date_type.lower():
-                            date_entry['icon'] = '🎂'
-                        elif 'anniversary' in date_type.lower():
-                            date_entry['icon'] = '💕'
-                        elif 'graduation' in date_type.lower():
-                            date_entry['icon'] = '🎓'
-                        elif 'wedding' in date_type.lower():
-                            date_entry['icon'] = '💒'
-                        elif 'trip' in date_type.lower() or 'vacation' in date_type.lower():
-                            date_entry['icon'] = '✈️'
-                        elif 'meeting' in date_type.lower():
-                            date_entry['icon'] = '☕'
-                        else:
-                            date_entry['icon'] = '📅'
-                    
-                    print(f"[KEY DATES AGENT] Found {len(dates_data.get('dates_found', []))} dates")
-                    return jsonify({
-                        'success': True,
-                        'data': dates_data
-                    })
-                else:
-                    raise ValueError("No JSON found in response")
-            except Exception as e:
-                print(f"[KEY DATES AGENT] Parse error: {e}")
-                dates_data = {
-                    "dates_found": [],
-                    "summary": "No specific dates detected in conversation"
-                }
+        if dates_data is None:
+            # Model unavailable: the resolved candidates on their own
+            found = date_extract.local_dates(candidates, contact_name, today)
+            dates_data = {
+                'dates_found': found,
+                'summary': f"Found {len(found)} dates" if found else 'No specific dates mentioned in recent conversation'
+            }
         
-        return jsonify({
+        # Validate and clean data - replace any nulls
+        for date_entry in dates_data.get('dates_found', []):
+            if not date_entry.get('person') or date_entry['person'] == 'null':
+                date_entry['person'] = contact_name
+            if not date_entry.get('date') or date_entry['date'] == 'null':
+                date_entry['date'] = 'Date TBD'
+            if not date_entry.get('date_relative') or date_entry['date_relative'] == 'null':
+                date_entry['date_relative'] = 'Coming up'
+            if not date_entry.get('context') or date_entry['context'] == 'null':
+                date_entry['context'] = 'Mentioned in conversation'
+            
+            # Add icon based on type
+            date_type = date_entry.get('type', '')
+            if 'birthday' in date_type.lower():
+                date_entry['icon'] = '🎂'
+            elif 'anniversary' in date_type.lower():
+                date_entry['icon'] = '💕'
+            elif 'graduation' in date_type.lower():
+                date_entry['icon'] = '🎓'
+            elif 'wedding' in date_type.lower():
+                date_entry['icon'] = '💒'
+            elif 'trip' in date_type.lower() or 'vacation' in date_type.lower():
+                date_entry['icon'] = '✈️'
+            elif 'meeting' in date_type.lower():
+                date_entry['icon'] = '☕'
+            else:
+                date_entry['icon'] = '📅'
+        
+        print(f"[KEY DATES AGENT] Found {len(dates_data.get('dates_found', []))} dates")
+        return {
             'success': True,
-            'data': {
-                'dates_found': [],
-                'summary': 'No dates detected in recent messages'
-            }
-        })
+            'data': dates_data
+        }, 200
             
     except Exception as e:
-        return jsonify({
+        return {
             'success': False,
             'error': str(e)
-        }), 500
+        }, 500
 
 
 # ========================================
 # NEW AI AGENTS - EXPANDED FUNCTIONALITY
 # ========================================
 
-@app.route('/agent/conversation_insights', methods=['POST', 'OPTIONS'])
-def conversation_insights_agent():
+@flow_route('/agent/conversation_insights', methods=('POST', 'OPTIONS'))
+def conversation_insights_agent(data):
     """
     AGENT 8: Conversation Insights & Patterns
     Deep analysis of conversation dynamics, topics, and relationship evolution
+    Counts, rates, reply times, sessions and active hours are computed
+    locally (conversation_stats.py, once per conversation version); the
+    model gets those numbers plus only the newest messages.
     """
-    if request.method == 'OPTIONS':
-        return jsonify({'status': 'ok'}), 200
-    
     try:
-        data = request.get_json()
         contact_name = data.get('contact_name', 'Contact')
-        recent_messages = data.get('recent_messages', [])
+        transcript = transcripts.for_request(data)
+        stats = conversation_stats.engine.get(
+            transcript, data.get('conversation_id'), data.get('conversation_version')
+        )
         
         print(f"[INSIGHTS AGENT] Analyzing conversation patterns for {contact_name}")
         
-        system_prompt = """You are a Conversation Insights Agent powered by NVIDIA AI.
-
-Analyze conversation patterns and provide actionable intelligence:
-
-1. TOPIC ANALYSIS:
-   - Main topics discussed (work, hobbies, family, goals, etc.)
-   - Topic shifts over time
-   - Shared interests discovered
-
-2. COMMUNICATION STYLE:
-   - Formality level (casual/professional)
-   - Emoji usage patterns
-   - Response length preferences
-   - Humor style compatibility
-
-3. RELATIONSHIP EVOLUTION:
-   - How the relationship has changed
-   - Moments of deepening connection
-   - Areas of growing distance
-
-4. CONVERSATION QUALITY:
-   - Depth of conversations (surface vs meaningful)
-   - Question-asking patterns
-   - Mutual engagement level
-
-5. ACTIONABLE RECOMMENDATIONS:
-   - Topics to explore more
-   - Communication adjustments
-   - Ways to deepen connection
-
-Return JSON:
-{
-    "topics": {
-        "primary": ["work", "travel", "food"],
-        "emerging": ["photography", "fitness"],
-        "declining": ["gaming"]
-    },
-    "communication_style": {
-        "formality": "casual",
-        "emoji_usage": "high",
-        "avg_message_length": "medium",
-        "humor_compatibility": "high"
-    },
-    "relationship_trajectory": {
-        "trend": "improving",
-        "strength": 8.2,
-        "key_moments": ["Shared personal story on Oct 15", "Made plans together"],
-        "areas_of_concern": []
-    },
-    "conversation_quality": {
-        "depth_score": 7.5,
-        "engagement_score": 8.0,
-        "reciprocity_score": 7.8
-    },
-    "recommendations": [
-        "Ask about their photography hobby - they mentioned it 3 times",
-        "Share more personal stories - they open up when you do",
-        "Suggest a video call - text conversations are plateauing"
-    ],
-    "summary": "Your relationship is strengthening with shared interests in travel and photography. Consider moving to deeper conversations."
-}"""
-
-        # Format messages
-        message_text = "\n".join([
-            f"{'User' if msg.get('isUser') else contact_name}: {msg.get('text')} (at {msg.get('timestamp', 'unknown')})"
-            for msg in recent_messages[-50:]  # Analyze more for patterns
-        ])
-        
-        user_prompt = f"""Contact: {contact_name}
-Analyze these {len(recent_messages)} messages for patterns and insights:
-
-{message_text}
-
-Provide deep insights and actionable recommendations."""
-
-        result = call_ai(system_prompt, user_prompt, use_brev=False)
-        
-        if result and 'choices' in result:
-            ai_response = result['choices'][0]['message']['content']
-            print(f"[INSIGHTS AGENT] Generated insights")
-            
-            try:
-                import re
-                json_match = re.search(r'```(?:json)?\s*(\{.*\})\s*```', ai_response, re.DOTALL)
-                if json_match:
-                    insights_data = json.loads(json_match.group(1))
-                else:
-                    json_match = re.search(r'\{.*\}', ai_response, re.DOTALL)
-                    if json_match:
-                        insights_data = json.loads(json_match.group())
-                    else:
-                        raise ValueError("No JSON found")
-                
-                return jsonify({
-                    'success': True,
-                    'data': insights_data
-                })
-            except Exception as e:
-                print(f"[INSIGHTS AGENT] Parse error: {e}")
-                return jsonify({
-                    'success': True,
-                    'data': {
-                        'summary': 'Could not generate detailed insights',
-                        'recommendations': ['Continue regular communication']
-                    }
-                })
+        # Newest messages (the stats cover the rest)
+        message_text = budget_history(
+            'conversation_insights_agent', transcript.timed_lines, use_brev=False, conversation=data
+        )
+        
+        system_prompt, user_prompt = prompts.render(
+            'conversation_insights_agent', contact_name=contact_name,
+            stats_text=conversation_stats.describe(stats, contact_name), message_text=message_text
+        )
+
+        parsed, _ = yield ask_ai_json(system_prompt, user_prompt, use_brev=False)
+        
+        insights_data = dict(parsed) if parsed is not None else {
+            'summary': 'Could not generate detailed insights',
+            'recommendations': ['Continue regular communication']
+        }
+        
+        # Measured values win over the model's estimates
+        user, contact = stats['sides']['user'], stats['sides']['contact']
+        emoji_rate = (user['emoji_rate'] + contact['emoji_rate']) / 2
+        lengths = [side['length']['p50'] for side in (user, contact) if side['length']]
+        typical_length = sum(lengths) / len(lengths) if lengths else 0
+        insights_data['communication_style'] = {
+            **(insights_data.get('communication_style') or {}),
+            'emoji_usage': 'high' if emoji_rate >= 0.3 else 'medium' if emoji_rate >= 0.1 else 'low',
+            'avg_message_length': 'long' if typical_length >= 120 else 'medium' if typical_length >= 40 else 'short'
+        }
+        if stats['messages']:
+            insights_data['conversation_quality'] = {
+                **(insights_data.get('conversation_quality') or {}),
+                'reciprocity_score': round(10 * (1 - abs(user['share'] - 0.5) * 2), 1)
+            }
+        insights_data['stats'] = stats
         
-        return jsonify({'success': False, 'error': 'AI response error'}), 500
+        print(f"[INSIGHTS AGENT] Generated insights")
+        return {
+            'success': True,
+            'data': insights_data
+        }, 200
         
     except Exception as e:
         print(f"[INSIGHTS AGENT] Error: {e}")
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return {'success': False, 'error': str(e)}, 500
 
 
-@app.route('/agent/conversation_starter', methods=['POST', 'OPTIONS'])
-def conversation_starter_agent():
+@flow_route('/agent/conversation_starter', methods=('POST', 'OPTIONS'))
+def conversation_starter_agent(data):
     """
     AGENT 9: Intelligent Conversation Starters
     Generates personalized ice-breakers and conversation topics based on history
     """
-    if request.method == 'OPTIONS':
-        return jsonify({'status': 'ok'}), 200
-    
     try:
-        data = request.get_json()
         contact_name = data.get('contact_name', 'Contact')
-        recent_messages = data.get('recent_messages', [])
+        transcript = transcripts.for_request(data)
         days_since_last = data.get('days_since_last_message', 0)
         
         print(f"[STARTER AGENT] Generating conversation starters for {contact_name}")
         
-        system_prompt = """You are a Conversation Starter Agent powered by NVIDIA AI.
-
-Generate 5 creative, personalized conversation starters based on conversation history.
-
-RULES:
-1. Reference specific past conversations or shared interests
-2. Match the tone/formality of the relationship
-3. Avoid generic "how are you" - be creative!
-4. Consider time since last contact (apologetic if long gap)
-5. Include follow-up questions to topics they mentioned
-
-For EACH starter, provide:
-- The message text
-- The reasoning (why this will work)
-- Expected response type
-- Risk level (safe/medium/bold)
-
-Categories:
-- Callback: Reference something they mentioned
-- Shared Interest: About mutual hobbies/topics
-- Current Event: Something relevant to them
-- Personal: About their life/goals
-- Fun: Lighthearted/humorous
-
-Return JSON:
-{
-    "starters": [
-        {
-            "message": "Hey! Did you end up trying that new coffee place you mentioned?",
-            "reasoning": "They mentioned wanting to try it 2 weeks ago - shows you remember",
-            "category": "callback",
-            "risk_level": "safe",
-            "expected_response": "positive_engagement"
-        }
-    ],
-    "context_note": "It's been 5 days - gentle re-engagement recommended",
-    "best_timing": "afternoon - they're usually more responsive then"
-}"""
-
-        message_text = "\n".join([
-            f"{'User' if msg.get('isUser') else contact_name}: {msg.get('text')}"
-            for msg in recent_messages[-30:]
-        ])
+        message_text = budget_history(
+            'conversation_starter_agent', transcript.lines, use_brev=False, conversation=data
+        )
         
-        user_prompt = f"""Contact: {contact_name}
-Days since last message: {days_since_last}
-
-Recent conversation history:
-{message_text}
-
-Generate 5 personalized conversation starters that will re-engage this relationship."""
+        system_prompt, user_prompt = prompts.render(
+            'conversation_starter_agent', contact_name=contact_name,
+            days_since_last=days_since_last, message_text=message_text
+        )
 
-        result = call_ai(system_prompt, user_prompt, use_brev=False)
+        starters_data, result = yield ask_ai_json(system_prompt, user_prompt, use_brev=False)
         
-        if result and 'choices' in result:
-            ai_response = result['choices'][0]['message']['content']
-            
-            try:
-                import re
-                json_match = re.search(r'```(?:json)?\s*(\{.*\})\s*```', ai_response, re.DOTALL)
-                if json_match:
-                    starters_data = json.loads(json_match.group(1))
-                else:
-                    json_match = re.search(r'\{.*\}', ai_response, re.DOTALL)
-                    if json_match:
-                        starters_data = json.loads(json_match.group())
-                    else:
-                        raise ValueError("No JSON")
-                
-                return jsonify({
+        if result:
+            if starters_data is not None:
+                return {
                     'success': True,
                     'data': starters_data
-                })
-            except Exception as e:
-                print(f"[STARTER AGENT] Parse error: {e}")
+                }, 200
+            else:
                 # Fallback generic starters
-                return jsonify({
+                return {
                     'success': True,
                     'data': {
                         'starters': [
@@ -1779,170 +2310,339 @@ Generate 5 personalized conversation starters that will re-engage this relations
                             }
                         ]
                     }
-                })
+                }, 200
         
-        return jsonify({'success': False, 'error': 'AI error'}), 500
+        return {'success': False, 'error': 'AI error'}, 500
         
     except Exception as e:
         print(f"[STARTER AGENT] Error: {e}")
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return {'success': False, 'error': str(e)}, 500
 
 
-@app.route('/agent/relationship_forecast', methods=['POST', 'OPTIONS'])
-def relationship_forecast_agent():
+@flow_route('/agent/relationship_forecast', methods=('POST', 'OPTIONS'))
+def relationship_forecast_agent(data):
     """
     AGENT 10: Relationship Trajectory Forecasting
     Predicts future relationship health and provides proactive interventions
+    The 30 / 90 day scores and their ranges are fitted locally to
+    health_history (forecast.py); with narrative=true the model phrases the
+    interventions from the recent messages.
     """
-    if request.method == 'OPTIONS':
-        return jsonify({'status': 'ok'}), 200
-    
     try:
-        data = request.get_json()
         contact_name = data.get('contact_name', 'Contact')
-        historical_health_scores = data.get('health_history', [])  # List of {date, score}
-        recent_messages = data.get('recent_messages', [])
         
         print(f"[FORECAST AGENT] Predicting relationship trajectory for {contact_name}")
         
-        system_prompt = """You are a Relationship Forecasting Agent powered by NVIDIA AI.
-
-Analyze historical data and current patterns to predict relationship trajectory.
-
-Analyze:
-1. Health score trends (improving/declining/stable)
-2. Communication frequency patterns
-3. Engagement quality over time
-4. Warning signs or positive indicators
-
-Provide:
-1. 30-day forecast (predicted health score)
-2. 90-day forecast
-3. Risk factors that could cause decline
-4. Protective factors maintaining health
-5. Proactive interventions to prevent decline
-6. Milestone predictions (when relationship might reach key points)
-
-Return JSON:
-{
-    "current_health": 75,
-    "forecast_30_days": {
-        "predicted_score": 72,
-        "confidence": "high",
-        "trajectory": "slight_decline",
-        "reasoning": "Message frequency decreasing, needs intervention"
-    },
-    "forecast_90_days": {
-        "predicted_score": 65,
-        "confidence": "medium",
-        "trajectory": "moderate_decline"
-    },
-    "risk_factors": [
-        {
-            "factor": "Decreasing message frequency",
-            "severity": "medium",
-            "impact": -5,
-            "mitigation": "Schedule regular check-ins"
-        }
-    ],
-    "protective_factors": [
-        {
-            "factor": "Strong shared interests",
-            "strength": "high",
-            "leverage": "Suggest activities around shared hobbies"
-        }
-    ],
-    "interventions": [
-        {
-            "action": "Plan a video call this week",
-            "priority": "high",
-            "expected_impact": "+8 points",
-            "timing": "within 3 days"
-        },
-        {
-            "action": "Send a thoughtful message about their work project",
-            "priority": "medium",
-            "expected_impact": "+3 points",
-            "timing": "today"
-        }
-    ],
-    "milestones": [
-        {
-            "event": "Risk of relationship becoming distant",
-            "predicted_date": "December 15, 2025",
-            "prevention_deadline": "November 20, 2025"
-        }
-    ],
-    "summary": "Relationship is stable but showing early decline signs. Proactive engagement in next 2 weeks critical to maintain health."
-}"""
+        prediction = forecast.forecast([forecast_contact(data)])[0]
+        
+        if data.get('narrative'):
+            transcript = transcripts.for_request(data)
+            forecast_text = "\n".join([
+                f"Current health: {prediction['current_health']}",
+                f"In 30 days: {prediction['forecast_30_days']['predicted_score']} "
+                f"({prediction['forecast_30_days']['trajectory']}, {prediction['forecast_30_days']['reasoning']})",
+                f"In 90 days: {prediction['forecast_90_days']['predicted_score']} "
+                f"({prediction['forecast_90_days']['trajectory']})",
+            ] + [f"Risk: {r['factor']}" for r in prediction['risk_factors']])
+            
+            message_text = budget_history(
+                'relationship_forecast_agent', transcript.lines, use_brev=False, conversation=data
+            )
+            
+            system_prompt, user_prompt = prompts.render(
+                'relationship_forecast_agent', contact_name=contact_name,
+                forecast_text=forecast_text, message_text=message_text
+            )
 
-        # Format health history
-        health_text = "\n".join([
-            f"Date: {h.get('date')}, Score: {h.get('score')}"
-            for h in historical_health_scores[-10:]  # Last 10 data points
-        ])
+            phrased, _ = yield ask_ai_json(system_prompt, user_prompt, use_brev=False)
+            
+            if phrased is not None and phrased.get('interventions'):
+                prediction['interventions'] = phrased['interventions']
         
-        message_text = "\n".join([
-            f"{'User' if msg.get('isUser') else contact_name}: {msg.get('text')}"
-            for msg in recent_messages[-20:]
-        ])
+        return {
+            'success': True,
+            'data': prediction
+        }, 200
         
-        user_prompt = f"""Contact: {contact_name}
+    except Exception as e:
+        print(f"[FORECAST AGENT] Error: {e}")
+        return {'success': False, 'error': str(e)}, 500
 
-Health Score History:
-{health_text if health_text else "Limited history available"}
 
-Recent Messages:
-{message_text}
+def forecast_contact(data):
+    """forecast.py input of one contact's request; the computed health score stands in for a missing history"""
+    contact = {'contact_name': data.get('contact_name', 'Contact'), 'health_history': data.get('health_history') or []}
+    if not contact['health_history']:
+        contact['current_health'] = health_score.score([health_features(data)])[0]['overall_score']
+    return contact
 
-Predict the relationship trajectory and provide proactive interventions."""
 
-        result = call_ai(system_prompt, user_prompt, use_brev=False)
+@flow_route('/agent/relationship_forecast/bulk', methods=('POST', 'OPTIONS'))
+def relationship_forecast_bulk(data):
+    """
+    Forecasts of many contacts in one call, fitted together
+    
+    Body: {contacts: [{contact_name, health_history, messages | conversation_id, ...}]}
+    Returns: {results: [{contact_name, success, data}]} in input order
+    """
+    try:
+        started = time.time()
+        contacts = data.get('contacts') or []
+        
+        results, inputs, slots = [], [], []
+        for contact in contacts:
+            resolved = resolve_conversation(contact) if not contact.get('health_history') else contact
+            if isinstance(resolved, tuple):
+                body, _ = resolved
+                results.append({'contact_name': contact.get('contact_name', ''), 'success': False, 'error': body['error']})
+            else:
+                # A contact sent as {conversation_id} is named by its stored conversation
+                slots.append((len(results), resolved.get('contact_name', '')))
+                results.append(None)
+                inputs.append(forecast_contact(resolved))
+        
+        for (slot, contact_name), prediction in zip(slots, forecast.forecast(inputs)):
+            results[slot] = {'contact_name': contact_name, 'success': True, 'data': prediction}
+        
+        elapsed_ms = (time.time() - started) * 1000
+        print(f"[FORECAST AGENT] Forecast {len(inputs)} contacts in {elapsed_ms:.1f}ms")
+        return {
+            'success': True,
+            'results': results,
+            'forecast_ms': round(elapsed_ms, 2)
+        }, 200
         
-        if result and 'choices' in result:
-            ai_response = result['choices'][0]['message']['content']
-            
-            try:
-                import re
-                json_match = re.search(r'```(?:json)?\s*(\{.*\})\s*```', ai_response, re.DOTALL)
-                if json_match:
-                    forecast_data = json.loads(json_match.group(1))
-                else:
-                    json_match = re.search(r'\{.*\}', ai_response, re.DOTALL)
-                    if json_match:
-                        forecast_data = json.loads(json_match.group())
-                    else:
-                        raise ValueError("No JSON")
-                
-                return jsonify({
-                    'success': True,
-                    'data': forecast_data
-                })
-            except Exception as e:
-                print(f"[FORECAST AGENT] Parse error: {e}")
-                return jsonify({
-                    'success': True,
-                    'data': {
-                        'summary': 'Insufficient data for detailed forecast',
-                        'interventions': [
-                            {
-                                'action': 'Maintain regular communication',
-                                'priority': 'medium'
-                            }
-                        ]
-                    }
-                })
+    except Exception as e:
+        print(f"[FORECAST AGENT] Bulk error: {e}")
+        return {'success': False, 'error': str(e)}, 500
+
+
+# ========================================
+# BATCH: CONVERSATION OPEN (ALL AGENTS, ONE ROUND TRIP)
+# ========================================
+
+# Agents the conversation screen opens with, in the order results are returned
+OPEN_AGENTS = {
+    'smart_reply': agent_smart_reply,
+    'relationship_health': agent_relationship_health,
+    'smart_notifications': agent_smart_notifications,
+    'key_dates': key_dates_agent,
+    'conversation_insights': conversation_insights_agent,
+    'conversation_starter': conversation_starter_agent,
+    'relationship_forecast': relationship_forecast_agent,
+    'sentiment_analysis': agent_sentiment_analysis,
+    'context_recall': agent_context_recall,
+    'auto_analyze': auto_analyze_conversation,
+}
+
+DEFAULT_OPEN_AGENTS = [
+    'smart_reply', 'relationship_health', 'smart_notifications', 'key_dates',
+    'conversation_insights', 'conversation_starter', 'relationship_forecast'
+]
+
+
+def build_open_context(data):
+    """
+    Parse the conversation once into every field the individual agents read
+    (the shared transcript, counts, recency...)
+    Explicit fields in the request win over the derived ones.
+    """
+    transcript = transcripts.for_request(data)
+    features = contact_features.for_request(data)
+    
+    context = {
+        'contact_name': data.get('contact_name', 'Contact'),
+        'user_name': data.get('user_name', 'User'),
+        TRANSCRIPT_KEY: transcript,
+        FEATURES_KEY: features,
+        'last_message': features['last_message'],
+        'last_message_from': features['last_message_from'] or 'them',
+        'message_count': features['message_count'],
+        'days_since_last_message': round(features['days_since_last_message'] or 0, 1),
+        'avg_messages_per_week': features['avg_messages_per_week'] or 0,
+    }
+    context.update({k: v for k, v in data.items() if k not in ('agents', 'messages', TRANSCRIPT_KEY, FEATURES_KEY)})
+    return context
+
+
+@flow_route('/agent/conversation_open', methods=('POST', 'OPTIONS'))
+def conversation_open(data):
+    """
+    BATCH: Called once when a conversation screen opens
+    Takes the conversation once, parses it once, and runs the selected agents
+    concurrently server-side. Replaces ~10 separate /agent/* requests.
+    
+    Body: {contact_name, messages: [{text, isUser, timestamp}], agents: [...], ...}
+       or {conversation_id, agents: [...]} for a conversation synced with /conversations/append
+    Returns: {results: {agent_name: {status, response}}}
+    """
+    try:
+        agents = data.get('agents') or DEFAULT_OPEN_AGENTS
+        unknown = [name for name in agents if name not in OPEN_AGENTS]
+        if unknown:
+            return {
+                'success': False,
+                'error': f"Unknown agents: {', '.join(unknown)}",
+                'available_agents': list(OPEN_AGENTS)
+            }, 400
+        
+        context = build_open_context(data)
+        print(f"[BATCH] Opening conversation with {context['contact_name']}: "
+              f"{context['message_count']} messages, agents={agents}")
+        
+        outcomes = yield fan_out([OPEN_AGENTS[name](context) for name in agents])
+        
+        results = {}
+        for name, (body, status) in zip(agents, outcomes):
+            results[name] = {'status': status, 'response': body}
         
-        return jsonify({'success': False, 'error': 'AI error'}), 500
+        return {
+            'success': True,
+            'contact_name': context['contact_name'],
+            'message_count': context['message_count'],
+            'results': results
+        }, 200
         
     except Exception as e:
-        print(f"[FORECAST AGENT] Error: {e}")
-        return jsonify({'success': False, 'error': str(e)}), 500
+        print(f"[BATCH] Error: {e}")
+        return {'success': False, 'error': str(e)}, 500
+
+
+# ============================================================================
+# CONVERSATION STORE (delta uploads)
+# ============================================================================
+
+def resolve_conversation(data):
+    """
+    Expand {conversation_id} into the stored conversation, parsed the same
+    way as /agent/conversation_open; requests with inline messages are
+    left as they are
+    """
+    conversation_id = (data or {}).get('conversation_id')
+    if not conversation_id or data.get('messages') or data.get('recent_messages'):
+        return data
+    
+    conversation = conversation_store.get(str(conversation_id))
+    if conversation is None:
+        return {
+            'success': False,
+            'error': f"Unknown conversation '{conversation_id}', upload it with /conversations/append",
+            'cursor': 0
+        }, 404
+    
+    context = build_open_context({
+        **data,
+        'messages': conversation.since(0),
+        'contact_name': data.get('contact_name') or conversation.contact_name or 'Contact',
+        FEATURES_KEY: feature_store.read(conversation_id)
+    })
+    context['conversation_version'] = conversation.cursor
+    if 'agents' in data:
+        context['agents'] = data['agents']  # /agent/conversation_open's selection
+    return context
+
+
+@flow_route('/conversations/append', methods=('POST', 'OPTIONS'), resolve=False)
+def conversations_append(data):
+    """
+    Upload the messages added since the last sync
+    
+    Body: {conversation_id, contact_name, cursor, messages: [{id, text, isUser, timestamp}]}
+    cursor is the value returned by the previous append (0 / omitted for the
+    first upload). Re-sending after a lost response is safe: messages the
+    server already has are skipped by cursor and id.
+    Returns: {cursor, appended, duplicates}; 409 with the server's cursor when
+    the client's cursor is ahead of it (server restarted), resend from there.
+    """
+    data = data or {}
+    try:
+        conversation_id = data.get('conversation_id')
+        if not conversation_id:
+            return {'success': False, 'error': 'conversation_id is required'}, 400
+        
+        cursor = data.get('cursor')
+        result = conversation_store.append(
+            str(conversation_id),
+            data.get('messages') or [],
+            cursor=int(cursor) if cursor is not None else None,
+            contact_name=data.get('contact_name', '')
+        )
+        # Keep the contact's features current as messages arrive
+        feature_store.sync(conversation_store.get(str(conversation_id)))
+        return {'success': True, 'conversation_id': conversation_id, **result}, 200
+        
+    except CursorAhead as e:
+        return {
+            'success': False,
+            'error': 'cursor is ahead of the server, resend messages from cursor',
+            'conversation_id': data.get('conversation_id'),
+            'cursor': e.cursor
+        }, 409
+    except Exception as e:
+        print(f"[CONVERSATIONS] Append failed: {e}")
+        return {'success': False, 'error': str(e)}, 500
+
+
+@flow_route('/conversations/messages', methods=('POST',), resolve=False)
+def conversations_messages(data):
+    """
+    Stored messages after a cursor
+    Body: {conversation_id, since}  Returns: {contact_name, cursor, messages}
+    """
+    data = data or {}
+    try:
+        conversation_id = data.get('conversation_id')
+        if not conversation_id:
+            return {'success': False, 'error': 'conversation_id is required'}, 400
+        
+        conversation = conversation_store.get(str(conversation_id))
+        if conversation is None:
+            return {'success': False, 'error': 'Unknown conversation', 'cursor': 0}, 404
+        
+        since = int(data.get('since') or 0)
+        return {
+            'success': True,
+            'conversation_id': conversation.id,
+            'contact_name': conversation.contact_name,
+            'cursor': conversation.cursor,
+            'messages': conversation.since(since)
+        }, 200
+        
+    except Exception as e:
+        print(f"[CONVERSATIONS] Read failed: {e}")
+        return {'success': False, 'error': str(e)}, 500
+
+
+@flow_route('/features', methods=('POST',), resolve=False)
+def contact_features_bulk(data):
+    """
+    Features of stored conversations (features.py), e.g. for a dashboard
+    Body: {conversation_ids: [...]}  Returns: {features: {conversation_id: {...} | null}}
+    Each entry carries its version (= the conversation's cursor).
+    """
+    data = data or {}
+    try:
+        conversation_ids = data.get('conversation_ids') or ([data['conversation_id']] if data.get('conversation_id') else [])
+        if not conversation_ids:
+            return {'success': False, 'error': 'conversation_ids is required'}, 400
+        return {'success': True, 'features': feature_store.read_many(conversation_ids)}, 200
+        
+    except Exception as e:
+        print(f"[FEATURES] Read failed: {e}")
+        return {'success': False, 'error': str(e)}, 500
+
+
+def start_background_work():
+    """Background work of a serving process, started by the server rather than on import"""
+    health_prober.start()
+    context_budget.preload((ORCHESTRATOR_MODEL, FALLBACK_MODEL))
 
 
 if __name__ == '__main__':
     try:
         port = int(os.environ.get('PORT', 5000))
+        # 'flask' (threaded dev server) or 'asgi' (async gateway, see main_auto_asgi.py)
+        server_mode = os.environ.get('SERVER_MODE', 'flask')
         print("\n" + "="*70)
         print(" ██████╗ ████████╗██╗      █████╗ ███████╗")
         print("██╔═══██╗╚══██╔══╝██║     ██╔══██╗██╔════╝")
@@ -1954,10 +2654,11 @@ if __name__ == '__main__':
         print("NVIDIA NEMOTRON MULTI-AGENT INTELLIGENCE SYSTEM")
         print("="*70)
         print(f"Port: {port}")
+        print(f"Server Mode: {server_mode}")
         print(f"NVIDIA API: {'✓ Connected' if NVIDIA_API_KEY != 'your-nvidia-api-key' else '✗ Need Key'}")
         print(f"ElevenLabs Voice: {'✓ Ready' if ELEVENLABS_API_KEY != 'your-elevenlabs-key-here' else '○ Optional'}")
         
-        if BREV_SERVER == 'http://localhost':
+        if not BREV_CONFIGURED:
             print(f"\nMode: NVIDIA API Direct")
             print(f"  → Endpoint: https://integrate.api.nvidia.com")
             print(f"  → Model: {FALLBACK_MODEL}")
@@ -1971,6 +2672,7 @@ if __name__ == '__main__':
         print("="*70)
         print("  🤖 AGENT 1: Smart Reply Generator")
         print("     └─ Endpoint: /agent/smart_reply")
+        print("     └─ Stream:   /agent/smart_reply/stream (SSE, one event per reply)")
         print("     └─ Purpose: Context-aware message suggestions")
         print()
         print("  💚 AGENT 2: Relationship Health Analyzer")
@@ -2009,14 +2711,25 @@ if __name__ == '__main__':
         print("     └─ Endpoint: /agent/relationship_forecast")
         print("     └─ Purpose: Predictive analytics & proactive interventions")
         print()
+        print("  📦 BATCH: Conversation Open")
+        print("     └─ Endpoint: /agent/conversation_open")
+        print("     └─ Purpose: All agents for one conversation in one round trip")
+        print()
         print("="*70)
         print("All agents powered by NVIDIA Nemotron/Llama models")
         print("Ready to demonstrate multi-agent intelligence!")
         print("="*70)
-        print("\nStarting Flask server...")
+        print(f"\nStarting {'ASGI gateway (async)' if server_mode == 'asgi' else 'Flask server'}...")
         print("KEEP THIS WINDOW OPEN - Press CTRL+C to stop\n")
         
-        app.run(host='0.0.0.0', port=port, debug=False, use_reloader=False, threaded=True)
+        if server_mode == 'asgi':
+            # main_auto_asgi imports main_auto: hand it this running module, not a second copy
+            sys.modules.setdefault('main_auto', sys.modules[__name__])
+            import main_auto_asgi
+            main_auto_asgi.run(host='0.0.0.0', port=port)
+        else:
+            start_background_work()
+            app.run(host='0.0.0.0', port=port, debug=False, use_reloader=False, threaded=True)
         
     except KeyboardInterrupt:
         print("\n\n" + "="*70)
@@ -0,0 +1,184 @@
+"""
+Atlas Auto-Agent ASGI Gateway
+Async serving mode for main_auto: same routes, same agent flows, but every
+model / ElevenLabs call is awaited on a shared async HTTP client. A request
+waiting 30 s on Nemotron costs a coroutine instead of an OS thread.
+
+Run with:
+    SERVER_MODE=asgi python main_auto.py
+or directly:
+    uvicorn main_auto_asgi:app --host 0.0.0.0 --port 5000
+
+The Flask server (python main_auto.py) stays the default so both modes
+can be benchmarked side by side.
+"""
+
+import asyncio
+import json
+import os
+
+import main_auto
+import upstream
+
+
+CORS_HEADERS = [
+    (b'access-control-allow-origin', b'*'),
+    (b'access-control-allow-methods', b'GET, POST, PUT, DELETE, OPTIONS'),
+    (b'access-control-allow-headers', b'Content-Type, Authorization'),
+]
+
+AUDIO_DIR = '/tmp'
+
+
+# ============================================================================
+# RESPONSE HELPERS
+# ============================================================================
+
+async def send_response(send, status, body, content_type=b'application/json', extra_headers=()):
+    headers = [
+        (b'content-type', content_type),
+        (b'content-length', str(len(body)).encode()),
+    ] + CORS_HEADERS + list(extra_headers)
+
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def send_json(send, status, payload):
+    await send_response(send, status, json.dumps(payload).encode())
+
+
+async def send_event_stream(send, frames):
+    """Send SSE frames as they are produced (chunked text/event-stream)"""
+    headers = [
+        (b'content-type', b'text/event-stream'),
+        (b'cache-control', b'no-cache'),
+        (b'x-accel-buffering', b'no'),
+    ] + CORS_HEADERS
+
+    await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+    try:
+        async for frame in frames:
+            await send({'type': 'http.response.body', 'body': frame.encode(), 'more_body': True})
+    finally:
+        await frames.aclose()
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def read_body(receive):
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    return body
+
+
+def parse_json(body):
+    """Mirror Flask's get_json(silent=True): None for missing/invalid JSON"""
+    try:
+        return json.loads(body) if body else None
+    except ValueError:
+        return None
+
+
+# ============================================================================
+# ROUTES
+# ============================================================================
+
+def read_audio(filename):
+    with open(os.path.join(AUDIO_DIR, filename), 'rb') as f:
+        return f.read()
+
+
+async def serve_audio(send, filename):
+    """Serve generated audio files (same as Flask's /audio/<filename>)"""
+    if '/' in filename or filename.startswith('.'):
+        await send_json(send, 404, {'error': 'not found'})
+        return
+
+    try:
+        audio = await asyncio.to_thread(read_audio, filename)
+    except FileNotFoundError:
+        await send_json(send, 404, {'error': 'not found'})
+        return
+
+    await send_response(send, 200, audio, content_type=b'audio/mpeg')
+
+
+async def handle_http(scope, receive, send):
+    method = scope['method']
+    path = scope['path']
+
+    # Universal OPTIONS handler
+    if method == 'OPTIONS':
+        await send_response(send, 200, b'', content_type=b'text/plain',
+                            extra_headers=[(b'access-control-max-age', b'3600')])
+        return
+
+    if path.startswith('/audio/'):
+        await serve_audio(send, path[len('/audio/'):])
+        return
+
+    stream_flow = main_auto.STREAM_ROUTES.get(path)
+    if stream_flow is not None:
+        if method != 'POST':
+            await send_json(send, 405, {'error': f'{method} not allowed on {path}'})
+            return
+        data = parse_json(await read_body(receive)) or {}
+        # The route entry may read the conversation store: off the event loop
+        flow = await asyncio.to_thread(stream_flow, data)
+        await send_event_stream(send, main_auto.run_stream_flow_async(flow))
+        return
+
+    route = main_auto.FLOW_ROUTES.get(path)
+    if route is None:
+        await send_json(send, 404, {'error': f'Unknown endpoint: {path}'})
+        return
+
+    flow, methods = route
+    if method not in methods:
+        await send_json(send, 405, {'error': f'{method} not allowed on {path}'})
+        return
+
+    data = parse_json(await read_body(receive))
+
+    try:
+        body, status = await main_auto.run_flow_async(await asyncio.to_thread(flow, data))
+    except Exception as e:
+        print(f"[ASGI] {path} failed: {e}")
+        body, status = {'success': False, 'error': str(e)}, 500
+
+    await send_json(send, status, body)
+
+
+async def handle_lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            main_auto.start_background_work()
+            print("[ASGI] Atlas gateway started (async mode)")
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await upstream.async_close_all()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI entry point"""
+    if scope['type'] == 'lifespan':
+        await handle_lifespan(receive, send)
+    elif scope['type'] == 'http':
+        await handle_http(scope, receive, send)
+
+
+def run(host='0.0.0.0', port=5000):
+    """Serve with uvicorn (used by main_auto when SERVER_MODE=asgi)"""
+    import uvicorn
+    uvicorn.run(app, host=host, port=port, log_level='info')
+
+
+if __name__ == '__main__':
+    run(port=int(os.environ.get('PORT', 5000)))
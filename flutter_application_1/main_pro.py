@@ -3,13 +3,16 @@ Atlas Gateway Server - Pro Multi-Agent Architecture
 Coordinates the full Nemotron NIM suite on Brev A100 server
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 import os
-import requests
 import json
 from datetime import datetime
 
+import streaming
+import upstream
+from json_stream import JsonStreamExtractor, extract_json
+
 app = Flask(__name__)
 CORS(app)
 
@@ -38,11 +41,15 @@ SCOUT_VLM_MODEL = "nvidia/llama-3.1-nemotron-nano-vl-8b-v1"
 # AGENT 1: THE ORCHESTRATOR (Main Coordinator)
 # ============================================================================
 
-def call_orchestrator(system_prompt, user_prompt, tools=None):
+def call_orchestrator(system_prompt, user_prompt, tools=None, stop_at_json=False):
     """
     Call the Nemotron Orchestrator NIM
     This is the "Brain" that coordinates all other agents
+    stop_at_json: stream the answer and stop generating once its JSON is closed
     """
+    if stop_at_json and not tools:
+        return call_orchestrator_until_json(system_prompt, user_prompt)
+    
     try:
         payload = {
             "model": ORCHESTRATOR_MODEL,
@@ -58,7 +65,7 @@ def call_orchestrator(system_prompt, user_prompt, tools=None):
         if tools:
             payload["tools"] = tools
         
-        response = requests.post(
+        response = upstream.post(
             ORCHESTRATOR_URL,
             headers={
                 "Content-Type": "application/json",
@@ -79,6 +86,52 @@ def call_orchestrator(system_prompt, user_prompt, tools=None):
         return None
 
 
+def call_orchestrator_stream(system_prompt, user_prompt):
+    """
+    Streaming call_orchestrator (stream: true)
+    Yields content deltas as Nemotron generates them
+    """
+    payload = {
+        "model": ORCHESTRATOR_MODEL,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        "temperature": 0.7,
+        "max_tokens": 1000,
+        "stream": True
+    }
+    
+    lines = upstream.stream_lines(
+        ORCHESTRATOR_URL,
+        headers={
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {NVIDIA_API_KEY}"
+        },
+        json=payload,
+        timeout=30
+    )
+    yield from streaming.chat_deltas(lines)
+
+
+def call_orchestrator_until_json(system_prompt, user_prompt):
+    """Streamed call_orchestrator that hangs up once the JSON answer is complete"""
+    extractor = JsonStreamExtractor()
+    stream = call_orchestrator_stream(system_prompt, user_prompt)
+    try:
+        for delta in stream:
+            if extractor.feed(delta):
+                break
+    except Exception as e:
+        print(f"Orchestrator Exception: {e}")
+        return None
+    finally:
+        stream.close()
+    
+    content = extractor.buffer[:extractor.end] if extractor.done else extractor.buffer
+    return {'choices': [{'message': {'role': 'assistant', 'content': content}}]}
+
+
 # ============================================================================
 # AGENT 2: THE SCOUT (Multi-Modal Vision Agent)
 # ============================================================================
@@ -103,7 +156,7 @@ def call_scout_vlm(image_url, query):
             "max_tokens": 300
         }
         
-        response = requests.post(
+        response = upstream.post(
             SCOUT_VLM_URL,
             headers={
                 "Content-Type": "application/json",
@@ -163,17 +216,13 @@ Return a JSON plan:
   "confidence": "high/medium/low"
 }}"""
 
-    result = call_orchestrator(system_prompt, user_prompt)
+    result = call_orchestrator(system_prompt, user_prompt, stop_at_json=True)
     
     if result:
         try:
             content = result['choices'][0]['message']['content']
             # Try to parse JSON from response
-            if '{' in content:
-                json_start = content.index('{')
-                json_end = content.rindex('}') + 1
-                plan = json.loads(content[json_start:json_end])
-                return plan
+            return extract_json(content, '{')
         except:
             pass
     
@@ -191,12 +240,8 @@ Return a JSON plan:
 # AGENT 4: THE GHOSTWRITER (Agentic RAG Agent)
 # ============================================================================
 
-def ghostwriter_agent(message_to_write, user_writing_samples):
-    """
-    Implements Agentic RAG: Intelligently retrieves user's writing style
-    Then generates a message that sounds authentically like them
-    """
-    
+def ghostwriter_prompts(message_to_write, user_writing_samples):
+    """(system_prompt, user_prompt) for the Ghostwriter, streamed or not"""
     system_prompt = """You are the "Ghostwriter Agent" for Atlas.
 Your job is to write messages that sound EXACTLY like the user.
 
@@ -220,6 +265,16 @@ Requirements:
 
 Return ONLY the final message text, nothing else."""
 
+    return system_prompt, user_prompt
+
+
+def ghostwriter_agent(message_to_write, user_writing_samples):
+    """
+    Implements Agentic RAG: Intelligently retrieves user's writing style
+    Then generates a message that sounds authentically like them
+    """
+    system_prompt, user_prompt = ghostwriter_prompts(message_to_write, user_writing_samples)
+
     result = call_orchestrator(system_prompt, user_prompt)
     
     if result:
@@ -263,15 +318,12 @@ Generate a JSON touchpoint:
   "priority": "high/medium/low"
 }}"""
 
-            result = call_orchestrator(system_prompt, user_prompt)
+            result = call_orchestrator(system_prompt, user_prompt, stop_at_json=True)
             
             if result:
                 try:
                     content = result['choices'][0]['message']['content']
-                    if '{' in content:
-                        json_start = content.index('{')
-                        json_end = content.rindex('}') + 1
-                        return json.loads(content[json_start:json_end])
+                    return extract_json(content, '{')
                 except:
                     pass
     
@@ -304,6 +356,7 @@ def home():
             '/summarize_chat',
             '/plan_event',
             '/write_message',
+            '/write_message/stream',
             '/analyze_social',
             '/health'
         ]
@@ -337,16 +390,12 @@ Analyze conversations and provide actionable insights."""
 Conversation:
 {chat_log}"""
 
-        result = call_orchestrator(system_prompt, user_prompt)
+        result = call_orchestrator(system_prompt, user_prompt, stop_at_json=True)
         
         if result:
             try:
                 content = result['choices'][0]['message']['content']
-                if '{' in content:
-                    json_start = content.index('{')
-                    json_end = content.rindex('}') + 1
-                    parsed = json.loads(content[json_start:json_end])
-                    return jsonify(parsed)
+                return jsonify(extract_json(content, '{'))
             except:
                 pass
         
@@ -396,6 +445,36 @@ def write_message():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/write_message/stream', methods=['POST'])
+def write_message_stream():
+    """
+    Streaming Ghostwriter (Server-Sent Events)
+    'token' events carry text as it is generated, then 'done' with the
+    same {"message": ...} body as /write_message
+    """
+    data = request.get_json(silent=True) or {}
+    message_content = data.get('message', '')
+    writing_samples = data.get('writing_samples', [])
+    system_prompt, user_prompt = ghostwriter_prompts(message_content, writing_samples)
+    
+    def events():
+        parts = []
+        try:
+            for delta in call_orchestrator_stream(system_prompt, user_prompt):
+                parts.append(delta)
+                yield streaming.sse_event('token', {'text': delta})
+        except Exception as e:
+            print(f"Ghostwriter stream error: {e}")
+        
+        final_message = ''.join(parts).strip().strip('"') or message_content
+        yield streaming.sse_event('done', {'message': final_message})
+    
+    return Response(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
 @app.route('/analyze_social', methods=['POST'])
 def analyze_social():
     """
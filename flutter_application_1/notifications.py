@@ -0,0 +1,269 @@
+"""
+Atlas Notification Scheduler
+Follow-up notifications for every contact, decided by rules instead of one
+model call per contact per poll:
+
+- evaluate() applies the frequent / occasional / rare / inactive texting
+  rules to one contact (also what /agent/smart_notifications answers with)
+- each contact's next due time follows from the same rules: the last
+  message time plus the threshold of its relationship type and who sent it
+- due times sit in a heap; one background thread sleeps until the earliest,
+  so idle contacts cost nothing between due times
+- due notifications are handed to a small worker pool, optionally phrased
+  by the model there, then queued for the app to collect and posted to a
+  webhook if one is set; a burst of due contacts is phrased in parallel
+  instead of one model call after another on the scheduler thread
+
+A contact notifies once per last message: a newer message reschedules it.
+"""
+
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+NOTIFICATION_QUEUE_SIZE = int(os.environ.get('NOTIFICATION_QUEUE_SIZE', 1000))
+NOTIFICATION_WORKERS = int(os.environ.get('NOTIFICATION_WORKERS', 4))   # notifications phrased at once
+NOTIFICATION_MAX_SLEEP = 60  # seconds; upper bound on a wait for the next due time
+NOTIFIED_RETENTION_DAYS = float(os.environ.get('NOTIFIED_RETENTION_DAYS', 30))
+
+
+# ============================================================================
+# RULES
+# ============================================================================
+
+def relationship_type(avg_messages_per_week):
+    return ('frequent' if avg_messages_per_week > 10 else
+            'occasional' if avg_messages_per_week > 3 else
+            'rare' if avg_messages_per_week > 0 else 'inactive')
+
+
+# (relationship type, who sent the last message) ->
+# (days without an answer before notifying, priority, timing, wait_hours, message, suggested action)
+RULES = {
+    ('frequent', 'me'): (1, 'high', 'now', 0,
+                         "{contact} hasn't replied in {days} days (unusual for you two)",
+                         "Send a gentle follow-up"),
+    ('frequent', 'them'): (0.25, 'urgent', 'now', 0,
+                           "You haven't replied to {contact} yet (you usually reply quickly)",
+                           "Reply to their message"),
+    ('occasional', 'me'): (3, 'medium', 'now', 0,
+                           "No reply from {contact} in 3 days",
+                           "Maybe check in?"),
+    ('occasional', 'them'): (1, 'high', 'now', 0,
+                             "{contact} sent a message yesterday",
+                             "Reply when you have time"),
+    ('rare', 'me'): (7, 'low', 'now', 0,
+                     "Been a week since you messaged {contact}",
+                     "No rush, but maybe follow up?"),
+    ('rare', 'them'): (3, 'medium', 'now', 0,
+                       "{contact} messaged 3 days ago",
+                       "They might be waiting for your reply"),
+}
+INACTIVE_RULE = (14, 'low', 'in_1_week', 168,
+                 "Haven't talked to {contact} in 2 weeks",
+                 "Maybe send a friendly check-in?")
+
+# What the model may reword in a decision; everything else is the rules'
+WORDING_FIELDS = ('notification_message', 'suggested_action')
+
+
+def _rule(kind, last_message_from):
+    return INACTIVE_RULE if kind == 'inactive' else RULES.get((kind, last_message_from))
+
+
+def evaluate(contact_name, avg_messages_per_week, last_message_from, days_since_last_message):
+    """Notification decision for one contact (the /agent/smart_notifications shape)"""
+    kind = relationship_type(avg_messages_per_week)
+    rule = _rule(kind, last_message_from)
+    decision = {
+        'should_notify': False,
+        'priority': 'low',
+        'notification_timing': 'in_1_week',
+        'relationship_type': kind,
+        'notification_message': '',
+        'suggested_action': '',
+        'reasoning': f"Based on {kind} texting pattern ({avg_messages_per_week} msgs/week)",
+        'wait_hours': 168
+    }
+    if rule and days_since_last_message >= rule[0]:
+        _, priority, timing, wait_hours, message, action = rule
+        decision.update({
+            'should_notify': True,
+            'priority': priority,
+            'notification_timing': timing,
+            'wait_hours': wait_hours,
+            'notification_message': message.format(contact=contact_name, days=round(days_since_last_message, 1)),
+            'suggested_action': action
+        })
+    return decision
+
+
+def wording(phrased):
+    """The model's wording fields of a phrased notification; everything else stays the rules' decision"""
+    if not isinstance(phrased, dict):
+        return {}
+    return {field: phrased[field] for field in WORDING_FIELDS
+            if isinstance(phrased.get(field), str) and phrased[field].strip()}
+
+
+def due_at(last_message_at, avg_messages_per_week, last_message_from):
+    """Epoch time the contact's rule fires, None if no rule applies"""
+    rule = _rule(relationship_type(avg_messages_per_week), last_message_from)
+    return last_message_at + rule[0] * 86400 if rule else None
+
+
+# ============================================================================
+# SCHEDULER
+# ============================================================================
+
+class NotificationScheduler:
+    """
+    deliver(notification): called for every due notification (after queueing)
+    phrase(notification, contact) -> {notification_message, suggested_action} or None
+    """
+
+    def __init__(self, deliver=None, phrase=None, queue_size=NOTIFICATION_QUEUE_SIZE,
+                 workers=NOTIFICATION_WORKERS):
+        self.deliver = deliver
+        self.phrase = phrase
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.heap = []            # (due_at, seq, key)
+        self.contacts = {}        # key -> contact dict with its scheduled due_at
+        self.notified = {}        # key -> (last_message_at already notified for, last synced)
+        self.queue = deque(maxlen=queue_size)
+        self.seq = itertools.count()
+        self.thread = None
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='notification-phrase')
+        self.counters = {'scheduled': 0, 'fired': 0, 'phrased': 0, 'delivery_failures': 0}
+
+    def upsert(self, contacts):
+        """
+        Add or refresh contacts: [{key, contact_name, last_message_at (epoch),
+        last_message_from ('me' | 'them'), avg_messages_per_week, ...}]
+        Returns {scheduled, unscheduled, due_now, next_due_at}
+        """
+        now = time.time()
+        scheduled = due_now = 0
+        with self.lock:
+            for contact in contacts:
+                key = contact['key']
+                due = due_at(contact['last_message_at'], contact['avg_messages_per_week'],
+                             contact['last_message_from'])
+                notified = self.notified.get(key)
+                if notified and notified[0] == contact['last_message_at']:
+                    self.notified[key] = (notified[0], now)
+                    self.contacts.pop(key, None)
+                    continue
+                self.notified.pop(key, None)  # a newer message than the one notified for
+                if due is None:
+                    self.contacts.pop(key, None)
+                    continue
+                self.contacts[key] = {**contact, 'due_at': due}
+                heapq.heappush(self.heap, (due, next(self.seq), key))
+                scheduled += 1
+                due_now += due <= now
+            self.counters['scheduled'] += scheduled
+            self._compact(now)
+            next_due = self._next_due()
+            self.wakeup.notify()
+        self._start()
+        return {
+            'scheduled': scheduled,
+            'unscheduled': len(contacts) - scheduled,
+            'due_now': due_now,
+            'next_due_at': next_due
+        }
+
+    def remove(self, key):
+        with self.lock:
+            self.contacts.pop(key, None)
+            self.notified.pop(key, None)
+
+    def pending(self, limit=100):
+        """Take up to limit queued notifications, oldest first"""
+        with self.lock:
+            return [self.queue.popleft() for _ in range(min(limit, len(self.queue)))]
+
+    def _next_due(self):
+        while self.heap:
+            due, _, key = self.heap[0]
+            contact = self.contacts.get(key)
+            if contact is not None and contact['due_at'] == due:
+                return due
+            heapq.heappop(self.heap)  # rescheduled or removed since
+        return None
+
+    def _compact(self, now):
+        # Refreshing every contact on each sync leaves a stale entry per contact behind
+        if len(self.heap) > 2 * len(self.contacts) + 64:
+            self.heap = [(c['due_at'], next(self.seq), key) for key, c in self.contacts.items()]
+            heapq.heapify(self.heap)
+        # Contacts that stopped syncing: forget what they were notified for after a while
+        cutoff = now - NOTIFIED_RETENTION_DAYS * 86400
+        self.notified = {key: n for key, n in self.notified.items() if n[1] >= cutoff}
+
+    def _start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='notification-scheduler', daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            with self.lock:
+                due = self._next_due()
+                now = time.time()
+                if due is None or due > now:
+                    self.wakeup.wait(NOTIFICATION_MAX_SLEEP if due is None else min(due - now, NOTIFICATION_MAX_SLEEP))
+                    continue
+                _, _, key = heapq.heappop(self.heap)
+                contact = self.contacts.pop(key)
+                self.notified[key] = (contact['last_message_at'], now)
+            # Phrasing is a model call: off the scheduler thread, so the next due contact is not held up
+            self.pool.submit(self._fire, contact, now)
+
+    def _fire(self, contact, now):
+        try:
+            self._notify(contact, now)
+        except Exception as e:
+            print(f"[NOTIFY] Failed for {contact.get('contact_name')}: {e}")
+
+    def _notify(self, contact, now):
+        days = (now - contact['last_message_at']) / 86400
+        notification = evaluate(contact['contact_name'], contact['avg_messages_per_week'],
+                                contact['last_message_from'], days)
+        notification.update({'contact_id': contact['key'], 'contact_name': contact['contact_name'],
+                             'days_since_last_message': round(days, 1), 'created_at': now})
+
+        phrased = wording(self.phrase(notification, contact)) if self.phrase else {}
+        notification.update(phrased)
+
+        with self.lock:
+            self.queue.append(notification)
+            self.counters['fired'] += 1
+            self.counters['phrased'] += bool(phrased)
+        print(f"[NOTIFY] {notification['priority']} for {contact['contact_name']}: "
+              f"{notification['notification_message']}")
+
+        if self.deliver:
+            try:
+                self.deliver(notification)
+            except Exception as e:
+                with self.lock:
+                    self.counters['delivery_failures'] += 1
+                print(f"[NOTIFY] Delivery failed: {e}")
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+            counters['contacts'] = len(self.contacts)
+            counters['notified'] = len(self.notified)
+            counters['queued'] = len(self.queue)
+            counters['next_due_at'] = self._next_due()
+        return counters
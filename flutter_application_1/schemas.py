@@ -0,0 +1,303 @@
+"""
+Atlas Agent Output Schemas
+The JSON contract of every structured agent, in one place:
+
+- sent to the NIM as guided / structured-output decoding parameters, so the
+  model can only produce JSON of this shape
+- compiled into a validator that checks every answer on our side
+- parse / validation outcomes counted per agent for /metrics, so answers we
+  paid for and then threw away show up
+
+The validator covers the JSON Schema subset used here: type, enum,
+properties, required, items, minimum, maximum.
+"""
+
+import threading
+
+
+# ============================================================================
+# SCHEMA BUILDERS
+# ============================================================================
+
+STR = {'type': 'string'}
+NUM = {'type': 'number'}
+INT = {'type': 'integer'}
+BOOL = {'type': 'boolean'}
+
+
+def obj(properties, required=()):
+    return {'type': 'object', 'properties': properties, 'required': list(required)}
+
+
+def arr(items):
+    return {'type': 'array', 'items': items}
+
+
+def enum(*values):
+    return {'type': 'string', 'enum': list(values)}
+
+
+def score(low=0, high=100):
+    return {'type': 'number', 'minimum': low, 'maximum': high}
+
+
+PRIORITY = enum('high', 'medium', 'low')
+TREND = enum('improving', 'stable', 'declining')
+STRINGS = arr(STR)
+
+
+# ============================================================================
+# AGENT CONTRACTS (keyed by flow name)
+# ============================================================================
+
+SMART_REPLY = obj({
+    'replies': arr(obj({'text': STR, 'tone': STR, 'emoji': STR}, required=['text']))
+}, required=['replies'])
+
+AGENT_SCHEMAS = {
+    'auto_analyze_conversation': obj({
+        'summary_text': STR,
+        'topics': STRINGS,
+        'suggested_reply': STR,
+        'action_needed': enum('booking', 'follow_up', 'none'),
+        'action_details': obj({'type': STR, 'suggested_time': STR, 'reason': STR})
+    }, required=['summary_text', 'topics', 'suggested_reply', 'action_needed']),
+
+    'auto_book_meeting': obj({
+        'suggested_time': STR,
+        'meeting_type': STR,
+        'location': STR,
+        'message_to_send': STR,
+        'confidence': PRIORITY
+    }, required=['suggested_time', 'meeting_type', 'message_to_send']),
+
+    'detect_actions': arr(obj({
+        'action_type': enum('book_meeting', 'send_followup', 'share_content', 'plan_event'),
+        'title': STR,
+        'description': STR,
+        'priority': PRIORITY,
+        'icon': enum('calendar', 'message', 'share', 'event')
+    }, required=['action_type', 'title'])),
+
+    'predict_followup': obj({
+        'should_follow_up': BOOL,
+        'urgency': enum('low', 'medium', 'high', 'critical'),
+        'suggested_message': STR,
+        'reasoning': STR,
+        'best_time': enum('morning', 'afternoon', 'evening', 'now'),
+        'wait_hours': score(0, 720)
+    }, required=['should_follow_up', 'urgency', 'suggested_message']),
+
+    'voice_book_meeting': obj({
+        'meeting_type': enum('coffee', 'lunch', 'call', 'meeting', 'dinner'),
+        'preferred_time': STR,
+        'duration_minutes': INT,
+        'location': {'type': ['string', 'null']},
+        'notes': STR,
+        'suggested_times': STRINGS,
+        'voice_script': STR
+    }, required=['meeting_type', 'preferred_time', 'voice_script']),
+
+    'agent_smart_reply': SMART_REPLY,
+    'agent_smart_reply_stream': SMART_REPLY,
+
+    # Insights only; the labels are computed locally (sentiment.py)
+    'agent_sentiment_analysis': obj({
+        'insights': STR
+    }, required=['insights']),
+
+    # Narrative part only; the scores are computed locally (health_score.py)
+    'agent_relationship_health': obj({
+        'warmth_score': score(),
+        'diversity_score': score(),
+        'insights': STRINGS,
+        'suggestions': STRINGS
+    }, required=['warmth_score', 'diversity_score', 'insights']),
+
+    'agent_context_recall': obj({
+        'reminders': arr(obj({'type': STR, 'text': STR, 'priority': PRIORITY}, required=['text'])),
+        'suggested_questions': STRINGS,
+        'key_facts': STRINGS
+    }, required=['reminders', 'suggested_questions']),
+
+    # Wording only; the decision is rule-based (notifications.py)
+    'agent_smart_notifications': obj({
+        'notification_message': STR,
+        'suggested_action': STR
+    }, required=['notification_message']),
+
+    'key_dates_agent': obj({
+        'dates_found': arr(obj({
+            'type': enum('birthday', 'anniversary', 'graduation', 'wedding', 'trip', 'meeting', 'event'),
+            'person': STR,
+            'date': STR,
+            'date_relative': STR,
+            'context': STR,
+            'significance': PRIORITY
+        }, required=['type', 'date'])),
+        'summary': STR
+    }, required=['dates_found', 'summary']),
+
+    'conversation_insights_agent': obj({
+        'topics': obj({'primary': STRINGS, 'emerging': STRINGS, 'declining': STRINGS}),
+        'communication_style': obj({
+            'formality': STR,
+            'emoji_usage': STR,
+            'avg_message_length': STR,
+            'humor_compatibility': STR
+        }),
+        'relationship_trajectory': obj({
+            'trend': STR,
+            'strength': score(0, 10),
+            'key_moments': STRINGS,
+            'areas_of_concern': STRINGS
+        }),
+        'conversation_quality': obj({
+            'depth_score': score(0, 10),
+            'engagement_score': score(0, 10),
+            'reciprocity_score': score(0, 10)
+        }),
+        'recommendations': STRINGS,
+        'summary': STR
+    }, required=['topics', 'recommendations', 'summary']),
+
+    'conversation_starter_agent': obj({
+        'starters': arr(obj({
+            'message': STR,
+            'reasoning': STR,
+            'category': STR,
+            'risk_level': STR,
+            'expected_response': STR
+        }, required=['message'])),
+        'context_note': STR,
+        'best_timing': STR
+    }, required=['starters']),
+
+    # Interventions only; the forecast is computed locally (forecast.py)
+    'relationship_forecast_agent': obj({
+        'interventions': arr(obj({'action': STR, 'priority': STR, 'expected_impact': STR, 'timing': STR},
+                                 required=['action']))
+    }, required=['interventions']),
+}
+
+
+# ============================================================================
+# COMPILED VALIDATORS
+# ============================================================================
+
+TYPE_CHECKS = {
+    'string': lambda v: isinstance(v, str),
+    'number': lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    'integer': lambda v: (isinstance(v, int) and not isinstance(v, bool)) or (isinstance(v, float) and v.is_integer()),
+    'boolean': lambda v: isinstance(v, bool),
+    'object': lambda v: isinstance(v, dict),
+    'array': lambda v: isinstance(v, list),
+    'null': lambda v: v is None,
+}
+
+
+def compile_schema(schema):
+    """
+    Turn a schema into a validate(value, path='$') -> [errors] function
+    Checks are resolved once here instead of re-reading the schema per answer
+    """
+    checks = []
+
+    types = schema.get('type')
+    if types:
+        type_names = [types] if isinstance(types, str) else list(types)
+        type_fns = [TYPE_CHECKS[name] for name in type_names]
+        expected = '|'.join(type_names)
+
+        def check_type(value, path):
+            if not any(fn(value) for fn in type_fns):
+                return [f"{path}: expected {expected}, got {type(value).__name__}"]
+            return []
+        checks.append(check_type)
+
+    if 'enum' in schema:
+        allowed = set(schema['enum'])
+
+        def check_enum(value, path):
+            return [] if value in allowed else [f"{path}: {value!r} not in {sorted(allowed)}"]
+        checks.append(check_enum)
+
+    if 'minimum' in schema or 'maximum' in schema:
+        low = schema.get('minimum', float('-inf'))
+        high = schema.get('maximum', float('inf'))
+
+        def check_range(value, path):
+            if TYPE_CHECKS['number'](value) and not low <= value <= high:
+                return [f"{path}: {value} outside [{low}, {high}]"]
+            return []
+        checks.append(check_range)
+
+    if 'properties' in schema or 'required' in schema:
+        properties = {name: compile_schema(sub) for name, sub in schema.get('properties', {}).items()}
+        required = schema.get('required', [])
+
+        def check_object(value, path):
+            if not isinstance(value, dict):
+                return []
+            errors = [f"{path}: missing '{name}'" for name in required if name not in value]
+            for name, validate in properties.items():
+                if name in value:
+                    errors.extend(validate(value[name], f"{path}.{name}"))
+            return errors
+        checks.append(check_object)
+
+    if 'items' in schema:
+        validate_item = compile_schema(schema['items'])
+
+        def check_items(value, path):
+            if not isinstance(value, list):
+                return []
+            errors = []
+            for i, item in enumerate(value):
+                errors.extend(validate_item(item, f"{path}[{i}]"))
+            return errors
+        checks.append(check_items)
+
+    def validate(value, path='$'):
+        errors = []
+        for check in checks:
+            errors.extend(check(value, path))
+            if errors:
+                break  # wrong type: deeper checks would only add noise
+        return errors
+
+    return validate
+
+
+VALIDATORS = {agent: compile_schema(schema) for agent, schema in AGENT_SCHEMAS.items()}
+
+
+def validate(agent, value):
+    """Schema errors for an agent's parsed answer ([] when valid or no schema)"""
+    validator = VALIDATORS.get(agent)
+    return validator(value) if validator else []
+
+
+# ============================================================================
+# PARSE SUCCESS RATE
+# ============================================================================
+
+_stats_lock = threading.Lock()
+_stats = {}  # agent -> counters
+
+
+def record(agent, outcome):
+    """outcome: 'valid' | 'invalid' (parsed, failed schema) | 'unparsed' (no JSON) | 'unavailable'"""
+    with _stats_lock:
+        counters = _stats.setdefault(agent, {'valid': 0, 'invalid': 0, 'unparsed': 0, 'unavailable': 0})
+        counters[outcome] += 1
+
+
+def stats():
+    with _stats_lock:
+        snapshot = {agent: dict(counters) for agent, counters in _stats.items()}
+    for counters in snapshot.values():
+        answered = counters['valid'] + counters['invalid'] + counters['unparsed']
+        # Share of paid-for generations that were usable
+        counters['parse_success_rate'] = round(counters['valid'] / answered, 3) if answered else None
+    return snapshot
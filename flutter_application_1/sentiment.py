@@ -0,0 +1,261 @@
+"""
+Atlas Sentiment
+Local, lexicon-based message sentiment, so /agent/sentiment_analysis
+labels a conversation in microseconds per message instead of one model
+call per request:
+
+- each word, emoji and emoticon has a valence (-4..4); negation flips and
+  dampens the words after it, intensifiers ("so", "really") and ALL CAPS
+  strengthen them, "but" shifts the weight onto what follows it
+- a batch of messages is summed and normalized as arrays (one
+  np.bincount over all tokens), exclamation marks amplifying the result
+- scores are cached by message text hash, so a reopened conversation only
+  scores the messages added since
+
+The model is only needed for written insights on top of these labels.
+"""
+
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+SENTIMENT_CACHE_SIZE = int(os.environ.get('SENTIMENT_CACHE_SIZE', 100000))
+
+# Compound score (-1..1) above / below which a message is positive / negative
+POSITIVE_THRESHOLD = 0.05
+NEGATIVE_THRESHOLD = -0.05
+TREND_THRESHOLD = 0.15    # change in mean compound between the older and newer half
+
+NORMALIZE_ALPHA = 15      # compound = s / sqrt(s^2 + alpha)
+NEGATION_SCALE = -0.74
+NEGATION_WINDOW = 3       # words after a negation it applies to
+BOOST = 0.293
+CAPS_BOOST = 0.733
+EXCLAMATION_BOOST = 0.292
+MAX_EXCLAMATIONS = 4
+BEFORE_BUT, AFTER_BUT = 0.5, 1.5
+
+LEXICON = {
+    # positive
+    'love': 3.2, 'loved': 2.9, 'loving': 2.9, 'lovely': 2.8, 'adore': 2.9, 'amazing': 2.8,
+    'awesome': 3.1, 'wonderful': 2.7, 'fantastic': 2.6, 'great': 3.1, 'good': 1.9, 'nice': 1.8,
+    'happy': 2.7, 'glad': 2.0, 'excited': 2.2, 'exciting': 2.2, 'fun': 2.3, 'funny': 1.9,
+    'cool': 1.3, 'best': 3.2, 'better': 1.9, 'beautiful': 2.9, 'perfect': 2.7, 'thanks': 1.9,
+    'thank': 1.5, 'thx': 1.5, 'appreciate': 2.3, 'appreciated': 2.3, 'congrats': 2.4,
+    'congratulations': 2.9, 'proud': 2.1, 'yay': 2.4, 'haha': 2.0, 'hahaha': 2.2, 'lol': 1.8,
+    'lmao': 2.0, 'miss': 0.9, 'care': 2.2, 'sweet': 2.0, 'cute': 2.0, 'enjoy': 2.2,
+    'enjoyed': 2.3, 'welcome': 2.0, 'pleased': 2.0, 'yes': 1.7, 'sure': 1.3, 'okay': 0.9,
+    'ok': 0.9, 'win': 2.8, 'won': 2.7, 'success': 2.7, 'celebrate': 2.7, 'hope': 1.9,
+    'brilliant': 2.8, 'incredible': 2.6, 'excellent': 2.7, 'friend': 2.2, 'hug': 2.1,
+    'hugs': 2.2, 'kind': 2.4, 'safe': 1.9, 'relaxed': 2.2, 'calm': 1.3,
+    'liked': 1.8, 'agree': 1.5, 'interesting': 1.7, 'wow': 2.1, 'yummy': 2.4, 'delicious': 2.7,
+    # negative
+    'hate': -2.7, 'hated': -3.2, 'bad': -2.5, 'worse': -2.1, 'worst': -3.1, 'terrible': -2.1,
+    'awful': -2.0, 'horrible': -2.5, 'sad': -2.1, 'upset': -1.6, 'angry': -2.3, 'mad': -2.2,
+    'annoyed': -1.6, 'annoying': -1.7, 'frustrated': -2.4, 'frustrating': -1.9, 'tired': -1.9,
+    'exhausted': -1.5, 'sick': -2.3, 'sorry': -0.3, 'unfortunately': -1.4, 'sucks': -1.5,
+    'stressed': -1.4, 'stress': -1.8, 'stressful': -2.0, 'worried': -1.2, 'worry': -1.9,
+    'scared': -1.9, 'afraid': -2.0, 'hurt': -2.4, 'hurts': -2.1, 'lonely': -2.0, 'cry': -2.1,
+    'crying': -2.1, 'depressed': -2.3, 'disappointed': -1.9, 'disappointing': -2.2,
+    'boring': -1.3, 'bored': -1.1, 'ugh': -1.8, 'damn': -1.7, 'wtf': -2.8, 'no': -1.2,
+    'never': -0.5, 'fail': -2.5, 'failed': -2.3, 'lost': -1.3, 'problem': -1.7,
+    'problems': -1.7, 'wrong': -2.1, 'busy': -0.4, 'late': -0.6, 'cancel': -1.0,
+    'cancelled': -1.0, 'canceled': -1.0, 'ignore': -1.3, 'ignored': -1.6, 'rude': -2.0,
+    'fight': -1.8, 'fought': -1.6, 'broke': -1.6, 'broken': -1.9, 'pain': -2.3,
+    'miserable': -2.6, 'jealous': -2.0, 'nervous': -1.1, 'anxious': -1.0, 'unfair': -2.1,
+    'hmm': -0.1, 'whatever': -0.5, 'fine': 0.8,
+    # emoticons
+    ':)': 2.0, ':-)': 2.0, ':d': 2.3, ':-d': 2.3, ';)': 1.6, ':p': 1.4, '<3': 2.4,
+    ':(': -1.9, ':-(': -1.9, ":'(": -2.3, ':/': -1.1, ':|': -0.6,
+    # emoji
+    '😀': 2.2, '😃': 2.3, '😄': 2.4, '😁': 2.3, '😆': 2.2, '😂': 2.0, '🤣': 2.2, '😊': 2.3,
+    '🙂': 1.5, '😍': 2.8, '🥰': 2.8, '😘': 2.5, '❤': 2.8, '❤️': 2.8, '💕': 2.6, '💖': 2.7,
+    '👍': 1.8, '🙌': 2.1, '🎉': 2.5, '🥳': 2.6, '😎': 1.8, '🤗': 2.2, '✨': 1.2, '🔥': 1.5,
+    '🙏': 1.5, '😉': 1.6, '😋': 2.0, '👏': 1.9,
+    '😢': -2.2, '😭': -2.0, '😞': -2.2, '😔': -1.9, '😟': -1.8, '😠': -2.5, '😡': -2.8,
+    '😤': -1.6, '😩': -2.0, '😫': -2.0, '🙁': -1.6, '☹': -1.9, '💔': -2.6, '👎': -1.8,
+    '😒': -1.6, '🙄': -1.5, '😕': -1.2, '😬': -0.8,
+}
+
+NEGATIONS = {
+    'not', 'no', 'never', 'none', 'nobody', 'nothing', 'neither', 'nor', 'nowhere',
+    'cannot', 'cant', 'dont', 'doesnt', 'didnt', 'isnt', 'wasnt', 'arent', 'werent',
+    'wont', 'wouldnt', 'shouldnt', 'couldnt', 'havent', 'hasnt', 'hadnt', 'aint', 'without',
+}
+
+BOOSTERS = {
+    'very': BOOST, 'so': BOOST, 'really': BOOST, 'super': BOOST, 'extremely': BOOST,
+    'totally': BOOST, 'absolutely': BOOST, 'incredibly': BOOST, 'completely': BOOST,
+    'soo': BOOST, 'sooo': BOOST, 'too': BOOST, 'most': BOOST, 'such': BOOST, 'truly': BOOST,
+    'kinda': -BOOST, 'somewhat': -BOOST, 'slightly': -BOOST,
+    'barely': -BOOST, 'hardly': -BOOST, 'little': -BOOST, 'bit': -BOOST, 'sorta': -BOOST,
+}
+
+_EMOTICONS = sorted((k for k in LEXICON if not k[0].isalnum() and k.isascii()), key=len, reverse=True)
+_TOKENS = re.compile(
+    '|'.join(re.escape(e) for e in _EMOTICONS) + r"|[A-Za-z]+(?:'[A-Za-z]+)?|[^\sA-Za-z0-9]️?",
+    re.I
+)
+
+
+def _digest(text):
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+
+def _token_valences(text):
+    """[(token, valence)] of a message's sentiment-bearing tokens, rules applied"""
+    tokens = _TOKENS.findall(text)
+    # ALL CAPS only stands out in a message that isn't shouted throughout
+    words = [t for t in tokens if t.isalpha()]
+    mixed_case = any(w.isupper() for w in words) and not all(w.isupper() for w in words)
+    lowered = [t.lower().replace("'", '') if t[0].isalpha() else t.lower() for t in tokens]
+    but = lowered.index('but') if 'but' in lowered else None
+
+    scored = []
+    for i, token in enumerate(lowered):
+        valence = LEXICON.get(token) or LEXICON.get(token.rstrip('️'))
+        if valence is None or token == 'kind' and lowered[i + 1:i + 2] == ['of']:
+            continue
+        cue = tokens[i]
+        if mixed_case and tokens[i].isupper() and len(tokens[i]) > 1:
+            valence += CAPS_BOOST if valence > 0 else -CAPS_BOOST
+        for back in range(1, NEGATION_WINDOW + 1):
+            if i - back < 0:
+                break
+            previous = lowered[i - back]
+            if back == 1 and (previous in BOOSTERS or previous == 'of' and lowered[i - 2:i - 1] == ['kind']):
+                boost = BOOSTERS.get(previous, -BOOST)
+                valence += boost if valence > 0 else -boost
+            if previous in NEGATIONS or tokens[i - back].lower().endswith("n't"):
+                valence *= NEGATION_SCALE
+                cue = f"{tokens[i - back]} {cue}" if back == 1 else f"{tokens[i - back]} ... {cue}"
+                break
+        if but is not None:
+            valence *= BEFORE_BUT if i < but else AFTER_BUT if i > but else 1
+        scored.append((cue, valence))
+    return scored
+
+
+def _label(compound):
+    return ('positive' if compound >= POSITIVE_THRESHOLD else
+            'negative' if compound <= NEGATIVE_THRESHOLD else 'neutral')
+
+
+def _reason(scored, compound):
+    """The words that decided the label, strongest first"""
+    label = _label(compound)
+    if label == 'neutral':
+        return 'no strong emotional cues' if not scored else 'mixed or mild tone'
+    sign = 1 if label == 'positive' else -1
+    cues = sorted((t for t in scored if t[1] * sign > 0), key=lambda t: -abs(t[1]))
+    words = list(dict.fromkeys(token for token, _ in cues))[:3]
+    return f"{label} cues: {', '.join(words)}"
+
+
+def score_batch(texts):
+    """[(compound -1..1, reason)] for each text, in one vectorized pass"""
+    n = len(texts)
+    if not n:
+        return []
+    per_message = [_token_valences(text) for text in texts]
+    counts = np.fromiter((len(s) for s in per_message), dtype=np.int64, count=n)
+    owner = np.repeat(np.arange(n), counts)
+    valences = np.fromiter((v for s in per_message for _, v in s), dtype=np.float64, count=int(counts.sum()))
+
+    sums = np.bincount(owner, weights=valences, minlength=n).astype(np.float64)
+    exclamations = np.fromiter((min(text.count('!'), MAX_EXCLAMATIONS) for text in texts), dtype=np.float64, count=n)
+    sums += np.sign(sums) * exclamations * EXCLAMATION_BOOST
+    compound = sums / np.sqrt(sums * sums + NORMALIZE_ALPHA)
+    return [(float(c), _reason(s, c)) for c, s in zip(compound, per_message)]
+
+
+class SentimentEngine:
+    """Message scores behind an LRU keyed by text hash"""
+
+    def __init__(self, max_size=SENTIMENT_CACHE_SIZE):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()
+        self.counters = {'hits': 0, 'misses': 0, 'batches': 0}
+
+    def score(self, texts):
+        """[(compound, reason)] per text; only texts not seen before are scored"""
+        keys = [_digest(text) for text in texts]
+        results = [None] * len(texts)
+        missing = {}
+        with self.lock:
+            for i, key in enumerate(keys):
+                cached = self.cache.get(key)
+                if cached is not None:
+                    self.cache.move_to_end(key)
+                    results[i] = cached
+                else:
+                    missing.setdefault(key, []).append(i)
+            self.counters['hits'] += len(texts) - sum(len(v) for v in missing.values())
+            self.counters['misses'] += sum(len(v) for v in missing.values())
+
+        if missing:
+            order = list(missing)
+            scored = score_batch([texts[missing[key][0]] for key in order])
+            with self.lock:
+                self.counters['batches'] += 1
+                for key, result in zip(order, scored):
+                    for i in missing[key]:
+                        results[i] = result
+                    self.cache[key] = result
+                while len(self.cache) > self.max_size:
+                    self.cache.popitem(last=False)
+        return results
+
+    def analyze(self, transcript):
+        """
+        The /agent/sentiment_analysis answer for a conversation:
+        {messages: [{index, sentiment, score 0..1, reason}], overall_sentiment,
+         trend, health_score, insights}
+        """
+        scored = self.score(transcript.texts)
+        compound = np.array([c for c, _ in scored], dtype=np.float64)
+        messages = [
+            {'index': i, 'sentiment': _label(c), 'score': round((c + 1) / 2, 3), 'reason': reason}
+            for i, (c, reason) in enumerate(scored)
+        ]
+        if not len(compound):
+            return {'messages': [], 'overall_sentiment': 'neutral', 'trend': 'stable',
+                    'health_score': 70, 'insights': 'No messages to analyze yet.'}
+
+        # Newer messages weigh more in the overall mood
+        weights = np.linspace(1, 2, len(compound))
+        mean = float(np.average(compound, weights=weights))
+        half = len(compound) // 2
+        change = float(compound[half:].mean() - compound[:half].mean()) if half else 0.0
+        trend = 'improving' if change > TREND_THRESHOLD else 'declining' if change < -TREND_THRESHOLD else 'stable'
+
+        labels = [m['sentiment'] for m in messages]
+        positive, negative = labels.count('positive'), labels.count('negative')
+        insights = (f"{positive} of {len(labels)} messages are positive and {negative} negative. " +
+                    {'improving': 'Recent messages are warmer than earlier ones.',
+                     'declining': 'Recent messages are cooler than earlier ones.',
+                     'stable': 'The tone has been steady.'}[trend])
+        return {
+            'messages': messages,
+            'overall_sentiment': _label(mean),
+            'trend': trend,
+            'health_score': int(round(np.interp(mean, [-1, 0, 1], [0, 70, 100]))),
+            'insights': insights,
+        }
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+            counters['cached'] = len(self.cache)
+        lookups = counters['hits'] + counters['misses']
+        counters['hit_rate'] = round(counters['hits'] / lookups, 3) if lookups else None
+        return counters
+
+
+engine = SentimentEngine()
@@ -0,0 +1,137 @@
+"""
+Atlas Request Coalescing (single-flight)
+Concurrent identical requests share one upstream call: the first caller
+(the leader) does the work, everyone else waits for and gets its result.
+
+Double-taps, widget rebuilds and /summarize_chat -> auto_analyze forwards
+otherwise send the same prompt to the model several times at once.
+
+SingleFlight coalesces across threads (Flask mode), AsyncSingleFlight
+across coroutines (ASGI mode). Both report into the same counters.
+"""
+
+import asyncio
+import os
+import threading
+
+
+SINGLEFLIGHT_ENABLED = os.environ.get('LLM_SINGLEFLIGHT', '1') != '0'
+
+_stats_lock = threading.Lock()
+_stats = {'leaders': 0, 'coalesced': 0}
+
+
+def _count(field):
+    with _stats_lock:
+        _stats[field] += 1
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class LeaderCancelled(Exception):
+    """The leader was cancelled before its call finished; a follower runs it again"""
+
+
+class SingleFlight:
+    """Thread-safe single-flight group"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, fn):
+        """Run fn() once per key among concurrent callers and share its result"""
+        if not SINGLEFLIGHT_ENABLED:
+            return fn()
+
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+
+        if not leader:
+            _count('coalesced')
+            print(f"[SINGLEFLIGHT] Joined in-flight call ({key[:12]})")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        _count('leaders')
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+    def in_flight(self):
+        with self.lock:
+            return len(self.calls)
+
+
+class AsyncSingleFlight:
+    """Single-flight group for coroutines on one event loop"""
+
+    def __init__(self):
+        self.calls = {}
+
+    async def do(self, key, coro_fn):
+        """Await coro_fn() once per key among concurrent callers and share its result"""
+        if not SINGLEFLIGHT_ENABLED:
+            return await coro_fn()
+
+        future = self.calls.get(key)
+        if future is not None:
+            _count('coalesced')
+            print(f"[SINGLEFLIGHT] Joined in-flight call ({key[:12]})")
+            # shield: one waiter being cancelled must not cancel the shared call
+            try:
+                return await asyncio.shield(future)
+            except LeaderCancelled:
+                # the first follower back becomes the new leader, the rest join it
+                return await self.do(key, coro_fn)
+
+        _count('leaders')
+        future = asyncio.get_running_loop().create_future()
+        self.calls[key] = future
+        try:
+            result = await coro_fn()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            # the leader's caller went away, not the followers: hand the call over
+            future.set_exception(LeaderCancelled())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else was waiting
+            raise
+        finally:
+            del self.calls[key]
+
+    def in_flight(self):
+        return len(self.calls)
+
+
+ai_flights = SingleFlight()
+async_ai_flights = AsyncSingleFlight()
+
+
+def stats():
+    with _stats_lock:
+        counters = dict(_stats)
+    counters['enabled'] = SINGLEFLIGHT_ENABLED
+    counters['in_flight'] = ai_flights.in_flight() + async_ai_flights.in_flight()
+    return counters
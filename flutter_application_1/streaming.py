@@ -0,0 +1,51 @@
+"""
+Atlas Streaming Helpers
+Glue between OpenAI-compatible streamed completions (stream: true) and
+Server-Sent Events to the app:
+
+- chat_deltas / chat_deltas_async: SSE lines from the NIM -> content deltas
+- sse_event: one SSE frame for the client
+
+Pulling JSON (and completed array items) out of the deltas is done by
+json_stream.JsonStreamExtractor.
+"""
+
+import json
+
+
+def _delta(line):
+    """Content delta carried by one SSE line ('' for none, None at [DONE])"""
+    if not line or not line.startswith('data:'):
+        return ''
+    data = line[len('data:'):].strip()
+    if data == '[DONE]':
+        return None
+    try:
+        choice = json.loads(data)['choices'][0]
+    except (ValueError, KeyError, IndexError):
+        return ''
+    return (choice.get('delta') or {}).get('content') or ''
+
+
+def chat_deltas(lines):
+    """Yield the content deltas of a streamed chat completion"""
+    for line in lines:
+        delta = _delta(line)
+        if delta is None:
+            return
+        if delta:
+            yield delta
+
+
+async def chat_deltas_async(lines):
+    async for line in lines:
+        delta = _delta(line)
+        if delta is None:
+            return
+        if delta:
+            yield delta
+
+
+def sse_event(event, data):
+    """One Server-Sent Events frame with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,183 @@
+"""
+Atlas Rolling Conversation Summaries
+Keeps prompt size flat in relationship age: everything before a contact's
+recent tail is folded into a compact summary once, so agents get
+summary + tail instead of thousands of raw messages.
+
+- messages older than the tail are folded in blocks of SUMMARY_BLOCK
+  messages, each into a short block summary (one model call per block, ever)
+- every SUMMARY_FANOUT summaries of one level are merged into a single
+  summary one level up, so the summary grows with log(history) at most
+- folding runs in the background: a request never waits for it and uses
+  the summary as far as it has got, plus all messages not folded yet
+
+There is one chain per conversation (keyed by the caller, e.g. stored
+conversation id or contact), folded from one canonical rendering of it, so
+every agent reads the same summary whatever format it sends the model. A
+history that no longer matches what was folded (edited or reset on the
+client) resets the chain; chains unused for SUMMARY_IDLE_HOURS are dropped.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+SUMMARIES_ENABLED = os.environ.get('ROLLING_SUMMARIES', '1') != '0'
+SUMMARY_TAIL = int(os.environ.get('SUMMARY_TAIL', 40))        # newest messages always kept raw
+SUMMARY_BLOCK = int(os.environ.get('SUMMARY_BLOCK', 40))      # messages folded per model call
+SUMMARY_FANOUT = int(os.environ.get('SUMMARY_FANOUT', 6))     # summaries merged into one a level up
+SUMMARY_MAX_CHAINS = int(os.environ.get('SUMMARY_MAX_CHAINS', 10000))
+SUMMARY_IDLE_HOURS = float(os.environ.get('SUMMARY_IDLE_HOURS', 72))
+
+
+def _digest(lines):
+    return hashlib.sha256('\n'.join(lines).encode('utf-8')).hexdigest()
+
+
+class _Chain:
+    """Summaries of one conversation; levels[0] = block summaries, higher = merges (older)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.used_at = time.monotonic()
+        self.reset()
+
+    def reset(self):
+        self.folded = 0           # messages covered by the summaries
+        self.last_block = None    # digest of the last folded block
+        self.levels = [[]]
+        self.generation = getattr(self, 'generation', 0) + 1
+        self.folding = False
+
+    def matches(self, lines):
+        if self.folded > len(lines):
+            return False
+        return not self.folded or _digest(lines[self.folded - SUMMARY_BLOCK:self.folded]) == self.last_block
+
+    def text(self):
+        """Summaries oldest first (highest level first)"""
+        return '\n'.join(summary for level in reversed(self.levels) for summary in level)
+
+
+class RollingSummaries:
+    """
+    summarize(lines, merge) -> summary text or None (model unavailable)
+    merge=False: lines are messages; merge=True: lines are older summaries
+    """
+
+    def __init__(self, summarize, workers=2):
+        self.summarize = summarize
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        self.chains = OrderedDict()
+        self.counters = {'folds': 0, 'merges': 0, 'messages_folded': 0, 'failures': 0, 'resets': 0,
+                         'evictions': 0}
+
+    def _count(self, field, amount=1):
+        with self.lock:
+            self.counters[field] += amount
+
+    def _chain(self, key):
+        now = time.monotonic()
+        with self.lock:
+            chain = self.chains.get(key)
+            if chain is None:
+                chain = self.chains[key] = _Chain()
+            chain.used_at = now
+            self.chains.move_to_end(key)
+            # Least recently used first: drop chains over the cap or idle too long
+            while len(self.chains) > 1 and (
+                    len(self.chains) > SUMMARY_MAX_CHAINS
+                    or now - next(iter(self.chains.values())).used_at >= SUMMARY_IDLE_HOURS * 3600):
+                self.chains.popitem(last=False)
+                self.counters['evictions'] += 1
+            return chain
+
+    def context(self, key, lines):
+        """
+        (summary, unfolded lines) for a conversation, and schedule folding of
+        whatever has moved out of the recent tail
+        key: the conversation; lines: its canonical rendering, one per message
+        """
+        if not SUMMARIES_ENABLED or not lines:
+            return '', lines
+        chain = self._chain(key)
+        with chain.lock:
+            if not chain.matches(lines):
+                chain.reset()
+                self._count('resets')
+            folded, summary = chain.folded, chain.text()
+            start_fold = not chain.folding and len(lines) - folded >= SUMMARY_TAIL + SUMMARY_BLOCK
+            if start_fold:
+                chain.folding = True
+                generation = chain.generation
+        if start_fold:
+            self.pool.submit(self._fold, chain, list(lines), generation)
+        return summary, lines[folded:]
+
+    def _fold(self, chain, lines, generation):
+        try:
+            while True:
+                with chain.lock:
+                    if chain.generation != generation:
+                        return
+                    start = chain.folded
+                if len(lines) - start < SUMMARY_TAIL + SUMMARY_BLOCK:
+                    return
+                block = lines[start:start + SUMMARY_BLOCK]
+                summary = self.summarize(block, False)
+                if not summary:
+                    self._count('failures')
+                    return
+                with chain.lock:
+                    if chain.generation != generation:
+                        return
+                    chain.levels[0].append(summary)
+                    chain.folded = start + SUMMARY_BLOCK
+                    chain.last_block = _digest(block)
+                self._count('folds')
+                self._count('messages_folded', SUMMARY_BLOCK)
+                if not self._merge(chain, generation):
+                    return
+        except Exception as e:
+            self._count('failures')
+            print(f"[SUMMARY] Folding failed: {e}")
+        finally:
+            with chain.lock:
+                if chain.generation == generation:
+                    chain.folding = False
+
+    def _merge(self, chain, generation):
+        """Merge full levels upwards; False if the model was unavailable"""
+        level = 0
+        while True:
+            with chain.lock:
+                if chain.generation != generation or level >= len(chain.levels):
+                    return True
+                if len(chain.levels[level]) < SUMMARY_FANOUT:
+                    level += 1
+                    continue
+                group = chain.levels[level][:SUMMARY_FANOUT]
+            merged = self.summarize(group, True)
+            if not merged:
+                self._count('failures')
+                return False
+            with chain.lock:
+                if chain.generation != generation:
+                    return True
+                del chain.levels[level][:SUMMARY_FANOUT]
+                if level + 1 == len(chain.levels):
+                    chain.levels.append([])
+                chain.levels[level + 1].append(merged)
+            self._count('merges')
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+            counters['chains'] = len(self.chains)
+        counters['enabled'] = SUMMARIES_ENABLED
+        return counters
@@ -0,0 +1,57 @@
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def fake_upstream(monkeypatch):
+    """
+    main_auto with the model replaced: every request is answered with
+    `answers[agent marker]` (first system-prompt match) and recorded in `sent`
+    """
+    import main_auto
+
+    class Upstream:
+        def __init__(self):
+            self.sent = []
+            self.answers = {}
+
+        def send(self, url, headers, payload, stop_at_json=False, attempt=None):
+            self.sent.append(payload)
+            system = payload['messages'][0]['content']
+            for marker, answer in self.answers.items():
+                if marker in system:
+                    return 200, main_auto.completion_from_text(json.dumps(answer))
+            return 200, main_auto.completion_from_text('{}')
+
+        async def send_async(self, url, headers, payload, stop_at_json=False):
+            return self.send(url, headers, payload, stop_at_json)
+
+    fake = Upstream()
+    monkeypatch.setattr(main_auto, 'send_ai_request', fake.send)
+    monkeypatch.setattr(main_auto, 'send_ai_request_async', fake.send_async)
+    main_auto.response_cache.clear()
+    yield fake
+    main_auto.response_cache.clear()
+
+
+def asgi_post(app, path, payload):
+    """(status, body) of one JSON POST through an ASGI app"""
+    body = json.dumps(payload).encode()
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': 'POST', 'path': path, 'headers': []}
+    asyncio.run(app(scope, receive, send))
+    status = sent[0]['status']
+    return status, b''.join(m.get('body', b'') for m in sent[1:])
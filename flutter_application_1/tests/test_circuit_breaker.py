@@ -0,0 +1,76 @@
+import os
+import subprocess
+import sys
+import threading
+
+import main_auto
+from circuit_breaker import CircuitBreaker, HealthProber, CLOSED, OPEN
+
+
+def opened_by_slowness():
+    breaker = CircuitBreaker('brev', failure_threshold=2, latency_threshold=0.05)
+    breaker.record_success(latency=1)
+    breaker.record_success(latency=1)
+    assert breaker.state == OPEN
+    return breaker
+
+
+def test_breaker_opened_by_slowness_closes_on_a_fast_probe_completion():
+    breaker = opened_by_slowness()
+    calls = []
+
+    def probe(completion):
+        calls.append(completion)
+        return True
+
+    HealthProber({'brev': (breaker, probe)}).probe_once()
+
+    assert calls == [True]
+    assert breaker.state == CLOSED
+
+
+def test_slow_probe_completion_keeps_it_open():
+    breaker = opened_by_slowness()
+    release = threading.Event()
+
+    def probe(completion):
+        release.wait(0.1)  # slower than the breaker's latency threshold
+        return True
+
+    HealthProber({'brev': (breaker, probe)}).probe_once()
+
+    assert breaker.state == OPEN
+    assert breaker.slow
+
+
+def test_failed_probe_keeps_asking_for_a_completion():
+    breaker = opened_by_slowness()
+    calls = []
+
+    def probe(completion):
+        calls.append(completion)
+        return False
+
+    prober = HealthProber({'brev': (breaker, probe)})
+    prober.probe_once()
+    prober.probe_once()
+
+    assert calls == [True, True]
+    assert breaker.state == OPEN
+
+
+def test_breaker_opened_by_errors_closes_on_a_plain_probe():
+    breaker = CircuitBreaker('nvidia', failure_threshold=1)
+    breaker.record_failure('HTTP 503')
+    calls = []
+
+    HealthProber({'nvidia': (breaker, lambda completion: calls.append(completion) or True)}).probe_once()
+
+    assert calls == [False]
+    assert breaker.state == CLOSED
+
+
+def test_prober_starts_with_the_server_not_on_import():
+    check = "import main_auto; assert main_auto.health_prober.thread is None"
+    subprocess.run([sys.executable, '-c', check], cwd=os.path.dirname(main_auto.__file__),
+                   check=True, capture_output=True)
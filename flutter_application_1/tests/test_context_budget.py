@@ -0,0 +1,52 @@
+import threading
+
+import context_budget
+
+
+class SlowTokenizer:
+    """Stands in for tokenizers.Tokenizer: from_pretrained waits for `release`"""
+    release = threading.Event()
+
+    @classmethod
+    def from_pretrained(cls, source, revision, token):
+        cls.release.wait(5)
+        return cls()
+
+    def encode(self, text, add_special_tokens=False):
+        class Encoding:
+            ids = text.split()
+        return Encoding()
+
+
+def test_tokenizer_loads_in_the_background(monkeypatch):
+    monkeypatch.setattr(context_budget, 'Tokenizer', SlowTokenizer)
+    monkeypatch.setitem(context_budget.TOKENIZER_SOURCES, 'test/model', 'test/repo')
+    monkeypatch.setattr(context_budget, '_tokenizers', {})
+    context_budget.count_tokens.cache_clear()
+    text = 'hello there, general kenobi!'
+
+    # Still downloading: the estimate, without waiting
+    assert context_budget.tokenizer('test/model') is None
+    assert context_budget.count_tokens(text, 'test/model') == context_budget.estimate_tokens(text)
+    assert context_budget.stats()['tokenizers']['test/model'] == 'loading'
+
+    SlowTokenizer.release.set()
+    for thread in threading.enumerate():
+        if thread.name == 'atlas-tokenizers':
+            thread.join(5)
+
+    assert isinstance(context_budget.tokenizer('test/model'), SlowTokenizer)
+    assert context_budget.count_tokens(text, 'test/model') == 4
+    assert context_budget.stats()['tokenizers']['test/model'] == 'exact'
+
+
+def test_model_without_source_uses_the_estimate():
+    assert context_budget.tokenizer('unknown/model') is None
+    assert context_budget.stats()['tokenizers']['unknown/model'] == 'estimate'
+
+
+def test_fit_newest_keeps_the_newest_lines():
+    lines = ['one two three', 'four five', 'six']
+    kept, used = context_budget.fit_newest(lines, 6, 'unknown/model')
+    assert kept == ['four five', 'six']
+    assert used == 5
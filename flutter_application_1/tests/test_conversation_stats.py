@@ -0,0 +1,107 @@
+import numpy as np
+
+from conversation_stats import MAX_REPLY_HOURS, ConversationStats, _percentiles, compute
+from transcript import Transcript
+
+
+T0 = 1_700_000_000
+HOUR = 3600
+
+
+def transcript(*messages):
+    return Transcript.from_messages(
+        [{'text': text, 'isUser': user, 'timestamp': None if at is None else T0 + at} for user, at, text in messages],
+        contact_name='Sam',
+    )
+
+
+# contact opens, user replies after 1h and follows up; a 3h gap starts a
+# second session the contact opens, user replies after 30 min
+TWO_SESSIONS = transcript(
+    (False, 0, 'hey, free tonight?'),
+    (True, HOUR, 'yes!'),
+    (True, 2 * HOUR, 'where?'),
+    (False, 5 * HOUR, 'the usual 🍕'),
+    (True, 5.5 * HOUR, 'see you'),
+)
+
+
+def test_percentiles():
+    assert _percentiles(np.arange(1, 11, dtype=np.float64)) == {'p50': 5.5, 'p90': 9.1, 'mean': 5.5}
+    assert _percentiles(np.array([])) is None
+
+
+def test_side_counts_and_rates():
+    sides = compute(TWO_SESSIONS)['sides']
+
+    assert sides['user']['messages'] == 3 and sides['user']['share'] == 0.6
+    assert sides['user']['length'] == {'mean': 5.7, 'p50': 6.0, 'p90': 6.8}
+    assert sides['user']['question_rate'] == 0.333
+    assert sides['contact']['emoji_rate'] == 0.5
+    assert sides['contact']['question_rate'] == 0.5
+
+
+def test_reply_hours_count_only_switches_of_side():
+    reply_hours = compute(TWO_SESSIONS)['reply_hours']
+
+    assert reply_hours['user'] == {'p50': 0.75, 'p90': 0.95, 'mean': 0.75}
+    assert reply_hours['contact'] == {'p50': 3.0, 'p90': 3.0, 'mean': 3.0}
+
+
+def test_gaps_over_a_week_are_not_replies():
+    stats = compute(transcript((False, 0, 'hi'), (True, (MAX_REPLY_HOURS + 1) * HOUR, 'sorry, just saw this')))
+
+    assert stats['reply_hours'] == {'user': None, 'contact': None}
+
+
+def test_sessions_split_on_the_gap():
+    sessions = compute(TWO_SESSIONS)['sessions']
+
+    assert sessions['count'] == 2
+    assert sessions['messages_mean'] == 2.5
+    assert sessions['duration_minutes_p50'] == 75.0   # 120 and 30 minutes
+    assert sessions['started_by_user_share'] == 0.0
+
+
+def test_messages_are_ordered_by_time_and_undated_ones_skipped():
+    stats = compute(transcript((True, HOUR, 'yes!'), (False, None, 'lost'), (False, 0, 'free tonight?')))
+
+    assert stats['timed_messages'] == 2
+    assert stats['reply_hours']['user']['p50'] == 1.0
+    assert stats['sessions']['started_by_user_share'] == 0.0
+
+
+def test_fewer_than_two_timestamps_leave_timing_empty():
+    stats = compute(transcript((True, 0, 'hi'), (False, None, 'hello')))
+
+    assert stats['messages'] == 2
+    assert stats['reply_hours'] is None and stats['sessions'] is None
+
+
+def test_active_histograms_count_every_timed_message():
+    stats = compute(TWO_SESSIONS)
+
+    assert sum(stats['active_hours']['histogram']) == 5
+    assert sum(stats['active_weekdays']['histogram'].values()) == 5
+
+
+def test_cache_is_keyed_by_conversation_version():
+    engine = ConversationStats()
+
+    first = engine.get(TWO_SESSIONS, 'c1', 5)
+    assert engine.get(TWO_SESSIONS, 'c1', 5) is first
+    engine.get(TWO_SESSIONS, 'c1', 6)
+    assert engine.get(transcript((True, 0, 'hi'))) is engine.get(transcript((True, 0, 'hi')))
+
+    assert engine.stats() == {'hits': 2, 'misses': 3, 'cached': 3}
+
+
+def test_cache_evicts_the_least_recently_used():
+    engine = ConversationStats(max_size=2)
+
+    engine.get(TWO_SESSIONS, 'a', 1)
+    engine.get(TWO_SESSIONS, 'b', 1)
+    engine.get(TWO_SESSIONS, 'a', 1)
+    engine.get(TWO_SESSIONS, 'c', 1)
+
+    assert list(engine.cache) == [('conversation', 'a', 1), ('conversation', 'c', 1)]
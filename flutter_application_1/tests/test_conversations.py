@@ -0,0 +1,99 @@
+import pytest
+
+import conversations
+import main_auto
+import transcript
+from conversations import ConversationStore, CursorAhead
+
+
+MESSAGES = [
+    {'text': 'hey', 'sender': 'Sam', 'timestamp': '2024-05-01T10:00:00Z'},
+    {'text': 'hi!', 'sender': 'You', 'timestamp': '2024-05-01T10:01:00Z'},
+]
+
+
+def test_retry_without_ids_or_cursor_is_not_appended_twice():
+    store = ConversationStore()
+
+    assert store.append('c1', MESSAGES)['appended'] == 2
+    retry = store.append('c1', MESSAGES + [{'text': 'lunch?', 'sender': 'Sam', 'timestamp': '2024-05-01T10:02:00Z'}])
+
+    assert retry == {'cursor': 3, 'appended': 1, 'duplicates': 2}
+
+
+def test_same_text_at_another_time_is_a_new_message():
+    store = ConversationStore()
+    store.append('c1', [{'text': 'ok', 'isUser': True, 'timestamp': 1}])
+
+    assert store.append('c1', [{'text': 'ok', 'isUser': True, 'timestamp': 2}])['appended'] == 1
+
+
+def test_repeated_message_without_id_or_timestamp_is_kept():
+    store = ConversationStore()
+    store.append('c1', [{'text': 'ok', 'isUser': True}])
+
+    assert store.append('c1', [{'text': 'ok', 'isUser': True}], cursor=1)['appended'] == 1
+    assert store.append('c1', [{'text': 'ok', 'isUser': True}] * 2, cursor=2)['appended'] == 2
+    assert [m['text'] for m in store.get('c1').messages] == ['ok'] * 4
+
+
+def test_only_a_repeat_of_the_log_end_counts_as_resent():
+    store = ConversationStore()
+    store.append('c1', [{'text': 'ok', 'isUser': True}, {'text': 'see you', 'isUser': False}])
+
+    # "ok" is in the history, but not at its end: a new message
+    assert store.append('c1', [{'text': 'ok', 'isUser': True}])['appended'] == 1
+    assert store.append('c1', [{'text': 'ok', 'isUser': True}, {'text': 'bye', 'isUser': False}]) == {
+        'cursor': 4, 'appended': 1, 'duplicates': 1}
+
+
+def test_generated_ids_do_not_collide_with_client_ids():
+    store = ConversationStore()
+    store.append('c1', [{'text': 'hey', 'isUser': False}])
+
+    assert store.append('c1', [{'id': 0, 'text': 'first with an id', 'isUser': True}])['appended'] == 1
+    assert [m['id'] for m in store.get('c1').messages] == ['seq:0', '0']
+
+
+def test_ids_decide_for_messages_that_have_them():
+    store = ConversationStore()
+    store.append('c1', [{'id': 'a', 'text': 'ok', 'isUser': True, 'timestamp': 1}])
+
+    assert store.append('c1', [{'id': 'a', 'text': 'edited', 'isUser': True, 'timestamp': 1}])['appended'] == 0
+    assert store.append('c1', [{'id': 'b', 'text': 'ok', 'isUser': True, 'timestamp': 1}])['appended'] == 1
+
+
+def test_cursor_ahead_of_the_server():
+    store = ConversationStore()
+    store.append('c1', MESSAGES)
+
+    with pytest.raises(CursorAhead) as error:
+        store.append('c1', MESSAGES, cursor=5)
+    assert error.value.cursor == 2
+
+
+def test_user_senders_match_the_transcript():
+    store = ConversationStore()
+    store.append('c1', MESSAGES)
+
+    assert [m['isUser'] for m in store.get('c1').messages] == [False, True]
+    assert conversations.USER_SENDERS is transcript.USER_SENDERS
+
+
+def test_persisted_log_dedupes_after_reload(tmp_path):
+    path = str(tmp_path / 'conversations.db')
+    ConversationStore(backend=conversations.SqliteBackend(path)).append('c1', MESSAGES)
+
+    reloaded = ConversationStore(backend=conversations.SqliteBackend(path))
+
+    assert reloaded.append('c1', MESSAGES)['appended'] == 0
+    assert reloaded.get('c1').cursor == 2
+
+
+def test_endpoints_answer_a_missing_body_with_json_400():
+    client = main_auto.app.test_client()
+
+    for path in ('/conversations/append', '/conversations/messages'):
+        response = client.post(path, data='not json', content_type='application/json')
+        assert response.status_code == 400
+        assert response.get_json() == {'success': False, 'error': 'conversation_id is required'}
@@ -0,0 +1,90 @@
+from datetime import date, datetime
+
+import pytest
+
+from date_extract import candidate_line, extract, find_dates, local_dates
+from transcript import Transcript
+
+
+REF = date(2026, 3, 11)  # a Wednesday
+
+
+def dates(text, ref=REF):
+    return [(expr, day.isoformat(), precision) for expr, day, precision, _ in find_dates(text, ref)]
+
+
+@pytest.mark.parametrize('text,expected', [
+    ('on 12/31/99', '1999-12-31'),
+    ('on 1/5/26', '2026-01-05'),
+    ('by 6/1/40', '2040-06-01'),
+    ('since 2/3/47', '1947-02-03'),
+    ('on 12/31/1999', '1999-12-31'),
+])
+def test_numeric_years(text, expected):
+    assert dates(text)[0][1] == expected
+
+
+@pytest.mark.parametrize('text,expected', [
+    ('March 15th', ('March 15th', '2026-03-15', 'day')),
+    ('15 March 2027', ('15 March 2027', '2027-03-15', 'day')),
+    ('2026-04-01', ('2026-04-01', '2026-04-01', 'day')),
+    ('3/10', ('3/10', '2027-03-10', 'day')),            # already passed this year
+    ('tomorrow', ('tomorrow', '2026-03-12', 'day')),
+    ('in 3 weeks', ('in 3 weeks', '2026-04-01', 'week')),
+    ('two days ago', ('two days ago', '2026-03-09', 'day')),
+    ('Friday', ('Friday', '2026-03-13', 'day')),
+    ('next Friday', ('next Friday', '2026-03-20', 'day')),
+    ('last Friday', ('last Friday', '2026-03-06', 'day')),
+    ('this weekend', ('this weekend', '2026-03-14', 'week')),
+    ('next month', ('next month', '2026-04-01', 'month')),
+    ('in June', ('in June', '2026-06-01', 'month')),
+])
+def test_expressions_resolve_against_the_reference_date(text, expected):
+    assert dates(text) == [expected]
+
+
+@pytest.mark.parametrize('text', ['you may go', 'February 30', '13/45', '2026-02-30'])
+def test_invalid_or_ambiguous_dates_are_ignored(text):
+    assert dates(text) == []
+
+
+def test_overlapping_matches_keep_the_more_precise_pattern():
+    assert dates('back in June 5th, then on Friday') == [('June 5th', '2026-06-05', 'day'),
+                                                         ('on Friday', '2026-03-13', 'day')]
+
+
+def conversation(*messages):
+    sent = datetime(2026, 3, 11, 12).timestamp()
+    return Transcript.from_messages(
+        [{'text': text, 'isUser': user, 'timestamp': sent} for user, text in messages], 'Sam')
+
+
+def test_extract_keeps_dated_or_milestone_sentences_only():
+    transcript = conversation(
+        (False, 'How are you? My birthday is March 20th!'),
+        (True, 'lunch tomorrow?'),
+        (False, 'Tomorrow is busy.'),
+        (True, 'Our anniversary is coming up.'),
+    )
+
+    candidates = extract(transcript, today=REF)
+
+    assert [(c['index'], c['type']) for c in candidates] == [(0, 'birthday'), (1, 'meeting'), (3, 'anniversary')]
+    assert candidates[0]['dates'] == [{'expression': 'March 20th', 'date': '2026-03-20', 'precision': 'day'}]
+    assert candidate_line(candidates[0]) == (
+        'Sam: My birthday is March 20th!  [resolved: "March 20th" = Friday, March 20, 2026]')
+
+
+def test_local_dates_shape():
+    transcript = conversation((False, 'My birthday is March 20th!'))
+
+    found = local_dates(extract(transcript, today=REF), 'Sam', today=REF)
+
+    assert found == [{
+        'type': 'birthday',
+        'person': 'Sam',
+        'date': 'March 20, 2026',
+        'date_relative': 'in 9 days',
+        'context': 'My birthday is March 20th!',
+        'significance': 'high',
+    }]
@@ -0,0 +1,125 @@
+
+import main_auto
+from conversations import conversation_store
+from features import MAX_REPLY_HOURS, ContactFeatures, FeatureStore
+from transcript import Transcript
+
+
+T0 = 1_700_000_000
+HOUR = 3600
+DAY = 86400
+
+# contact, user after 1h, contact after 1h, user after 3h
+MESSAGES = [
+    {'text': 'free tonight?', 'isUser': False, 'timestamp': T0},
+    {'text': 'yes', 'isUser': True, 'timestamp': T0 + HOUR},
+    {'text': 'the usual?', 'isUser': False, 'timestamp': T0 + 2 * HOUR},
+    {'text': 'sure', 'isUser': True, 'timestamp': T0 + 5 * HOUR},
+]
+
+
+def snapshot(messages, now=T0 + DAY):
+    return ContactFeatures.from_transcript(Transcript.from_messages(messages)).snapshot(now)
+
+
+def test_reply_times_and_counts():
+    features = snapshot(MESSAGES)
+
+    assert features['version'] == features['message_count'] == 4
+    assert (features['user_messages'], features['contact_messages']) == (2, 2)
+    assert features['avg_reply_hours'] == 2.0
+    assert features['reply_variation'] == 0.5
+    assert features['contact_avg_reply_hours'] == 1.0
+    assert features['last_message'] == 'the usual?' and features['last_message_from'] == 'me'
+    assert features['hours_since_last_message'] == 19.0
+
+
+def test_gaps_over_max_reply_hours_are_not_replies():
+    features = snapshot(MESSAGES[:1] + [{'text': 'sorry!', 'isUser': True,
+                                         'timestamp': T0 + (MAX_REPLY_HOURS + 1) * HOUR}], now=T0 + 30 * DAY)
+
+    assert features['avg_reply_hours'] is None and features['reply_samples'] == 0
+
+
+def test_no_timestamps_leave_time_features_empty():
+    features = snapshot([{'text': 'hi', 'isUser': True}, {'text': 'hey', 'isUser': False}])
+
+    assert features['message_count'] == 2 and features['timed_messages'] == 0
+    assert features['days_since_last_message'] is None and features['avg_messages_per_week'] is None
+    assert features['activity_ratio'] == 1.0
+
+
+def test_activity_ratio_compares_the_last_two_windows():
+    old = [{'text': 'x', 'isUser': False, 'timestamp': T0 + i * HOUR} for i in range(5)]
+    recent = [{'text': 'y', 'isUser': True, 'timestamp': T0 + 40 * DAY}]
+
+    assert snapshot(old + recent, now=T0 + 41 * DAY)['activity_ratio'] == 2 / 6
+
+
+def test_applying_in_batches_matches_one_pass():
+    transcript = Transcript.from_messages(MESSAGES)
+    batched = ContactFeatures()
+    batched.apply(transcript.texts[:1], transcript.is_user[:1], transcript.times[:1])
+    batched.apply(transcript.texts[1:3], transcript.is_user[1:3], transcript.times[1:3])
+    batched.apply(transcript.texts[3:], transcript.is_user[3:], transcript.times[3:])
+
+    assert batched.snapshot(T0 + DAY) == snapshot(MESSAGES)
+
+
+def test_store_folds_in_only_appended_messages():
+    store = FeatureStore()
+    conversation_store.append('features-1', MESSAGES[:2])
+
+    first = store.read('features-1', now=T0 + DAY)
+    conversation_store.append('features-1', MESSAGES[2:])
+    second = store.read('features-1', now=T0 + DAY)
+
+    assert first['version'] == 2 and first['avg_reply_hours'] == 1.0
+    assert second == snapshot(MESSAGES)
+    assert store.stats() == {'reads': 2, 'messages_applied': 4, 'rebuilds': 1, 'contacts': 1}
+
+
+def test_version_follows_the_conversation_cursor():
+    store = FeatureStore()
+    result = conversation_store.append('features-2', MESSAGES)
+
+    assert store.read('features-2')['version'] == result['cursor']
+    assert store.read('features-2')['version'] == result['cursor']
+    assert store.stats()['messages_applied'] == 4
+
+
+def test_evicted_contacts_are_rebuilt_from_the_conversation():
+    store = FeatureStore(max_size=1)
+    conversation_store.append('features-3', MESSAGES)
+    conversation_store.append('features-4', MESSAGES[:1])
+
+    store.read('features-3', now=T0 + DAY)
+    store.read('features-4', now=T0 + DAY)
+
+    assert list(store.contacts) == ['features-4']
+    assert store.read('features-3', now=T0 + DAY) == snapshot(MESSAGES)
+    assert store.stats()['rebuilds'] == 3
+
+
+def test_unknown_conversation_reads_none():
+    assert FeatureStore().read('features-missing') is None
+
+
+def test_endpoint_reflects_appended_messages():
+    client = main_auto.app.test_client()
+    client.post('/conversations/append', json={'conversation_id': 'features-5', 'messages': MESSAGES[:2]})
+    client.post('/conversations/append', json={'conversation_id': 'features-5', 'messages': MESSAGES[2:]})
+
+    features = client.post('/features', json={'conversation_ids': ['features-5']}).get_json()['features']['features-5']
+
+    assert features['version'] == 4
+    assert features['avg_reply_hours'] == 2.0
+
+
+def test_endpoint_answers_a_missing_body_with_json_400():
+    client = main_auto.app.test_client()
+
+    response = client.post('/features', data='not json', content_type='application/json')
+
+    assert response.status_code == 400
+    assert response.get_json() == {'success': False, 'error': 'conversation_ids is required'}
@@ -0,0 +1,105 @@
+import json
+
+import main_auto
+
+
+ANALYSIS = {
+    'summary_text': 'Planning lunch',
+    'topics': ['lunch'],
+    'suggested_reply': 'Sounds good!',
+    'action_needed': 'booking',
+    'action_details': {'type': 'lunch'}
+}
+CHAT = {'contact_name': 'Sam', 'chat_log': 'Sam: want to grab lunch tomorrow?\nUser: sure'}
+
+
+def test_step_agent_is_the_innermost_flow():
+    def inner():
+        yield 'step'
+
+    def outer():
+        yield from inner()
+
+    flow = outer()
+    next(flow)
+    assert main_auto.step_agent(flow) == 'inner'
+
+
+def test_summarize_chat_steps_are_tagged_with_auto_analyze(fake_upstream):
+    fake_upstream.answers["Auto-Analyzer"] = ANALYSIS
+    client = main_auto.app.test_client()
+
+    response = client.post('/summarize_chat', json=CHAT)
+
+    assert response.status_code == 200
+    assert response.get_json()['summary_text'] == 'Planning lunch'
+    payload = fake_upstream.sent[0]
+    assert 'nvext' in payload or 'response_format' in payload
+
+
+def test_summarize_chat_shares_auto_analyze_cache_entry(fake_upstream):
+    fake_upstream.answers["Auto-Analyzer"] = ANALYSIS
+    client = main_auto.app.test_client()
+
+    first = client.post('/auto_analyze_conversation', json=CHAT).get_json()
+    second = client.post('/summarize_chat', json=CHAT).get_json()
+
+    assert first == second
+    assert len(fake_upstream.sent) == 1
+
+
+def test_agents_share_one_summary_chain_per_conversation(monkeypatch):
+    keys = []
+    monkeypatch.setattr(main_auto.rolling_summaries, 'context', lambda key, lines: keys.append(key) or ('', lines))
+    data = {'contact_name': 'Sam', 'conversation_id': 'c1',
+            'messages': [{'text': f'm{i}', 'isUser': i % 2 == 0, 'timestamp': 1_700_000_000 + i} for i in range(5)]}
+    transcript = main_auto.transcripts.for_request(data)
+
+    main_auto.budget_history('conversation_starter_agent', transcript.lines, conversation=data)
+    main_auto.budget_history('conversation_insights_agent', transcript.timed_lines, conversation=data)
+    main_auto.budget_history('key_dates_agent', transcript.lines[:2], conversation=data)
+
+    assert keys == [('conversation', 'c1'), ('conversation', 'c1')]
+
+
+def test_flow_serves_the_same_answer_through_flask_and_asgi(fake_upstream):
+    import main_auto_asgi
+    from conftest import asgi_post
+
+    fake_upstream.answers["Auto-Analyzer"] = ANALYSIS
+    flask_response = main_auto.app.test_client().post('/auto_analyze_conversation', json=CHAT)
+    main_auto.response_cache.clear()
+
+    status, body = asgi_post(main_auto_asgi.app, '/auto_analyze_conversation', CHAT)
+
+    assert flask_response.status_code == status == 200
+    assert json.loads(body) == flask_response.get_json()
+    assert len(fake_upstream.sent) == 2
+
+
+
+def test_smart_notification_model_only_rewords(fake_upstream):
+    fake_upstream.answers["Smart Notification Manager"] = {
+        'notification_message': 'Sam is waiting on you', 'should_notify': False, 'priority': 'low'}
+    client = main_auto.app.test_client()
+
+    response = client.post('/agent/smart_notifications', json={
+        'contact_name': 'Sam', 'avg_messages_per_week': 20, 'last_message_from': 'them',
+        'days_since_last_message': 2})
+
+    decision = response.get_json()['data']
+    assert decision['notification_message'] == 'Sam is waiting on you'
+    assert (decision['should_notify'], decision['priority']) == (True, 'urgent')
+
+
+def test_booking_without_a_location_still_books(fake_upstream, monkeypatch):
+    monkeypatch.setattr(main_auto, 'generate_voice_message', lambda text: 'https://audio/1.mp3')
+    fake_upstream.answers["Booking Agent"] = {
+        'suggested_time': 'Tomorrow at 3 PM', 'meeting_type': 'coffee', 'message_to_send': 'Coffee tomorrow?'}
+    client = main_auto.app.test_client()
+
+    response = client.post('/auto_book_meeting', json={'contact_name': 'Sam', 'chat_context': 'coffee?'})
+
+    assert response.status_code == 200
+    assert response.get_json()['location'] == 'TBD'
+    assert 'coffee at TBD' in response.get_json()['voice_script']
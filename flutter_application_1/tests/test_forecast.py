@@ -0,0 +1,101 @@
+import pytest
+
+import main_auto
+from forecast import forecast, series, trajectory
+
+
+NOW = 1_780_000_000.0
+DAY = 86400
+
+
+def history(*scores, spacing=7):
+    n = len(scores)
+    return [{'date': NOW - (n - 1 - i) * spacing * DAY, 'score': s} for i, s in enumerate(scores)]
+
+
+def test_series_sorts_dated_points_and_spaces_undated_ones():
+    days, scores = series([{'date': NOW, 'score': 70}, {'date': NOW - 7 * DAY, 'score': 60}], NOW)
+    assert (days, scores) == ([-7.0, 0.0], [60.0, 70.0])
+
+    days, scores = series([{'score': 60}, {'score': 70}, {'bad': 1}], NOW)
+    assert (days, scores) == ([-7, 0], [60.0, 70.0])
+
+
+@pytest.mark.parametrize('change,expected', [
+    (-25, 'steep_decline'), (-12, 'moderate_decline'), (-5, 'slight_decline'),
+    (0, 'stable'), (5, 'slight_improvement'), (15, 'strong_improvement'),
+])
+def test_trajectory(change, expected):
+    assert trajectory(change) == expected
+
+
+def test_declining_history_is_forecast_down_with_a_risk_and_an_intervention():
+    (result,) = forecast([{'contact_name': 'Sam', 'health_history': history(90, 85, 80, 75, 70, 65)}], NOW)
+
+    assert result['current_health'] == 65
+    assert result['forecast_30_days']['predicted_score'] < 65
+    assert result['forecast_90_days']['predicted_score'] < result['forecast_30_days']['predicted_score']
+    assert 'decline' in result['forecast_30_days']['trajectory']
+    assert result['risk_factors'][0]['factor'] == 'Declining health score trend'
+    assert result['interventions'][0]['action'] == 'Reach out to Sam this week'
+    assert result['milestones']
+
+
+def test_band_contains_the_prediction_and_widens_with_the_horizon():
+    (result,) = forecast([{'health_history': history(70, 74, 68, 73, 69, 72)}], NOW)
+
+    for horizon in ('forecast_30_days', 'forecast_90_days'):
+        low, high = result[horizon]['range']
+        assert low <= result[horizon]['predicted_score'] <= high
+    width = {h: result[h]['range'][1] - result[h]['range'][0] for h in ('forecast_30_days', 'forecast_90_days')}
+    assert width['forecast_90_days'] >= width['forecast_30_days']
+
+
+def test_answer_has_the_shape_the_app_expects():
+    (result,) = forecast([{'contact_name': 'Sam', 'health_history': history(70, 72, 71)}], NOW)
+
+    assert {'current_health', 'forecast_30_days', 'forecast_90_days', 'risk_factors', 'protective_factors',
+            'interventions', 'milestones', 'summary'} <= set(result)
+    assert {'predicted_score', 'confidence', 'trajectory', 'reasoning'} <= set(result['forecast_30_days'])
+    assert {'predicted_score', 'confidence', 'trajectory'} <= set(result['forecast_90_days'])
+    assert [set(i) for i in result['interventions']] == [{'action', 'priority', 'expected_impact', 'timing'}]
+    assert all(set(r) == {'factor', 'severity', 'impact', 'mitigation'} for r in result['risk_factors'])
+
+
+def test_bulk_fit_matches_one_by_one_and_keeps_input_order():
+    contacts = [
+        {'contact_name': 'A', 'health_history': history(90, 80, 70)},
+        {'contact_name': 'B'},
+        {'contact_name': 'C', 'health_history': history(50, 60, 70, 80)},
+        {'contact_name': 'D', 'current_health': 55},
+    ]
+
+    bulk = forecast(contacts, NOW)
+
+    assert bulk[1] is None
+    assert bulk[3]['current_health'] == 55 and bulk[3]['forecast_30_days']['confidence'] == 'low'
+    for contact, result in zip(contacts, bulk):
+        if result is not None:
+            assert forecast([contact], NOW) == [result]
+
+
+def test_endpoint_falls_back_to_the_computed_health_score(fake_upstream):
+    client = main_auto.app.test_client()
+
+    response = client.post('/agent/relationship_forecast', json={
+        'contact_name': 'Sam', 'messages': [{'text': 'hi', 'isUser': True, 'timestamp': '2026-01-01T10:00:00Z'}]})
+
+    data = response.get_json()['data']
+    assert response.get_json()['success'] is True
+    assert 0 <= data['current_health'] <= 100
+    assert fake_upstream.sent == []
+
+
+def test_bulk_names_contacts_sent_by_conversation_id(fake_upstream):
+    main_auto.conversation_store.append('forecast-bulk-1', [{'text': 'hey!', 'isUser': False}], contact_name='Sam')
+    client = main_auto.app.test_client()
+
+    response = client.post('/agent/relationship_forecast/bulk', json={'contacts': [
+        {'conversation_id': 'forecast-bulk-1'}, {'contact_name': 'Ana', 'health_history': history(60, 70)}]})
+
+    assert [r['contact_name'] for r in response.get_json()['results']] == ['Sam', 'Ana']
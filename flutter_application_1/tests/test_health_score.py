@@ -0,0 +1,85 @@
+import pytest
+
+import main_auto
+from health_score import score
+
+
+def contact(messages_per_week=None, message_count=None, days_since_last=0, avg_reply_hours=None,
+            reply_variation=0, reply_samples=0, reply_slowdown=1, activity_ratio=1):
+    return {
+        'messages_per_week': messages_per_week, 'message_count': message_count, 'days_since_last': days_since_last,
+        'avg_reply_hours': avg_reply_hours, 'reply_variation': reply_variation, 'reply_samples': reply_samples,
+        'reply_slowdown': reply_slowdown, 'activity_ratio': activity_ratio,
+    }
+
+
+def breakdown(**fields):
+    return score([contact(**fields)])[0]['breakdown']
+
+
+@pytest.mark.parametrize('per_week,expected', [(0, 10), (5, 30), (7.5, 40), (20, 70), (100, 100), (500, 100)])
+def test_frequency_breakpoints(per_week, expected):
+    assert breakdown(messages_per_week=per_week)['frequency_score'] == expected
+
+
+@pytest.mark.parametrize('count,expected', [(0, 10), (20, 40), (75, 70), (1000, 95)])
+def test_message_count_stands_in_without_a_rate(count, expected):
+    assert breakdown(message_count=count)['frequency_score'] == expected
+
+
+@pytest.mark.parametrize('days,expected', [(0, 100), (1, 90), (5, 60), (30, 10), (60, 0), (365, 0)])
+def test_recency_breakpoints(days, expected):
+    assert breakdown(messages_per_week=10, days_since_last=days)['recency_score'] == expected
+
+
+@pytest.mark.parametrize('hours,variation,expected', [
+    (0, 0, 100), (2, 0, 90), (24, 0, 50), (None, 0, 50), (96, 0, 10), (500, 0, 10),
+    (2, 0.5, 80), (2, 0.75, 75), (2, 3, 70), (96, 3, 0),
+])
+def test_engagement_breakpoints_and_variation_penalty(hours, variation, expected):
+    assert breakdown(messages_per_week=10, avg_reply_hours=hours, reply_variation=variation)['engagement_score'] == expected
+
+
+def test_overall_is_the_weighted_rubric_within_bounds():
+    best, worst = score([
+        contact(messages_per_week=200, avg_reply_hours=0),
+        contact(messages_per_week=0, days_since_last=400, avg_reply_hours=1000, reply_variation=5),
+    ])
+
+    assert (best['overall_score'], best['status']) == (100, 'excellent')
+    assert (worst['overall_score'], worst['status']) == (3, 'needs_attention')
+    # 0.30 * 50 + 0.35 * 70 + 0.35 * 50
+    assert score([contact(messages_per_week=10, days_since_last=3, avg_reply_hours=24)])[0]['overall_score'] == 57
+
+
+def test_warmth_and_diversity_take_a_quarter_when_known():
+    base = contact(messages_per_week=10, days_since_last=3, avg_reply_hours=24)
+
+    plain, warm, partial = score([base, base, base], warmth=[None, 100, 100], diversity=[None, 100, None])
+
+    assert plain['overall_score'] == 57
+    assert warm['overall_score'] == partial['overall_score'] == round(0.75 * 57.0 + 25)
+    assert set(warm['breakdown']) == {'frequency_score', 'recency_score', 'engagement_score',
+                                      'warmth_score', 'diversity_score'}
+    assert 'diversity_score' not in partial['breakdown']
+
+
+@pytest.mark.parametrize('activity,slowdown,trend', [(1, 1, 'stable'), (0.5, 1, 'declining'),
+                                                     (1, 2, 'declining'), (1.5, 1, 'improving')])
+def test_trend(activity, slowdown, trend):
+    assert score([contact(messages_per_week=10, activity_ratio=activity,
+                          reply_slowdown=slowdown)])[0]['relationship_trend'] == trend
+
+
+def test_empty_input():
+    assert score([]) == []
+
+
+def test_bulk_names_contacts_sent_by_conversation_id(fake_upstream):
+    main_auto.conversation_store.append('health-bulk-1', [{'text': 'hey!', 'isUser': False}], contact_name='Sam')
+    client = main_auto.app.test_client()
+
+    response = client.post('/agent/relationship_health/bulk', json={'contacts': [
+        {'conversation_id': 'health-bulk-1'}, {'contact_name': 'Ana', 'message_count': 10}]})
+
+    assert [r['contact_name'] for r in response.get_json()['results']] == ['Sam', 'Ana']
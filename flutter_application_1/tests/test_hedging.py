@@ -0,0 +1,69 @@
+import threading
+import time
+
+import pytest
+
+import hedging
+
+
+def test_attempt_release_runs_once():
+    attempt = hedging.Attempt()
+    released = []
+    release = attempt.once(lambda *args: released.append(args))
+
+    attempt.cancel()
+    release(1.0, False)
+
+    assert released == [()]
+
+
+def test_attempt_watch_stops_once_cancelled():
+    attempt = hedging.Attempt()
+    seen = []
+    with pytest.raises(hedging.Cancelled):
+        for chunk in attempt.watch(iter('abc')):
+            seen.append(chunk)
+            attempt.cancel()
+    assert seen == ['a']
+
+
+def test_loser_frees_its_slot_when_the_hedge_resolves():
+    released = threading.Event()
+    stopped = threading.Event()
+    chunks_read = []
+
+    def slow_primary(attempt):
+        release = attempt.once(released.set)
+        try:
+            for chunk in attempt.watch(_slow_chunks()):
+                chunks_read.append(chunk)
+        except hedging.Cancelled:
+            stopped.set()
+            raise
+        finally:
+            release()
+        return 'primary'
+
+    result = hedging.hedged_call(slow_primary, lambda attempt: 'secondary', delay=0.05)
+
+    assert result == 'secondary'
+    assert released.is_set()
+    assert stopped.wait(2)
+    assert len(chunks_read) < 10
+
+
+def test_primary_answer_before_the_delay_is_not_hedged():
+    calls = []
+
+    def secondary(attempt):
+        calls.append('secondary')
+        return 'secondary'
+
+    assert hedging.hedged_call(lambda attempt: 'primary', secondary, delay=1) == 'primary'
+    assert calls == []
+
+
+def _slow_chunks():
+    for i in range(10):
+        time.sleep(0.05)
+        yield i
@@ -0,0 +1,102 @@
+import pytest
+
+import main_auto
+from intent_gate import IntentGate, INTENTS, local_actions
+
+
+CASES = {
+    'meeting': (["Can we talk tomorrow at 3pm?", "dinner saturday?", "want to grab coffee sometime?"],
+                ["the call center was annoying", "dinner was great yesterday", "talk to you later"]),
+    'follow_up': (["did you hear back from the landlord?", "any update on the job?"],
+                  ["ok sounds good", "haha yeah"]),
+    'share': (["we should watch the sequel", "send me the pics from saturday"],
+              ["I watched it yesterday", "how was your day"]),
+    'plan': (["let's go to the beach next weekend", "got tickets for the concert"],
+             ["thanks, start next month", "busy week at work"]),
+}
+
+
+def scores(text):
+    # Said by the user, so the open-question rule stays out of the way
+    return IntentGate().classify([text], [True])
+
+
+@pytest.mark.parametrize('intent,text', [(i, t) for i, (pos, _) in CASES.items() for t in pos])
+def test_clears_on_intent(intent, text):
+    assert scores(text)[intent] >= 0.5
+
+
+@pytest.mark.parametrize('intent,text', [(i, t) for i, (_, neg) in CASES.items() for t in neg])
+def test_stays_below_without_intent(intent, text):
+    assert scores(text)[intent] < 0.5
+
+
+def test_unanswered_question_from_them_is_a_follow_up():
+    gate = IntentGate()
+
+    assert gate.classify(["how's it going?"], [False])['follow_up'] >= 0.5
+    assert gate.classify(["how's it going?"], [True])['follow_up'] < 0.5
+
+
+def test_recent_messages_outweigh_old_ones():
+    gate = IntentGate()
+    old = ["want to grab coffee?"] + ["ok"] * 9
+
+    assert gate.classify(old, [True] * 10)['meeting'] < gate.classify(old[::-1], [True] * 10)['meeting']
+
+
+def test_small_talk_skips_the_model(fake_upstream):
+    before = main_auto.intent_gate.gate.stats()
+    client = main_auto.app.test_client()
+
+    response = client.post('/detect_actions', json={'contact_name': 'Sam', 'chat_log': 'Sam: haha yeah\nUser: lol'})
+
+    assert response.get_json()['actions'] == []
+    assert set(response.get_json()['intents']) == set(INTENTS)
+    assert fake_upstream.sent == []
+    assert main_auto.intent_gate.gate.stats()['skipped'] == before['skipped'] + 1
+
+
+def test_meeting_calls_the_model_for_allowed_actions(fake_upstream):
+    fake_upstream.answers["Action Detector"] = [
+        {'action_type': 'book_meeting', 'title': 'Book call', 'description': 'Tomorrow 3pm',
+         'priority': 'high', 'icon': 'calendar'},
+        {'action_type': 'share_content', 'title': 'Share', 'description': '', 'priority': 'low', 'icon': 'share'},
+    ]
+    client = main_auto.app.test_client()
+
+    response = client.post('/detect_actions', json={'contact_name': 'Sam',
+                                                    'chat_log': 'Sam: Can we talk tomorrow at 3pm?'})
+
+    assert len(fake_upstream.sent) == 1
+    assert [a['action_type'] for a in response.get_json()['actions']] == ['book_meeting']
+
+
+def test_auto_analyze_keeps_the_models_action_needed(fake_upstream):
+    analysis = {'summary_text': 'Chat', 'topics': ['work'], 'suggested_reply': 'Sure',
+                'action_needed': 'follow_up', 'action_details': {}}
+    fake_upstream.answers["Auto-Analyzer"] = analysis
+    client = main_auto.app.test_client()
+
+    response = client.post('/auto_analyze_conversation', json={'contact_name': 'Sam', 'chat_log': 'User: lol'})
+
+    assert response.get_json() == analysis
+
+
+def test_local_actions_have_the_shape_of_model_actions():
+    actions = local_actions(['meeting', 'share'], {'meeting': 0.93, 'follow_up': 0.1, 'share': 0.6, 'plan': 0.2})
+
+    assert [set(a) for a in actions] == [{'action_type', 'title', 'description', 'priority', 'icon'}] * 2
+    assert [(a['action_type'], a['priority'], a['icon']) for a in actions] == [
+        ('book_meeting', 'high', 'calendar'), ('share_content', 'medium', 'share')]
+
+
+def test_detect_actions_falls_back_to_local_actions_without_the_model(fake_upstream):
+    fake_upstream.answers["Action Detector"] = None
+    client = main_auto.app.test_client()
+
+    response = client.post('/detect_actions', json={'contact_name': 'Sam',
+                                                    'chat_log': 'Sam: send me the pics from the trip'})
+
+    assert len(fake_upstream.sent) == 1
+    assert 'share_content' in [a['action_type'] for a in response.get_json()['actions']]
@@ -0,0 +1,169 @@
+import threading
+import time
+
+import pytest
+
+import limiter
+from limiter import AdaptiveLimiter, LimitExceeded
+
+
+def busy(lim, n):
+    for _ in range(n):
+        lim.acquire()
+
+
+def test_fast_answers_grow_the_limit_additively():
+    lim = AdaptiveLimiter('t', initial=4, max_limit=64)
+    busy(lim, 4)
+
+    for _ in range(4):
+        lim.release(latency=1.0)
+        lim.acquire()
+
+    # +1/limit per answer: about +1 after a limit's worth of calls
+    assert 4.9 < lim.limit < 5.0
+
+
+def test_idle_limit_does_not_grow():
+    lim = AdaptiveLimiter('t', initial=8)
+    lim.acquire()
+
+    lim.release(latency=1.0)
+
+    assert lim.limit == 8
+
+
+def test_errors_and_slow_answers_shrink_the_limit_multiplicatively():
+    lim = AdaptiveLimiter('t', initial=10, min_limit=1)
+    busy(lim, 3)
+
+    lim.release(latency=1.0)
+    lim.release(latency=1.0, overloaded=True)
+    assert lim.limit == pytest.approx(10 * limiter.LIMITER_BACKOFF)
+
+    lim.release(latency=1.0 * limiter.LIMITER_LATENCY_TOLERANCE * 2)
+    assert lim.limit == pytest.approx(10 * limiter.LIMITER_BACKOFF ** 2)
+    assert lim.stats()['decreases'] == 2
+
+
+def test_limit_stays_within_bounds():
+    lim = AdaptiveLimiter('t', initial=2, min_limit=1, max_limit=3)
+    for _ in range(50):
+        lim.acquire()
+        lim.release(latency=1.0, overloaded=True)
+    assert lim.limit == 1
+
+    lim = AdaptiveLimiter('t', initial=2, min_limit=1, max_limit=3)
+    busy(lim, 2)
+    for _ in range(200):
+        lim.release(latency=1.0)
+        lim.acquire()
+    assert lim.limit == 3
+
+
+def test_errors_do_not_move_the_latency_baseline():
+    lim = AdaptiveLimiter('t', initial=4)
+    busy(lim, 2)
+
+    lim.release(latency=1.0)
+    lim.release(latency=30.0, overloaded=True)
+
+    assert lim.baseline == 1.0
+
+
+def test_calls_over_the_limit_wait_and_time_out():
+    lim = AdaptiveLimiter('t', initial=1, queue_timeout=0.05)
+    lim.acquire()
+
+    with pytest.raises(LimitExceeded):
+        lim.acquire()
+    assert lim.stats()['timed_out'] == 1
+
+
+def test_released_slot_goes_to_the_waiting_call():
+    lim = AdaptiveLimiter('t', initial=1, queue_timeout=5)
+    lim.acquire()
+    acquired = threading.Event()
+    thread = threading.Thread(target=lambda: (lim.acquire(), acquired.set()))
+    thread.start()
+
+    lim.release()
+    thread.join(5)
+
+    assert acquired.is_set()
+    assert lim.stats()['in_flight'] == 1
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.001)
+
+
+def queue(lim, *priorities):
+    """Start one waiting thread per priority, in order; returns the order slots were granted in"""
+    order = []
+    threads = []
+    depth = lim.stats()['queue_depth']
+    for priority in priorities:
+        thread = threading.Thread(target=lambda p=priority: (lim.acquire(p), order.append(p)))
+        thread.start()
+        threads.append(thread)
+        wait_for(lambda: lim.stats()['queue_depth'] == depth + len(threads))
+    return order, threads
+
+
+def drain(lim, threads):
+    for thread in threads:
+        lim.release()
+        thread.join(5)
+
+
+def test_queued_calls_are_served_by_priority_class():
+    lim = AdaptiveLimiter('t', initial=1, queue_timeout=5)
+    lim.acquire()
+    order, threads = queue(lim, 'background', 'default', 'interactive')
+
+    for i in range(len(threads)):
+        lim.release()
+        wait_for(lambda: len(order) > i)
+
+    assert order == ['interactive', 'default', 'background']
+
+
+def test_waiting_ages_a_call_up_a_class(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(limiter.time, 'monotonic', lambda: clock[0])
+    lim = AdaptiveLimiter('t', initial=1, queue_timeout=5)
+    lim.acquire()
+    order, threads = queue(lim, 'background')
+
+    clock[0] += 2.5 * limiter.LIMITER_PRIORITY_AGING
+    more, others = queue(lim, 'interactive')
+
+    lim.release()
+    wait_for(lambda: order or more)
+
+    assert order == ['background'] and more == []
+    drain(lim, threads + others)
+
+
+def test_full_queue_sheds_its_least_urgent_call():
+    lim = AdaptiveLimiter('t', initial=1, max_queue=1, queue_timeout=5)
+    lim.acquire()
+    errors = []
+    shed = threading.Thread(target=lambda: errors.append(pytest.raises(LimitExceeded, lim.acquire, 'background')))
+    shed.start()
+    wait_for(lambda: lim.stats()['queue_depth'] == 1)
+
+    with pytest.raises(LimitExceeded):
+        lim.acquire('background')  # not more urgent than the queued call
+    urgent = threading.Thread(target=lim.acquire, args=('interactive',))
+    urgent.start()
+    shed.join(5)
+
+    assert len(errors) == 1
+    assert lim.stats()['displaced'] == 1
+    drain(lim, [urgent])
+    assert lim.stats()['served_by_priority']['interactive'] == 1
@@ -0,0 +1,82 @@
+import llm_cache
+from llm_cache import ResponseCache, SqliteBackend, make_key
+
+
+PAYLOAD = {'model': 'm', 'messages': [{'role': 'user', 'content': 'hi'}], 'temperature': 0.7, 'max_tokens': 10}
+
+
+class Clock:
+    def __init__(self, monkeypatch, now=1_000_000.0):
+        self.now = now
+        monkeypatch.setattr(llm_cache.time, 'time', lambda: self.now)
+
+
+def test_key_ignores_field_order_and_unrelated_fields():
+    reordered = {'max_tokens': 10, 'temperature': 0.7, 'messages': PAYLOAD['messages'], 'model': 'm', 'stream': True}
+
+    assert make_key(reordered) == make_key(PAYLOAD)
+    assert make_key({**PAYLOAD, 'temperature': 0.2}) != make_key(PAYLOAD)
+
+
+def test_entries_expire_after_their_ttl(monkeypatch):
+    clock = Clock(monkeypatch)
+    cache = ResponseCache()
+    cache.set('k', {'answer': 1}, ttl=60)
+
+    clock.now += 59
+    assert cache.get('k') == {'answer': 1}
+    clock.now += 2
+    assert cache.get('k') is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_hits_return_a_fresh_copy():
+    cache = ResponseCache()
+    cache.set('k', {'items': [1]})
+
+    cache.get('k')['items'].append(2)
+
+    assert cache.get('k') == {'items': [1]}
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+
+    cache.set('c', 3)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+
+
+def test_byte_bound_evicts_until_it_fits():
+    cache = ResponseCache(max_bytes=20)
+    cache.set('a', 'x' * 10)
+    cache.set('b', 'y' * 10)
+
+    assert cache.get('a') is None
+    assert cache.stats()['bytes'] <= 20
+
+
+def test_zero_ttl_is_not_cached():
+    cache = ResponseCache()
+    cache.set('k', 1, ttl=0)
+
+    assert cache.get('k') is None
+    assert cache.stats()['misses'] == 1
+
+
+def test_persistent_entries_survive_a_restart_until_they_expire(tmp_path, monkeypatch):
+    clock = Clock(monkeypatch)
+    path = str(tmp_path / 'cache.db')
+    ResponseCache(backend=SqliteBackend(path)).set('k', {'answer': 1}, ttl=60)
+
+    restarted = ResponseCache(backend=SqliteBackend(path))
+    assert restarted.get('k') == {'answer': 1}
+    assert restarted.stats()['persistent_hits'] == 1
+
+    clock.now += 61
+    assert ResponseCache(backend=SqliteBackend(path)).get('k') is None
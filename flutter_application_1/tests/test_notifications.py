@@ -0,0 +1,100 @@
+import threading
+import time
+
+import notifications
+from notifications import NotificationScheduler
+
+
+def contact(key, last_message_at, **fields):
+    return {'key': key, 'contact_name': key.title(), 'last_message_at': last_message_at,
+            'last_message_from': 'them', 'avg_messages_per_week': 20, **fields}
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def test_burst_is_phrased_in_parallel():
+    release = threading.Event()
+    phrasing = []
+    delivered = []
+
+    def phrase(notification, contact):
+        phrasing.append(contact['key'])
+        release.wait(5)
+        return {'notification_message': f"phrased for {contact['key']}"}
+
+    scheduler = NotificationScheduler(deliver=delivered.append, phrase=phrase, workers=3)
+    old = time.time() - 2 * 86400
+    scheduler.upsert([contact(k, old) for k in ('ana', 'ben', 'cy')])
+
+    # All three are being phrased at once, none waits for the one before it
+    wait_for(lambda: len(phrasing) == 3)
+    release.set()
+    wait_for(lambda: len(delivered) == 3)
+    assert {n['notification_message'] for n in delivered} == {f'phrased for {k}' for k in ('ana', 'ben', 'cy')}
+    assert scheduler.stats()['phrased'] == 3
+
+
+def test_notifies_once_per_last_message():
+    delivered = []
+    scheduler = NotificationScheduler(deliver=delivered.append)
+    old = time.time() - 2 * 86400
+
+    scheduler.upsert([contact('ana', old)])
+    wait_for(lambda: len(delivered) == 1)
+    assert scheduler.upsert([contact('ana', old)])['scheduled'] == 0
+
+    newer = time.time() - 86400
+    assert scheduler.upsert([contact('ana', newer)])['scheduled'] == 1
+    wait_for(lambda: len(delivered) == 2)
+
+
+def test_remove_forgets_the_notified_message():
+    delivered = []
+    scheduler = NotificationScheduler(deliver=delivered.append)
+    scheduler.upsert([contact('ana', time.time() - 2 * 86400)])
+    wait_for(lambda: len(delivered) == 1)
+
+    scheduler.remove('ana')
+
+    assert scheduler.stats()['notified'] == 0
+
+
+def test_contacts_that_stop_syncing_are_forgotten():
+    delivered = []
+    scheduler = NotificationScheduler(deliver=delivered.append)
+    scheduler.upsert([contact('ana', time.time() - 2 * 86400)])
+    wait_for(lambda: len(delivered) == 1)
+    scheduler.upsert([contact('ben', time.time())])
+    assert scheduler.stats()['notified'] == 1
+
+    with scheduler.lock:
+        scheduler._compact(time.time() + (notifications.NOTIFIED_RETENTION_DAYS + 1) * 86400)
+
+    assert scheduler.stats()['notified'] == 0
+
+
+def test_model_only_rewords_the_notification():
+    delivered = []
+
+    def phrase(notification, contact):
+        return {'notification_message': 'Sam is waiting on you', 'suggested_action': '',
+                'should_notify': False, 'priority': 'low', 'wait_hours': 999}
+
+    scheduler = NotificationScheduler(deliver=delivered.append, phrase=phrase)
+    scheduler.upsert([contact('sam', time.time() - 2 * 86400)])
+    wait_for(lambda: delivered)
+
+    (notification,) = delivered
+    assert notification['notification_message'] == 'Sam is waiting on you'
+    assert notification['suggested_action'] == 'Reply to their message'
+    assert (notification['should_notify'], notification['priority'], notification['wait_hours']) == (True, 'urgent', 0)
+
+
+def test_wording_ignores_answers_that_are_not_objects():
+    assert notifications.wording(['hi']) == {}
+    assert notifications.wording(None) == {}
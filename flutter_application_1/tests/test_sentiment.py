@@ -0,0 +1,73 @@
+import pytest
+
+import main_auto
+from sentiment import SentimentEngine, score_batch
+from transcript import Transcript
+
+
+def conversation(*texts):
+    return Transcript.from_messages([{'text': t, 'isUser': i % 2 == 0} for i, t in enumerate(texts)], 'Sam')
+
+
+@pytest.mark.parametrize('text,label', [
+    ('I love this, thank you so much!', 'positive'),
+    ('this is terrible, I hate it', 'negative'),
+    ('the meeting is at 4', 'neutral'),
+    ('not good', 'negative'),
+    ('not bad at all', 'positive'),
+])
+def test_message_labels(text, label):
+    analysis = SentimentEngine().analyze(conversation(text))
+
+    assert analysis['messages'][0]['sentiment'] == label
+
+
+def test_but_shifts_weight_to_what_follows():
+    (before,), (after,) = ([c for c, _ in score_batch([t])] for t in
+                           ('the food was great but the service was awful', 'the food was awful but the service was great'))
+
+    assert before < 0 < after
+
+
+def test_caps_and_exclamations_strengthen():
+    plain, caps, shouted, loud = (c for c, _ in score_batch(['that is good', 'that is GOOD', 'THAT IS GOOD', 'that is good!!!']))
+
+    assert plain < caps and plain < loud
+    assert shouted == plain  # caps only stand out in a message that isn't shouted throughout
+
+
+def test_answer_has_the_shape_the_app_expects():
+    analysis = SentimentEngine().analyze(conversation('hey', 'ugh, awful day', 'so happy to see you!', 'love it!'))
+
+    assert set(analysis) == {'messages', 'overall_sentiment', 'trend', 'health_score', 'insights'}
+    assert [set(m) for m in analysis['messages']] == [{'index', 'sentiment', 'score', 'reason'}] * 4
+    assert [m['index'] for m in analysis['messages']] == [0, 1, 2, 3]
+    assert all(0 <= m['score'] <= 1 for m in analysis['messages'])
+    assert analysis['overall_sentiment'] in ('positive', 'neutral', 'negative')
+    assert analysis['trend'] == 'improving'
+    assert isinstance(analysis['health_score'], int) and 0 <= analysis['health_score'] <= 100
+    assert isinstance(analysis['insights'], str) and analysis['insights']
+
+
+def test_empty_conversation():
+    assert SentimentEngine().analyze(conversation())['messages'] == []
+
+
+def test_repeated_messages_are_scored_once():
+    engine = SentimentEngine()
+    engine.score(['hi', 'great'])
+
+    engine.score(['hi', 'great', 'awful'])
+
+    assert engine.stats()['hits'] == 2 and engine.stats()['misses'] == 3
+
+
+def test_endpoint_answers_without_the_model(fake_upstream):
+    client = main_auto.app.test_client()
+
+    response = client.post('/agent/sentiment_analysis',
+                           json={'contact_name': 'Sam', 'messages': [{'text': 'love it!', 'sender': 'Sam'}]})
+
+    assert response.get_json()['success'] is True
+    assert response.get_json()['data']['messages'][0]['sentiment'] == 'positive'
+    assert fake_upstream.sent == []
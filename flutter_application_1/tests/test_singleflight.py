@@ -0,0 +1,153 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import singleflight
+from singleflight import AsyncSingleFlight, SingleFlight
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.001)
+
+
+def run_coalesced(flights, leader_fn, followers=3):
+    """Outcomes (result or exception) of a leader and followers calling one key at once"""
+    release = threading.Event()
+    outcomes = []
+    coalesced = singleflight.stats()['coalesced']
+
+    def leader():
+        release.wait(5)
+        return leader_fn()
+
+    def call(fn):
+        try:
+            outcomes.append(flights.do('key', fn))
+        except Exception as e:
+            outcomes.append(e)
+
+    threads = [threading.Thread(target=call, args=(leader,))]
+    threads[0].start()
+    wait_for(lambda: flights.in_flight() == 1)
+    for _ in range(followers):
+        threads.append(threading.Thread(target=call, args=(lambda: pytest.fail('follower ran fn'),)))
+        threads[-1].start()
+    wait_for(lambda: singleflight.stats()['coalesced'] == coalesced + followers)
+
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    return outcomes
+
+
+def test_followers_share_the_leaders_result():
+    flights = SingleFlight()
+
+    assert run_coalesced(flights, lambda: 'answer') == ['answer'] * 4
+    assert flights.in_flight() == 0
+
+
+def test_leaders_error_reaches_every_follower():
+    flights = SingleFlight()
+    error = RuntimeError('upstream down')
+
+    def fail():
+        raise error
+
+    assert run_coalesced(flights, fail) == [error] * 4
+    assert flights.in_flight() == 0
+
+
+def test_key_is_free_again_after_an_error():
+    flights = SingleFlight()
+
+    with pytest.raises(ValueError):
+        flights.do('key', lambda: int('x'))
+
+    assert flights.do('key', lambda: 'retried') == 'retried'
+
+
+def test_async_followers_share_result_and_error():
+    flights = AsyncSingleFlight()
+
+    async def coalesced(outcome):
+        release = asyncio.Event()
+
+        async def leader():
+            await release.wait()
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        async def follower():
+            pytest.fail('follower ran coro_fn')
+
+        calls = [asyncio.create_task(flights.do('key', leader))]
+        await asyncio.sleep(0)
+        calls += [asyncio.create_task(flights.do('key', follower)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(*calls, return_exceptions=True)
+
+    error = RuntimeError('upstream down')
+    assert asyncio.run(coalesced('answer')) == ['answer'] * 4
+    assert asyncio.run(coalesced(error)) == [error] * 4
+    assert flights.in_flight() == 0
+
+
+def test_cancelled_follower_leaves_the_shared_call_running():
+    flights = AsyncSingleFlight()
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def leader():
+            await release.wait()
+            return 'answer'
+
+        first = asyncio.create_task(flights.do('key', leader))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flights.do('key', leader))
+        await asyncio.sleep(0)
+        follower.cancel()
+        release.set()
+        return await first, await asyncio.gather(follower, return_exceptions=True)
+
+    result, (cancelled,) = asyncio.run(scenario())
+    assert result == 'answer'
+    assert isinstance(cancelled, asyncio.CancelledError)
+
+
+def test_cancelled_leader_hands_the_call_to_a_follower():
+    flights = AsyncSingleFlight()
+    runs = []
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def call():
+            runs.append(1)
+            await release.wait()
+            return 'answer'
+
+        leader = asyncio.create_task(flights.do('key', call))
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(flights.do('key', call)) for _ in range(3)]
+        await asyncio.sleep(0)
+        leader.cancel()
+        while len(runs) < 2:
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(leader, *followers, return_exceptions=True)
+
+    cancelled, *results = asyncio.run(scenario())
+    assert isinstance(cancelled, asyncio.CancelledError)
+    assert results == ['answer'] * 3
+    assert len(runs) == 2   # the cancelled leader's run and one follower's
+    assert flights.in_flight() == 0
@@ -0,0 +1,57 @@
+import pytest
+
+import main_auto
+
+
+CHUNKS = ['{"replies": [', '{"text": "hi"}', ']}', ' and then some more text']
+
+
+@pytest.fixture
+def fake_stream(monkeypatch):
+    calls = []
+
+    def stream_deltas(target, url, headers, payload):
+        calls.append(payload)
+        yield from CHUNKS
+
+    monkeypatch.setattr(main_auto, 'stream_deltas', stream_deltas)
+    main_auto.response_cache.clear()
+    yield calls
+    main_auto.response_cache.clear()
+
+
+def stream(stop_at_json=True):
+    return main_auto.call_ai_stream('system', 'user', agent='agent_smart_reply_stream', stop_at_json=stop_at_json)
+
+
+def in_flight():
+    return sum(limiter.in_flight for limiter in main_auto.LIMITERS.values())
+
+
+def test_answer_closed_by_its_json_is_recorded_and_cached(fake_stream):
+    before = in_flight()
+    deltas = stream()
+    read = [next(deltas) for _ in range(3)]  # the consumer stops once the JSON is closed
+    deltas.close()
+
+    assert read == CHUNKS[:3]
+    assert in_flight() == before
+    assert list(stream()) == ['{"replies": [{"text": "hi"}]}']
+    assert len(fake_stream) == 1
+
+
+def test_abandoned_answer_is_not_cached(fake_stream):
+    before = in_flight()
+    deltas = stream()
+    next(deltas)
+    deltas.close()
+
+    assert in_flight() == before
+    list(stream())
+    assert len(fake_stream) == 2
+
+
+def test_full_stream_is_cached_whole(fake_stream):
+    assert ''.join(stream(stop_at_json=False)) == ''.join(CHUNKS)
+    assert list(stream(stop_at_json=False)) == [''.join(CHUNKS)]
+    assert len(fake_stream) == 1
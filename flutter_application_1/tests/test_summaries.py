@@ -0,0 +1,68 @@
+import summaries
+from summaries import RollingSummaries
+
+
+def folded(monkeypatch, tail=2, block=2, fanout=10):
+    monkeypatch.setattr(summaries, 'SUMMARY_TAIL', tail)
+    monkeypatch.setattr(summaries, 'SUMMARY_BLOCK', block)
+    monkeypatch.setattr(summaries, 'SUMMARY_FANOUT', fanout)
+    calls = []
+
+    def summarize(lines, merge):
+        calls.append(list(lines))
+        return 'summary of ' + ' / '.join(lines)
+
+    return RollingSummaries(summarize, workers=1), calls
+
+
+def settle(rolling):
+    # One worker: a no-op queued behind the fold finishes after it
+    rolling.pool.submit(lambda: None).result()
+
+
+def test_folds_older_messages_once(monkeypatch):
+    rolling, calls = folded(monkeypatch)
+    lines = [f"User: m{i}" for i in range(6)]
+
+    assert rolling.context('c1', lines) == ('', lines)
+    settle(rolling)
+    summary, unfolded = rolling.context('c1', lines)
+
+    assert calls == [['User: m0', 'User: m1'], ['User: m2', 'User: m3']]
+    assert summary == 'summary of User: m0 / User: m1\nsummary of User: m2 / User: m3'
+    assert unfolded == lines[4:]
+
+
+def test_edited_history_resets_the_same_chain(monkeypatch):
+    rolling, _ = folded(monkeypatch)
+    lines = [f"User: m{i}" for i in range(6)]
+    rolling.context('c1', lines)
+    settle(rolling)
+
+    edited = lines[:3] + ['User: edited'] + lines[4:]
+    summary, unfolded = rolling.context('c1', edited)
+
+    assert (summary, unfolded) == ('', edited)
+    assert rolling.stats()['chains'] == 1
+    assert rolling.stats()['resets'] == 1
+
+
+def test_idle_chains_are_evicted(monkeypatch):
+    rolling, _ = folded(monkeypatch)
+    monkeypatch.setattr(summaries, 'SUMMARY_IDLE_HOURS', 1)
+    rolling.context('old', ['User: hi'])
+    rolling.chains['old'].used_at -= 2 * 3600
+
+    rolling.context('new', ['User: hi'])
+
+    assert list(rolling.chains) == ['new']
+    assert rolling.stats()['evictions'] == 1
+
+
+def test_chain_count_is_capped(monkeypatch):
+    rolling, _ = folded(monkeypatch)
+    monkeypatch.setattr(summaries, 'SUMMARY_MAX_CHAINS', 2)
+    for key in ('a', 'b', 'a', 'c'):
+        rolling.context(key, ['User: hi'])
+
+    assert list(rolling.chains) == ['a', 'c']
@@ -0,0 +1,86 @@
+import asyncio
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+import upstream
+from upstream import DNSCache
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = self.headers['Host'].encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = HTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://localhost:{httpd.server_port}"
+    httpd.shutdown()
+
+
+@pytest.fixture
+def lookups(monkeypatch):
+    calls = []
+    resolve = socket.getaddrinfo
+
+    def counting(host, *args, **kwargs):
+        if host == 'localhost':  # connecting to the cached address looks up the literal too
+            calls.append(host)
+        return resolve(host, *args, **kwargs)
+
+    monkeypatch.setattr(upstream.socket, 'getaddrinfo', counting)
+    monkeypatch.setattr(upstream, 'dns_cache', DNSCache(ttl=60))
+    return calls
+
+
+def test_import_leaves_getaddrinfo_alone():
+    assert socket.getaddrinfo.__module__ == 'socket'
+
+
+def test_expired_entries_are_dropped_on_lookup(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(upstream.time, 'monotonic', lambda: clock[0])
+    cache = DNSCache(ttl=10)
+
+    assert cache.resolve('localhost', 80) in ('127.0.0.1', '::1')
+    clock[0] += 11
+
+    assert cache.lookup('localhost', 80) is None
+    assert len(cache) == 0
+
+
+def test_session_connections_resolve_through_the_cache(server, lookups):
+    session = upstream.requests.Session()
+    session.mount('http://', upstream.CachedDNSAdapter())
+    session.headers['Connection'] = 'close'  # a new connection, so a new resolution, per request
+
+    for _ in range(3):
+        response = session.get(server + '/', timeout=5)
+        assert response.text == server.removeprefix('http://')
+
+    assert lookups == ['localhost']
+    session.close()
+
+
+def test_async_client_resolves_through_the_cache(server, lookups):
+    async def fetch():
+        client = upstream.get_async_client()
+        try:
+            texts = [(await client.get(server + '/', headers={'Connection': 'close'})).text for _ in range(3)]
+        finally:
+            await upstream.async_close_all()
+        return texts
+
+    assert asyncio.run(fetch()) == [server.removeprefix('http://')] * 3
+    assert lookups == ['localhost']
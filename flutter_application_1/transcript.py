@@ -0,0 +1,170 @@
+"""
+Atlas Transcript
+One compact, parsed-once view of a conversation, shared by every agent a
+request reaches (including all agents of /agent/conversation_open):
+
+- columns instead of per-message dicts: texts, a sender-flag bytearray and
+  an array of epoch timestamps (NaN = none / unparseable), each ISO
+  timestamp parsed exactly once
+- transcript lines rendered on first use and then reused, in the formats
+  the agents send to the model
+- the columns are laid out so NumPy can read them without copying
+  (conversation_stats.py); recency / frequency / reply features are
+  kept in features.py
+
+Built from any accepted input shape: messages / recent_messages
+([{text, isUser | sender, timestamp}]) or a chat_log / conversation_history
+text ("Name: message" per line, kept verbatim).
+"""
+
+from array import array
+from datetime import datetime
+
+
+NAN = float('nan')
+
+# Request key the parsed transcript is memoized under
+TRANSCRIPT_KEY = '_transcript'
+
+USER_SENDERS = ('me', 'user', 'User', 'You')
+
+# Where a request's conversation is looked for, in order
+SOURCE_FIELDS = ('messages', 'recent_messages', 'conversation_history', 'chat_log')
+
+
+def parse_epoch(value):
+    """ISO-8601 (with or without Z) or epoch seconds / ms -> epoch seconds, NaN if unparseable"""
+    if value is None or value == '':
+        return NAN
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value / 1000 if value > 1e11 else float(value)
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return NAN
+
+
+class Transcript:
+    """Columnar conversation, oldest message first"""
+
+    __slots__ = ('contact_name', 'texts', 'is_user', 'times', 'raw_times', 'senders',
+                 '_lines', '_text', '_timed_lines', '_numbered_lines')
+
+    def __init__(self, contact_name='Contact'):
+        self.contact_name = contact_name
+        self.texts = []
+        self.is_user = bytearray()
+        self.times = array('d')
+        self.raw_times = []   # as sent, for the "(at ...)" rendering
+        self.senders = []     # sender label as sent, None if absent
+        self._lines = None
+        self._text = None
+        self._timed_lines = None
+        self._numbered_lines = None
+
+    @classmethod
+    def from_messages(cls, messages, contact_name='Contact'):
+        transcript = cls(contact_name)
+        texts, flags, times, raw_times, senders = (
+            transcript.texts, transcript.is_user, transcript.times, transcript.raw_times, transcript.senders
+        )
+        for msg in messages:
+            sender = msg.get('sender')
+            is_user = msg.get('isUser')
+            if is_user is None:
+                is_user = sender in USER_SENDERS
+            timestamp = msg.get('timestamp')
+            texts.append(msg.get('text', ''))
+            flags.append(1 if is_user else 0)
+            times.append(parse_epoch(timestamp))
+            raw_times.append(timestamp)
+            senders.append(sender)
+        return transcript
+
+    @classmethod
+    def from_log(cls, log, contact_name='Contact'):
+        """A "Name: message" text log; lines are kept verbatim, there are no timestamps"""
+        transcript = cls(contact_name)
+        lines = [line for line in log.split('\n') if line.strip()]
+        for line in lines:
+            sender, sep, text = line.partition(': ')
+            if not sep:
+                sender, text = None, line
+            transcript.texts.append(text)
+            transcript.is_user.append(1 if sender in USER_SENDERS else 0)
+            transcript.times.append(NAN)
+            transcript.raw_times.append(None)
+            transcript.senders.append(sender)
+        transcript._lines = lines
+        return transcript
+
+    def __len__(self):
+        return len(self.texts)
+
+    # ------------------------------------------------------------------
+    # Rendered lines (built on first use)
+    # ------------------------------------------------------------------
+
+    @property
+    def lines(self):
+        """"User: text" / "<contact>: text" """
+        if self._lines is None:
+            contact = self.contact_name
+            self._lines = [
+                f"{'User' if user else contact}: {text}" for user, text in zip(self.is_user, self.texts)
+            ]
+        return self._lines
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = '\n'.join(self.lines)
+        return self._text
+
+    @property
+    def timed_lines(self):
+        """lines with " (at <timestamp>)" """
+        if self._timed_lines is None:
+            self._timed_lines = [
+                f"{line} (at {raw if raw is not None else 'unknown'})"
+                for line, raw in zip(self.lines, self.raw_times)
+            ]
+        return self._timed_lines
+
+    @property
+    def numbered_lines(self):
+        """"<index>. [<sender>] text", indices into the original messages"""
+        if self._numbered_lines is None:
+            contact = self.contact_name
+            self._numbered_lines = [
+                f"{i}. [{sender or ('User' if user else contact)}] {text}"
+                for i, (sender, user, text) in enumerate(zip(self.senders, self.is_user, self.texts))
+            ]
+        return self._numbered_lines
+
+
+def for_request(data):
+    """
+    The request's transcript, parsed on first use and memoized in the
+    request, so every agent of a batch shares one
+    """
+    transcript = data.get(TRANSCRIPT_KEY)
+    if isinstance(transcript, Transcript):
+        return transcript
+
+    contact_name = data.get('contact_name') or 'Contact'
+    source = next((data[field] for field in SOURCE_FIELDS if data.get(field)), None)
+    if isinstance(source, str):
+        transcript = Transcript.from_log(source, contact_name)
+    else:
+        transcript = Transcript.from_messages(source or [], contact_name)
+    data[TRANSCRIPT_KEY] = transcript
+    return transcript
+
+
+def history_lines(data, field):
+    """An agent's history: the text log it was sent in field, else the request's transcript lines"""
+    log = data.get(field)
+    if isinstance(log, str) and log:
+        return log
+    return for_request(data).lines
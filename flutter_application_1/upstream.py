@@ -0,0 +1,381 @@
+"""
+Atlas Upstream Transport
+Shared, pooled HTTP transport for every outbound model / voice call
+(NVIDIA API, Brev NIMs, ElevenLabs)
+
+Instead of a bare requests.post per call (fresh TCP + TLS handshake every
+time), all agents go through post() which keeps one connection pool per
+host alive between calls.
+"""
+
+import asyncio
+import os
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NameResolutionError
+
+try:
+    import httpx
+    import httpcore
+except ImportError:
+    httpx = None
+
+try:
+    import h2  # noqa: F401 - only needed so httpx can negotiate HTTP/2
+    HTTP2_AVAILABLE = httpx is not None
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+# Number of hosts to keep pools for, and keep-alive connections per host.
+# Ten agents fire at once when a conversation opens, so keep at least that many.
+POOL_CONNECTIONS = int(os.environ.get('UPSTREAM_POOL_CONNECTIONS', 10))
+POOL_MAXSIZE = int(os.environ.get('UPSTREAM_POOL_MAXSIZE', 32))
+
+# Use HTTP/2 for https hosts when httpx + h2 are installed ('0' to disable)
+USE_HTTP2 = os.environ.get('UPSTREAM_HTTP2', '1') != '0' and HTTP2_AVAILABLE
+
+# Max concurrent connections for the async client (ASGI gateway mode)
+ASYNC_MAX_CONNECTIONS = int(os.environ.get('UPSTREAM_ASYNC_MAX_CONNECTIONS', 1000))
+
+# Seconds to cache DNS answers for upstream hosts ('0' to disable)
+DNS_TTL = float(os.environ.get('UPSTREAM_DNS_TTL', 300))
+
+
+# ============================================================================
+# DNS CACHE
+# ============================================================================
+
+class DNSCache:
+    """
+    TTL cache of upstream host addresses. Only the transports below consult
+    it; socket.getaddrinfo stays untouched for the rest of the process.
+    """
+
+    def __init__(self, ttl=DNS_TTL):
+        self.ttl = ttl
+        self.entries = {}         # (host, port) -> (expires, address)
+        self.lock = threading.Lock()
+
+    def lookup(self, host, port):
+        """Cached address of host, None if missing or expired (expired entries are dropped)"""
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get((host, port))
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self.entries[(host, port)]
+                return None
+            return entry[1]
+
+    def resolve(self, host, port):
+        """Address to connect to for host: cached, else resolved and cached for ttl seconds"""
+        address = self.lookup(host, port)
+        if address is not None:
+            return address
+
+        address = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0][4][0]
+        now = time.monotonic()
+        with self.lock:
+            self.entries = {key: entry for key, entry in self.entries.items() if entry[0] > now}
+            self.entries[(host, port)] = (now + self.ttl, address)
+        return address
+
+    def forget(self, host, port):
+        """Drop host after a failed connect, so the next one resolves again"""
+        with self.lock:
+            self.entries.pop((host, port), None)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+
+dns_cache = DNSCache()
+
+
+class _CachedDNSConnection:
+    """urllib3 connection mixin: connect to the cached address, keep the hostname for Host and SNI"""
+
+    def _new_conn(self):
+        host = self._dns_host
+        try:
+            self._dns_host = dns_cache.resolve(host, self.port)
+        except socket.gaierror as e:
+            raise NameResolutionError(self.host, self, e) from e
+        try:
+            return super()._new_conn()
+        except Exception:
+            dns_cache.forget(host, self.port)
+            raise
+        finally:
+            self._dns_host = host
+
+
+class _HTTPConnection(_CachedDNSConnection, HTTPConnection):
+    pass
+
+
+class _HTTPSConnection(_CachedDNSConnection, HTTPSConnection):
+    pass
+
+
+class _HTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _HTTPConnection
+
+
+class _HTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _HTTPSConnection
+
+
+class CachedDNSAdapter(HTTPAdapter):
+    """requests adapter whose connections resolve through dns_cache"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _HTTPConnectionPool, 'https': _HTTPSConnectionPool}
+
+
+if httpx is not None:
+    class _CachedDNSBackend(httpcore.NetworkBackend):
+        """httpcore network backend (httpx clients) resolving through dns_cache"""
+
+        def __init__(self, backend):
+            self.backend = backend
+
+        def connect_tcp(self, host, port, *args, **kwargs):
+            try:
+                address = dns_cache.resolve(host, port)
+            except socket.gaierror as e:
+                raise httpcore.ConnectError(str(e)) from e
+            try:
+                return self.backend.connect_tcp(address, port, *args, **kwargs)
+            except httpcore.ConnectError:
+                dns_cache.forget(host, port)
+                raise
+
+        def connect_unix_socket(self, *args, **kwargs):
+            return self.backend.connect_unix_socket(*args, **kwargs)
+
+        def sleep(self, seconds):
+            return self.backend.sleep(seconds)
+
+    class _AsyncCachedDNSBackend(httpcore.AsyncNetworkBackend):
+        """Async twin of _CachedDNSBackend; a cache miss resolves off the event loop"""
+
+        def __init__(self, backend):
+            self.backend = backend
+
+        async def connect_tcp(self, host, port, *args, **kwargs):
+            try:
+                address = dns_cache.lookup(host, port) or await asyncio.to_thread(dns_cache.resolve, host, port)
+            except socket.gaierror as e:
+                raise httpcore.ConnectError(str(e)) from e
+            try:
+                return await self.backend.connect_tcp(address, port, *args, **kwargs)
+            except httpcore.ConnectError:
+                dns_cache.forget(host, port)
+                raise
+
+        async def connect_unix_socket(self, *args, **kwargs):
+            return await self.backend.connect_unix_socket(*args, **kwargs)
+
+        async def sleep(self, seconds):
+            await self.backend.sleep(seconds)
+
+
+def _transport(transport_class, backend_class, **kwargs):
+    """httpx transport whose pool resolves through dns_cache (DNS_TTL > 0)"""
+    transport = transport_class(**kwargs)
+    if DNS_TTL > 0:
+        # httpx takes no network backend argument; its pool holds the one it uses
+        transport._pool._network_backend = backend_class(transport._pool._network_backend)
+    return transport
+
+
+# ============================================================================
+# CONNECTION POOLS
+# ============================================================================
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _origin(url):
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def get_session(url):
+    """
+    Return the pooled client for the host of url (created on first use)
+    HTTP/2 client for https hosts when available, keep-alive requests.Session otherwise
+    """
+    origin = _origin(url)
+
+    with _sessions_lock:
+        session = _sessions.get(origin)
+        if session is not None:
+            return session
+
+        if USE_HTTP2 and origin.startswith('https://'):
+            session = httpx.Client(transport=_transport(
+                httpx.HTTPTransport, _CachedDNSBackend,
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=POOL_MAXSIZE,
+                    max_keepalive_connections=POOL_MAXSIZE
+                )
+            ))
+            print(f"[UPSTREAM] New HTTP/2 pool for {origin}")
+        else:
+            session = requests.Session()
+            adapter = (CachedDNSAdapter if DNS_TTL > 0 else HTTPAdapter)(
+                pool_connections=POOL_CONNECTIONS,
+                pool_maxsize=POOL_MAXSIZE,
+                pool_block=False
+            )
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            print(f"[UPSTREAM] New keep-alive pool for {origin} (maxsize={POOL_MAXSIZE})")
+
+        _sessions[origin] = session
+        return session
+
+
+def post(url, json=None, headers=None, timeout=30):
+    """
+    Drop-in replacement for requests.post(url, json=..., headers=..., timeout=...)
+    Reuses a warm connection to the host instead of handshaking again
+    """
+    return get_session(url).post(url, json=json, headers=headers, timeout=timeout)
+
+
+def get(url, headers=None, timeout=30):
+    """Pooled GET (health checks, model listings)"""
+    return get_session(url).get(url, headers=headers, timeout=timeout)
+
+
+class StatusError(Exception):
+    """Non-200 answer to a streaming request"""
+
+    def __init__(self, status_code, text=''):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.text = text
+
+
+def stream_lines(url, json=None, headers=None, timeout=30):
+    """
+    Pooled streaming POST: yields the response body line by line as it arrives
+    (Server-Sent Events from an OpenAI-compatible stream: true request).
+    Closing the generator early closes the connection, which stops generation.
+    Raises StatusError for a non-200 answer.
+    """
+    session = get_session(url)
+
+    if httpx is not None and isinstance(session, httpx.Client):
+        with session.stream('POST', url, json=json, headers=headers, timeout=timeout) as response:
+            if response.status_code != 200:
+                raise StatusError(response.status_code, response.read().decode(errors='replace'))
+            yield from response.iter_lines()
+        return
+
+    with session.post(url, json=json, headers=headers, timeout=timeout, stream=True) as response:
+        if response.status_code != 200:
+            raise StatusError(response.status_code, response.text)
+        response.encoding = response.encoding or 'utf-8'
+        yield from response.iter_lines(decode_unicode=True)
+
+
+def close_all():
+    """Close every pooled connection (used on shutdown)"""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+# ============================================================================
+# ASYNC CLIENT (ASGI GATEWAY MODE)
+# ============================================================================
+
+_async_clients = {}
+
+
+def get_async_client():
+    """
+    Shared httpx.AsyncClient for the running event loop
+    One client holds a keep-alive pool per host, like the sync sessions
+    """
+    if httpx is None:
+        raise RuntimeError("Async mode needs httpx: pip install 'httpx[http2]'")
+
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(transport=_transport(
+            httpx.AsyncHTTPTransport, _AsyncCachedDNSBackend,
+            http2=USE_HTTP2,
+            limits=httpx.Limits(
+                max_connections=ASYNC_MAX_CONNECTIONS,
+                max_keepalive_connections=POOL_MAXSIZE * POOL_CONNECTIONS
+            )
+        ))
+        _async_clients[loop] = client
+        print(f"[UPSTREAM] New async client (http2={USE_HTTP2}, max_connections={ASYNC_MAX_CONNECTIONS})")
+    return client
+
+
+async def async_post(url, json=None, headers=None, timeout=30):
+    """Awaitable post(): the waiting costs a coroutine, not a thread"""
+    client = get_async_client()
+    return await client.post(url, json=json, headers=headers, timeout=timeout)
+
+
+async def async_get(url, headers=None, timeout=30):
+    """Awaitable get()"""
+    client = get_async_client()
+    return await client.get(url, headers=headers, timeout=timeout)
+
+
+async def async_stream_lines(url, json=None, headers=None, timeout=30):
+    """Awaitable stream_lines()"""
+    client = get_async_client()
+    async with client.stream('POST', url, json=json, headers=headers, timeout=timeout) as response:
+        if response.status_code != 200:
+            raise StatusError(response.status_code, (await response.aread()).decode(errors='replace'))
+        async for line in response.aiter_lines():
+            yield line
+
+
+async def async_close_all():
+    """Close the async client of the running loop (ASGI lifespan shutdown)"""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def pool_stats():
+    """Snapshot of open pools for the /health style endpoints"""
+    with _sessions_lock:
+        return {
+            'hosts': sorted(_sessions.keys()),
+            'pool_maxsize': POOL_MAXSIZE,
+            'http2': USE_HTTP2,
+            'async_clients': len(_async_clients),
+            'dns_ttl_seconds': DNS_TTL,
+            'dns_cached_hosts': len(dns_cache)
+        }